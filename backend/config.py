@@ -1,7 +1,9 @@
 import os
 
 # ── Data files ────────────────────────────────────────────
-INDEX_FILE    = "backend/data/ace_index.pkl"
+INDEX_FILE    = "backend/data/ace_index.pkl"          # legacy pickle — read-only fallback
+INDEX_EMBEDDINGS_FILE = "backend/data/ace_index.npy"  # float32 rows, memory-mapped
+INDEX_META_FILE       = "backend/data/ace_index.meta.json"
 UPLOAD_DIR    = "backend/uploads"
 
 # ── PDF chunking ──────────────────────────────────────────
@@ -26,6 +28,83 @@ DS_BULLETIN_NAME        = "DTSCE University Bulletin"
 OPENAI_CHAT_MODEL      = "gpt-4o-mini"
 OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
 
+# ── Async LLM client (one pooled connection set per worker) ──
+# Sized for hundreds of concurrent chat streams; each stream holds one
+# connection for its 5–20 s lifetime.
+LLM_MAX_CONNECTIONS     = 500
+LLM_MAX_KEEPALIVE       = 100   # idle connections kept warm for the next call
+LLM_KEEPALIVE_EXPIRY    = 30.0  # seconds an idle connection is kept
+LLM_CONNECT_TIMEOUT     = 5.0
+LLM_READ_TIMEOUT        = 120.0 # longest gap between streamed chunks
+
+# ── Embedding backend ─────────────────────────────────────
+# "openai" embeds with OPENAI_EMBEDDING_MODEL over the network. "local" runs
+# LOCAL_EMBEDDING_MODEL on this machine's CPU via sentence-transformers (not in
+# requirements.txt — `pip install sentence-transformers` where you enable it).
+# The index must be built with the same backend it is queried with.
+EMBEDDING_BACKEND     = os.getenv("EMBEDDING_BACKEND", "openai")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+# ── Batch embedding (index builds) ────────────────────────
+EMBEDDING_BATCH_SIZE      = 64  # inputs per request; a 500-word chunk is ~700 tokens
+EMBEDDING_MAX_CONCURRENCY = 4   # requests in flight at once
+EMBEDDING_MAX_RETRIES     = 5   # per request, on rate limits / transient errors
+
+# ── Handbook retrieval ────────────────────────────────────
+# "dense": cosine + flat keyword/course-code boosts (the original scorer).
+# "hybrid": cosine fused with BM25 over the same chunks; check it against
+# `python -m backend.eval.run` before switching.
+RETRIEVAL_MODE  = os.getenv("RETRIEVAL_MODE", "dense")
+HYBRID_FUSION       = os.getenv("HYBRID_FUSION", "rrf")      # "rrf" or "weighted"
+HYBRID_DENSE_WEIGHT = 1.0
+HYBRID_BM25_WEIGHT  = 1.0
+HYBRID_RRF_K        = 60    # the usual reciprocal-rank-fusion constant
+BM25_K1 = 1.5
+BM25_B  = 0.75
+# Approximate nearest-neighbour tier — "off" (exact brute force) or "ivf". Only
+# scope partitions of at least ANN_MIN_RECORDS rows use it; below that brute
+# force is both exact and faster.
+RETRIEVAL_ANN    = os.getenv("RETRIEVAL_ANN", "off")
+ANN_MIN_RECORDS  = 5000
+ANN_N_PROBE      = 8     # clusters scored per query, of ~√n
+ANN_LEXICAL_TOP  = 32    # best lexical rows scored beside the probed clusters
+ANN_KMEANS_ITERS = 10
+
+# ── Query-embedding cache ─────────────────────────────────
+# "memory" is per worker; "sqlite" shares one file across every worker on the host.
+QUERY_EMBED_CACHE_BACKEND = os.getenv("QUERY_EMBED_CACHE_BACKEND", "memory")
+QUERY_EMBED_CACHE_PATH    = os.getenv("QUERY_EMBED_CACHE_PATH", "backend/data/query_embed_cache.sqlite3")
+QUERY_EMBED_CACHE_SIZE    = 2048          # entries; a 1536-dim vector is ~6 KB as float32
+QUERY_EMBED_CACHE_TTL     = 7 * 24 * 3600  # seconds; 0 = never expire
+
+# ── Answer cache ──────────────────────────────────────────
+# Finished answers to questions nothing personal shaped — same routing, same
+# grounding, same data — replayed without a model call. "memory" is per worker,
+# "sqlite" shares one file across workers, "off" disables it.
+ANSWER_CACHE_BACKEND    = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_PATH       = os.getenv("ANSWER_CACHE_PATH", "backend/data/answer_cache.sqlite3")
+ANSWER_CACHE_SIZE       = 1024         # answers kept
+ANSWER_CACHE_TTL        = 6 * 3600     # seconds; dated answers also expire at midnight
+ANSWER_CACHE_SIMILARITY = 0.95         # cosine for "the same question in other words"
+
+# ── Prompt budget ─────────────────────────────────────────
+# Tokens for one chat call's input: system prompt, history and question. The
+# grounding sections are trimmed, lowest priority first, to stay inside it.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+
+# ── Post-answer work ──────────────────────────────────────
+# Transcript writes and profile learning run after the done frame, on a small
+# pool of worker threads. A full queue runs the task inline rather than drop it.
+POST_ANSWER_WORKERS       = int(os.getenv("POST_ANSWER_WORKERS", "2"))
+POST_ANSWER_QUEUE_SIZE    = 512
+POST_ANSWER_FLUSH_TIMEOUT = 10.0   # seconds shutdown waits for queued work
+
+# ── Per-program artifacts ─────────────────────────────────
+# Prerequisite maps, suggested plans and chat snippets are built on first use
+# and cached per catalog. "1" builds every program's at boot, off the request
+# path, so no first visitor waits on one.
+PROGRAM_ARTIFACT_WARMUP = os.getenv("PROGRAM_ARTIFACT_WARMUP", "0") == "1"
+
 # ── Upload retention ──────────────────────────────────────
 MAX_UPLOAD_FILES = 20   # keep only the N most-recently-modified files
 
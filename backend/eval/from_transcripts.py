@@ -50,7 +50,8 @@ def harvest(db, days=7, limit=25):
         db.query(Message, User.selected_major)
         .join(Conversation, Message.conversation_id == Conversation.id)
         .join(User, Conversation.user_id == User.id)
-        .filter(Message.role == "assistant", Message.created_at >= since)
+        # Rows reserved for an answer still streaming, or abandoned, are empty.
+        .filter(Message.role == "assistant", Message.created_at >= since, Message.content != "")
         .filter(
             (Message.rating == -1)
             | (Message.sources_json == "[]")
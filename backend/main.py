@@ -1,7 +1,9 @@
+import asyncio
 import logging
 import os
 import re
 import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -12,7 +14,7 @@ from pydantic import BaseModel, Field
 from typing import List, Optional
 from sqlalchemy.orm import Session
 
-from backend.config import UPLOAD_DIR, LOG_LEVEL
+from backend.config import UPLOAD_DIR, LOG_LEVEL, PROGRAM_ARTIFACT_WARMUP
 from backend.database import engine, Base, get_db
 from backend import models  # noqa: F401 — registers models with Base
 from backend.clerk_auth import (
@@ -21,7 +23,9 @@ from backend.clerk_auth import (
     get_current_user_any,
     fetch_user_details,
 )
-from backend.services.chat_service import ask_advisor_stream
+from backend.services import llm
+from backend.services.chat_service import aask_advisor_stream
+from backend.services.work_queue import get_work_queue
 from backend.services.transcript_service import set_rating, review_summary
 from backend.services.profile_service import (
     get_profile as read_student_profile,
@@ -42,7 +46,9 @@ from backend.services.program_service import (
     build_gen_ed_response,
     build_prereq_map,
     build_suggested_plan,
+    program_artifact_stats,
     search_programs,
+    warm_program_artifacts,
 )
 from backend.services.calendar_scraper import (
     load_calendar,
@@ -57,7 +63,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def _lifespan(app):
+    warmup = None
+    if PROGRAM_ARTIFACT_WARMUP:
+        # Every program's map, plan and snippets, so no first visitor pays for one.
+        warmup = asyncio.create_task(asyncio.to_thread(_warm_program_artifacts))
+    yield
+    if warmup:
+        warmup.cancel()
+    # Transcript writes and profile learning queued behind answers already sent.
+    await asyncio.to_thread(get_work_queue().shutdown)
+    # The pooled async LLM client holds open keep-alive connections.
+    await llm.aclose()
+
+
+def _warm_program_artifacts():
+    try:
+        warm_program_artifacts()
+    except Exception as e:  # noqa: BLE001
+        logger.warning("warm_program_artifacts | failed: %s", e, exc_info=True)
+
+
+app = FastAPI(lifespan=_lifespan)
 
 def _migrate():
     """Bring the database to head.
@@ -202,7 +231,7 @@ def course_detail(code: str):
     course = get_course(code)
     if not course:
         raise HTTPException(status_code=404, detail=f"Course '{code}' not found")
-    return course
+    return dict(course)
 
 
 @app.get("/calendar")
@@ -264,8 +293,7 @@ def gen_ed(
     resolved_major = major
     if not resolved_major and current_user:
         resolved_major = get_user_major(current_user["uid"], db=db)
-    data = build_gen_ed_response(resolved_major)
-    return data
+    return build_gen_ed_response(resolved_major)
 
 
 # ── Prerequisite map (major-aware) ────────────────────────────────────────────
@@ -284,8 +312,7 @@ def prereq_map(
     data = build_prereq_map(resolved_major)
     if data is None:
         return {"program_name": resolved_major, "courses": [], "found": False}
-    data["found"] = True
-    return data
+    return {**data, "found": True}  # data is shared with the cache — never mutate it
 
 
 @app.get("/prereq-graph/{code:path}")
@@ -329,8 +356,7 @@ def suggested_plan(
     data = build_suggested_plan(resolved_major)
     if data is None:
         return {"program_name": resolved_major, "plans": [], "found": False}
-    data["found"] = True
-    return data
+    return {**data, "found": True}  # data is shared with the cache — never mutate it
 
 
 # ── User profile (settings page; user-initiated, NOT called on login) ────────
@@ -595,11 +621,32 @@ def admin_costs(
     x_admin_key: str | None = Header(default=None),
     db: Session = Depends(get_db),
 ):
-    """Live OpenAI spend: totals (all-time / 30d / 24h), per feature+model,
-    avg cost per chat, and a projected monthly figure."""
+    """Live OpenAI spend: totals (all-time / 30d / 24h) with the share of input
+    tokens served from the prompt cache, per feature+model, avg cost per chat,
+    and a projected monthly figure. Also this worker's
+    query-embedding and answer cache hit rates — every hit is a call not billed
+    (answer_cache is null when ANSWER_CACHE_BACKEND=off)."""
     _require_admin(key, x_admin_key)
     from backend.services.cost_service import summarize
-    return summarize(db)
+    from backend.services.embedding_cache import get_query_cache
+    from backend.services.answer_cache import get_answer_cache
+    answers = get_answer_cache()
+    return {
+        **summarize(db),
+        "query_embedding_cache": get_query_cache().stats(),
+        "answer_cache": answers.stats() if answers else None,
+    }
+
+
+@app.get("/admin/program-cache")
+def admin_program_cache(
+    key: str = Query(default=None),
+    x_admin_key: str | None = Header(default=None),
+):
+    """This worker's per-program artifact cache: the catalog version it was
+    built from, entries held, and hits and misses per artifact."""
+    _require_admin(key, x_admin_key)
+    return program_artifact_stats()
 
 
 @app.get("/admin/costs/estimate")
@@ -670,7 +717,7 @@ async def chat_stream(
     logger.info("chat/stream | question=%r | history_turns=%d | user_id=%r", req.question[:80], len(req.history), user_id)
     history = [{"role": m.role, "content": m.content} for m in req.history]
     return StreamingResponse(
-        ask_advisor_stream(
+        aask_advisor_stream(
             req.question,
             history=history,
             user_id=user_id,
@@ -0,0 +1,39 @@
+"""Persisted derived audit on user_docs.
+
+Guarded like the revisions before it. Both columns are nullable and start
+empty; reads fall back to deriving the audit from the text until the backfill
+(student_doc_service.backfill_derived_audits) has filled a row in.
+
+Revision ID: 0004_derived_audit
+Revises: 0003_waitlist_invite_codes
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0004_derived_audit"
+down_revision: Union[str, None] = "0003_waitlist_invite_codes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    if table not in insp.get_table_names():
+        return False
+    return column in {c["name"] for c in insp.get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column("user_docs", "derived_audit_json"):
+        op.add_column("user_docs", sa.Column("derived_audit_json", sa.Text(), nullable=True))
+    if not _has_column("user_docs", "derived_audit_version"):
+        op.add_column("user_docs", sa.Column("derived_audit_version", sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    if _has_column("user_docs", "derived_audit_version"):
+        op.drop_column("user_docs", "derived_audit_version")
+    if _has_column("user_docs", "derived_audit_json"):
+        op.drop_column("user_docs", "derived_audit_json")
@@ -0,0 +1,34 @@
+"""Per-section prompt token breakdown on api_usage.
+
+Guarded like the revisions before it. Nullable: only chat calls carry one, and
+rows written before this revision simply have none.
+
+Revision ID: 0005_prompt_breakdown
+Revises: 0004_derived_audit
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0005_prompt_breakdown"
+down_revision: Union[str, None] = "0004_derived_audit"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_column(table: str, column: str) -> bool:
+    insp = sa.inspect(op.get_bind())
+    if table not in insp.get_table_names():
+        return False
+    return column in {c["name"] for c in insp.get_columns(table)}
+
+
+def upgrade() -> None:
+    if not _has_column("api_usage", "prompt_breakdown_json"):
+        op.add_column("api_usage", sa.Column("prompt_breakdown_json", sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    if _has_column("api_usage", "prompt_breakdown_json"):
+        op.drop_column("api_usage", "prompt_breakdown_json")
@@ -34,6 +34,11 @@ class UserDocument(Base):
     text = Column(Text, nullable=True)
     analysis_json = Column(Text, nullable=True)
     audit_parse_json = Column(Text, nullable=True)
+    # audit_parse_json with merge_satisfied_requirements applied, as of parser
+    # version derived_audit_version. Reads use it as-is when the version is
+    # current instead of re-scanning the whole document text every time.
+    derived_audit_json = Column(Text, nullable=True)
+    derived_audit_version = Column(Integer, nullable=True)
     uploaded_at = Column(DateTime, default=lambda: datetime.now(timezone.utc))
 
     user = relationship("User", back_populates="documents")
@@ -126,6 +131,9 @@ class ApiUsage(Base):
     cached_tokens = Column(Integer, default=0)
     cost_usd = Column(Float, default=0.0)
     user_id = Column(String(256), nullable=True)
+    # Chat calls only: tokens per system-prompt section after budgeting, as
+    # JSON — {"budget", "fixed", "sections": {name: {"tokens", "trimmed_from"?}}}.
+    prompt_breakdown_json = Column(Text, nullable=True)
 
     __table_args__ = (
         Index("ix_api_usage_created_at", "created_at"),
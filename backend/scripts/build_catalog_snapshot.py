@@ -0,0 +1,29 @@
+"""Prebuild the program/course catalog that program_service loads at import.
+
+Every worker otherwise parses programs.json and courses.json and rebuilds the
+same indexes on boot. The snapshot holds them already built; program_service
+checks it against the JSON it came from and ignores it once either changes.
+
+Run after the bulletin scraper rewrites the JSON; the Procfile runs it at
+release, so a deploy never boots on a stale snapshot.
+
+Usage:
+  python -m backend.scripts.build_catalog_snapshot
+"""
+from backend.services.program_service import CATALOG_SNAPSHOT_VERSION, write_catalog_snapshot
+
+
+def main():
+    try:
+        header = write_catalog_snapshot()
+    except Exception as e:
+        # Not fatal at release — a bad JSON row or an unwritable disk must not
+        # block uvicorn from starting; workers fall back to reading the JSON.
+        print(f"catalog snapshot not written: {type(e).__name__}: {e}")
+        return
+    print(f"catalog snapshot v{CATALOG_SNAPSHOT_VERSION}: "
+          f"{header['programs']} programs, {header['courses']} courses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Approximate nearest-neighbour tier for handbook retrieval.
+
+Brute force — one matrix-vector product over every row — is exact and, at the
+73 CMPSC/DTSCE chunks ACE ships today, faster than anything cleverer. It stops
+being free once handbooks for many programs are ingested: tens of thousands of
+1,536-dim rows per question. This is the tier for then.
+
+An inverted-file (IVF) index in plain NumPy: spherical k-means splits the rows
+into ~√n clusters, and a query scores only the rows in the clusters whose
+centroids are nearest to it. Candidates come back as row ids into the full
+index matrix; embedding_service rescores them exactly, so ANN decides only
+*which* rows are scored, never *how*.
+
+One IVF is built per scope partition (see embedding_service.record_scope), so a
+scoped query probes its own program's clusters and never spends a probe on
+another program's rows.
+"""
+
+import logging
+import math
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """Clusters of row ids, and the unit centroid of each."""
+
+    def __init__(self, matrix, rows, n_lists=None, iterations=10, seed=0):
+        rows = np.asarray(rows, dtype=np.intp)
+        vectors = np.asarray(matrix[rows], dtype=np.float32)
+        n_lists = min(len(rows), n_lists or max(1, round(math.sqrt(len(rows)))))
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(rows), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            norms = np.linalg.norm(sums, axis=1)
+            filled = norms > 0
+            # An emptied cluster keeps its old centroid rather than collapsing to 0.
+            centroids[filled] = sums[filled] / norms[filled, None]
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+
+        self.centroids = centroids
+        self.lists = [rows[assign == c] for c in range(n_lists)]
+        logger.info("IVF index: %d rows in %d lists", len(rows), n_lists)
+
+    def search(self, query, n_probe, min_candidates=0):
+        """Row ids in the `n_probe` nearest lists, probing further until there
+        are at least `min_candidates` of them. Sorted ascending."""
+        order = np.argsort(-(self.centroids @ query), kind="stable")
+        picked, count = [], 0
+        for probe, c in enumerate(order):
+            if probe >= n_probe and count >= min_candidates:
+                break
+            picked.append(self.lists[c])
+            count += len(self.lists[c])
+        return np.sort(np.concatenate(picked)) if picked else np.zeros(0, dtype=np.intp)
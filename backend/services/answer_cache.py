@@ -0,0 +1,271 @@
+"""Answer cache for questions nothing personal shaped.
+
+"What are the ETM requirements for CS?", "when is late drop?", "where can I
+eat?" — a cohort asks the same catalogue questions over and over, and each was
+a full model call producing, at temperature 0, the same answer from the same
+prompt.
+
+An answer is reused only when everything the model saw would be the same:
+
+    bucket    intent + major + the chat model + a hash of the whole system
+              prompt (so every grounding snippet, record and rule) + the mtimes
+              of calendar.json and events.json
+    question  the normalised question, or — when its embedding is at hand — any
+              cached question in the bucket within ANSWER_CACHE_SIMILARITY
+
+and only when no student document, profile or conversation history went into
+the prompt; chat_service decides that and never asks otherwise. Answers that
+quote dates or events expire at midnight, since "tomorrow" moves; the rest
+after ANSWER_CACHE_TTL.
+
+Two backends, as for the query-embedding cache: per-process memory, or one
+SQLite file shared by every worker on the host.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from backend.services import llm
+from backend.config import (
+    ANSWER_CACHE_BACKEND, ANSWER_CACHE_PATH, ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY,
+)
+from backend.services.embedding_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+_DATA_FILES = [
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", name)
+    for name in ("calendar.json", "events.json")
+]
+
+
+def _data_versions():
+    """mtimes of the scraped data files, so a refresh retires every answer built on the old copy."""
+    versions = []
+    for path in _DATA_FILES:
+        try:
+            versions.append(str(os.path.getmtime(path)))
+        except OSError:
+            versions.append("-")
+    return ",".join(versions)
+
+
+def _next_midnight():
+    tomorrow = datetime.now().date() + timedelta(days=1)
+    return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+
+def answer_scope(intent, major, system_prompt, question, embedding=None, dated=False):
+    """Where an answer to `question` under this prompt lives, and until when.
+
+    The model is in the bucket: a SQLite cache outlives a restart, and a model
+    switch must not keep serving the previous model's answers.
+    """
+    digest = hashlib.sha256(
+        f"{intent}\n{major or ''}\n{llm.CHAT_MODEL}\n{_data_versions()}\n{system_prompt}"
+        .encode("utf-8")
+    ).hexdigest()
+    expires_at = time.time() + ANSWER_CACHE_TTL
+    if dated:
+        expires_at = min(expires_at, _next_midnight())
+    vector = None
+    if embedding is not None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else None
+    return {
+        "bucket": digest, "question": normalize_question(question),
+        "embedding": vector, "expires_at": expires_at,
+    }
+
+
+class MemoryBackend:
+    """Entries per bucket, LRU over buckets, in this process only."""
+
+    def __init__(self, maxsize=ANSWER_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def entries(self, bucket):
+        with self._lock:
+            found = self._buckets.get(bucket)
+            if found is None:
+                return []
+            self._buckets.move_to_end(bucket)
+            return list(found)
+
+    def add(self, bucket, entry):
+        """entry: (question, embedding or None, answer, expires_at)."""
+        now = time.time()
+        with self._lock:
+            kept = [e for e in self._buckets.get(bucket, []) if e[3] > now and e[0] != entry[0]]
+            self._count -= len(self._buckets.get(bucket, [])) - len(kept)
+            self._buckets[bucket] = kept + [entry]
+            self._buckets.move_to_end(bucket)
+            self._count += 1
+            while self._count > self.maxsize and self._buckets:
+                _, dropped = self._buckets.popitem(last=False)
+                self._count -= len(dropped)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._count = 0
+
+    def __len__(self):
+        return self._count
+
+
+class SqliteBackend:
+    """The same, in a SQLite file every worker on the host shares."""
+
+    def __init__(self, path=ANSWER_CACHE_PATH, maxsize=ANSWER_CACHE_SIZE):
+        self.maxsize = maxsize
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " bucket TEXT NOT NULL, question TEXT NOT NULL, embedding BLOB,"
+            " answer TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL,"
+            " PRIMARY KEY (bucket, question))"
+        )
+        self._conn.commit()
+
+    def entries(self, bucket):
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question, embedding, answer, expires_at FROM answers"
+                " WHERE bucket = ? AND expires_at > ?", (bucket, now),
+            ).fetchall()
+            if rows:
+                self._conn.execute("UPDATE answers SET used_at = ? WHERE bucket = ?", (now, bucket))
+                self._conn.commit()
+        return [
+            (q, np.frombuffer(e, dtype=np.float32) if e is not None else None, a, x)
+            for q, e, a, x in rows
+        ]
+
+    def add(self, bucket, entry):
+        question, embedding, answer, expires_at = entry
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM answers WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+                (bucket, question, blob, answer, expires_at, now),
+            )
+            self._conn.execute(
+                "DELETE FROM answers WHERE rowid IN ("
+                " SELECT rowid FROM answers ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+
+class AnswerCache:
+    """lookup/store over a backend, counting hits, misses and ineligible questions."""
+
+    def __init__(self, backend, similarity=ANSWER_CACHE_SIMILARITY):
+        self.backend = backend
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def lookup(self, scope):
+        """The cached answer for this scope, or None. A backend failure is a miss."""
+        try:
+            answer = self._match(scope, self.backend.entries(scope["bucket"]))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("answer cache read failed: %s", exc)
+            answer = None
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return answer
+
+    def _match(self, scope, entries):
+        now = time.time()
+        live = [e for e in entries if e[3] > now]
+        for question, _, answer, _ in live:
+            if question == scope["question"]:
+                return answer
+        query = scope["embedding"]
+        if query is None:
+            return None
+        best, best_score = None, self.similarity
+        for _, vector, answer, _ in live:
+            if vector is not None and len(vector) == len(query):
+                score = float(vector @ query)
+                if score >= best_score:
+                    best, best_score = answer, score
+        return best
+
+    def store(self, scope, answer):
+        if not answer:
+            return
+        try:
+            self.backend.add(scope["bucket"], (
+                scope["question"], scope["embedding"], answer, scope["expires_at"],
+            ))
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("answer cache write failed: %s", exc)
+
+    def skip(self):
+        """Count a question that was not eligible — personal, or mid-conversation."""
+        self.skipped += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self.backend),
+        }
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = self.misses = self.skipped = 0
+
+
+_answer_cache = None
+
+
+def get_answer_cache():
+    """The process-wide cache, built from config on first use. None when off."""
+    global _answer_cache
+
+    if _answer_cache is None and ANSWER_CACHE_BACKEND != "off":
+        backend = SqliteBackend() if ANSWER_CACHE_BACKEND == "sqlite" else MemoryBackend()
+        _answer_cache = AnswerCache(backend)
+        logger.info("Answer cache: %s (max %d, ttl %ss)",
+                    type(backend).__name__, backend.maxsize, ANSWER_CACHE_TTL)
+    return _answer_cache
@@ -288,6 +288,13 @@ def build_audit_summary(parsed: dict) -> str:
 
 # ── Satisfied requirement blocks ─────────────────────────────────────────────
 
+# The version of what parse_whatif_blocks + merge_satisfied_requirements produce.
+# A stored document keeps its derived audit (student_doc_service) tagged with
+# the version that made it; bump this whenever either function changes its
+# output, and older rows are re-parsed from their text — on read until the
+# backfill reaches them.
+AUDIT_PARSER_VERSION = 1
+
 _REQ_LINE = re.compile(r"([A-Z]{2,6}\s?\d{1,3}[A-Z]?)(?:\s+or\s+([A-Z]{2,6}\s?\d{1,3}[A-Z]?))*")
 
 
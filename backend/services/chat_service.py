@@ -1,16 +1,14 @@
+import asyncio
 import logging
 import re
 import json
 from datetime import date, timedelta
 from dotenv import load_dotenv
+from backend.config import PROMPT_TOKEN_BUDGET
 from backend.services import llm
-from backend.services.embedding_service import semantic_search
-from backend.services.student_doc_service import (
-    has_student_doc,
-    build_student_doc_context,
-    get_current_student_doc,
-    get_user_major,
-)
+from backend.services.answer_cache import answer_scope, get_answer_cache
+from backend.services.embedding_service import aembed_question, semantic_search
+from backend.services.student_doc_service import StudentState, load_student_state
 from backend.services.program_service import (
     get_program,
     get_prerequisites,
@@ -20,8 +18,10 @@ from backend.services.program_service import (
     get_double_dips,
 )
 from backend.services.policy_service import build_policy_snippet, policy_sources
-from backend.services.transcript_service import save_exchange
-from backend.services.profile_service import build_profile_snippet, remember, get_profile
+from backend.services.prompt_budget import count_tokens, fit_sections
+from backend.services.transcript_service import save_exchange, reserve_exchange, finish_exchange
+from backend.services.work_queue import get_work_queue
+from backend.services.profile_service import build_profile_snippet, remember
 from backend.services.clubs_service import build_clubs_snippet, search_clubs
 from backend.services.procedures_service import build_procedures_snippet, find_procedures
 from backend.services.places_service import (
@@ -43,49 +43,52 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 
-def detect_question_intent(question):
-    q = question.lower()
-
-    course_keywords = [
-        "course", "courses", "class", "classes",
-        "math", "stat", "cmpsc", "ds ", " ds ", "dtsce",
-        "data sciences", "data science", "credits",
-        "requirement", "requirements",
-    ]
-    # "take" and "need" are the two commonest verbs in the language and carry no
-    # topic alone, but requiring an academic word beside them is too strict — "do
-    # I need organic chemistry?" has none and is plainly a course question. So
-    # they stay, and lose only to a question that is demonstrably about a PLACE:
-    # "I need to see a doctor", "how long does it take to get a parking permit".
-    # detect_place_categories is the same matcher that picks the campus dataset,
-    # so the two cannot drift apart.
-    if _ACADEMIC_CONTEXT.search(q) or not detect_place_categories(q):
-        course_keywords += ["take", "need"]
-
-    contact_keywords = [
-        "advisor", "adviser", "contact", "email", "phone",
-        "office", "who do i talk to", "who should i contact"
-    ]
+# ── Intent classification ────────────────────────────────────────────────────
+#
+# Keyword lists per intent, checked in priority order: the first intent with
+# any trigger in the question wins. Triggers are plain substrings unless noted;
+# the short acronyms and codes that live inside ordinary words are matched as
+# standalone tokens instead.
+
+_COURSE_KEYWORDS = [
+    "course", "courses", "class", "classes",
+    "math", "stat", "cmpsc", "ds ", " ds ", "dtsce",
+    "data sciences", "data science", "credits",
+    "requirement", "requirements",
+]
+# "take" and "need" are the two commonest verbs in the language and carry no
+# topic alone, but requiring an academic word beside them is too strict — "do
+# I need organic chemistry?" has none and is plainly a course question. So
+# they stay, and lose only to a question that is demonstrably about a PLACE:
+# "I need to see a doctor", "how long does it take to get a parking permit".
+# detect_place_categories is the same matcher that picks the campus dataset,
+# so the two cannot drift apart.
+_COURSE_VERBS = ["take", "need"]
+
+_CONTACT_KEYWORDS = [
+    "advisor", "adviser", "contact", "email", "phone",
+    "office", "who do i talk to", "who should i contact"
+]
 
-    transfer_keywords = [
-        "transfer", "transferring", "credit transfer", "transfer credit",
-        "credits from another school", "advanced placement",
-        "international baccalaureate", "ap credit", "ib credit",
-        "ap exam", "ap score", "ap scores",
-    ]
-    # "ap"/"ib" alone need word boundaries — bare substrings match
-    # "apply"/"flexible". Match only the standalone acronyms.
-    transfer_acronym = re.search(r"\b(ap|ib)\b", q)
+_TRANSFER_KEYWORDS = [
+    "transfer", "transferring", "credit transfer", "transfer credit",
+    "credits from another school", "advanced placement",
+    "international baccalaureate", "ap credit", "ib credit",
+    "ap exam", "ap score", "ap scores",
+]
+# "ap"/"ib" alone need word boundaries — bare substrings match
+# "apply"/"flexible". Match only the standalone acronyms.
+_TRANSFER_TOKENS = r"\b(ap|ib)\b"
 
-    etm_keywords = [
-        "etm", "entrance to major", "major entry"
-    ]
+_ETM_KEYWORDS = [
+    "etm", "entrance to major", "major entry"
+]
 
-    substitution_keywords = [
-        "substitute", "substitution", "replace", "instead of", "count for"
-    ]
+_SUBSTITUTION_KEYWORDS = [
+    "substitute", "substitution", "replace", "instead of", "count for"
+]
 
-    personal_progress_keywords = [
+_PERSONAL_PROGRESS_KEYWORDS = [
     "i still need",
     "do i still need",
     "can i graduate",
@@ -132,195 +135,231 @@ def detect_question_intent(question):
     "my progress",
     "degree progress",
     "how close am i",
-    ]
-
-
-    # Gen-ed category codes are two-letter tokens that also live inside ordinary
-    # words: "sign up" contains "gn ", "things" contains "gs ", "through"
-    # contains "gh ". As bare substrings they routed "how do things work here?"
-    # to gen_ed. Match them as standalone tokens, same as the ap/ib fix above.
-    gen_ed_code = re.search(r"\b(ga|gh|gq|gn|gs|gha|ghw|gws|il)\b", q)
-
-    gen_ed_keywords = [
-        "gen ed", "general education", "gened", "us culture",
-        "international culture", "il course", "arts requirement",
-        "humanities requirement", "social science requirement",
-        "natural science requirement", "quantification", "health requirement",
-        "diversity requirement", "writing requirement", "speaking requirement",
-        "gen ed requirement", "gen-ed", "general ed",
-        "what counts for", "what satisfies", "double dip", "double-dip",
-        "kines 082", "phil 010", "musc 007", "musc 008", "thea 100",
-        "psych 100", "econ 102", "anth 001", "intl 100",
-    ]
-
-    # How the machine works, as opposed to when it happens. "How do I register"
-    # and "when does registration open" are different questions with different
-    # answers; both used to land on `deadline` and get a wall of dates. Keep
-    # these phrases specific — bare "registration" belongs to deadline.
-    logistics_keywords = [
-        "how do i register", "how to register", "how does registration work",
-        "how do i enroll", "how to enroll", "how does enrollment work",
-        "how do i sign up for class", "how do i add a class", "how do i drop a class",
-        "how do i swap", "how do i pick classes", "how do i choose classes",
-        "how do i build my schedule", "how do i get into a class",
-        "registration hold", "advising hold", "hold on my account", "clear my hold",
-        "lionpath", "lion path", "student center", "course cart", "schedule builder",
-        "enrollment appointment", "registration appointment", "registration window",
-        "orientation", "new student", "just enrolled", "just got accepted",
-        "just committed", "just started", "what do i do first", "where do i start",
-        "first steps", "waitlist", "wait list", "closed section", "class is full",
-        "how do i see my schedule", "how do i find my classes",
-    ]
-
-    # Asking ACE to propose, not to recite. These get a plan, not a requirement
-    # dump — see the recommendation grounding in ask_advisor_stream.
-    recommendation_keywords = [
-        "what should i take", "what should i sign up", "what should i register",
-        "what classes should i", "what courses should i", "which classes should i",
-        "which courses should i", "what do you recommend", "what would you suggest",
-        "recommend a course", "recommend classes", "recommend courses",
-        "course recommendation", "suggest a schedule", "suggest classes",
-        "suggest courses", "suggest a course", "build me a schedule",
-        "plan my semester", "plan my next semester", "help me plan",
-        "how many credits should i take", "good course load", "what's a good schedule",
-    ]
-    # "recommend"/"suggest" on their own are too broad ("suggest an advisor"), so
-    # require them to be about coursework.
-    proposes_courses = bool(
-        re.search(r"\b(recommend|suggest|advise)\b", q)
-        and re.search(r"\b(class|classes|course|courses|schedule|semester|term|credits?)\b", q)
-    )
-
-    deadline_keywords = [
-        "deadline", "deadlines", "due date", "last day to", "last day of",
-        "drop/add", "drop add", "add/drop", "add drop",
-        "withdraw", "withdrawal", "late drop", "late withdrawal",
-        "registration", "register", "enroll", "enrollment",
-        "when can i register", "when does registration",
-        "academic calendar", "calendar", "schedule of classes",
-        "final exam", "finals week", "finals schedule",
-        "semester end", "semester ends", "last day of class",
-        "spring 2026", "fall 2026", "summer 2026",
-        "tuition due", "payment deadline", "bill due",
-        "grade appeal", "grade deadline",
-        # "what deadlines are coming up?" routed here and drew the term strip;
-        # "what are the key dates this semester?" — the same question in the
-        # words most students reach for — fell through to `general`, which
-        # claims the cards block, found nothing, and answered with an apology.
-        "key date", "key dates", "important date", "important dates",
-        "term timeline", "what's due", "whats due", "what is due",
-        "dates this semester", "dates this term", "dates i should know",
-    ]
-
-    # Distress and support. The short tokens here were the worst offenders in the
-    # whole router: "org" lives inside "organic", "rec" inside "record", "broke"
-    # inside "broken", so "do I need organic chemistry?" was answered out of the
-    # CAPS / 988 crisis block. Bare "health" is gone too — "health requirement"
-    # is the GHW gen-ed category, not a wellbeing question.
-    wellbeing_keywords = [
-        "stress", "stressed", "anxiety", "anxious", "overwhelmed", "burnout",
-        "mental health", "depressed", "depression", "struggling", "counseling",
-        "student health", "health center", "therapy", "therapist", "crisis",
-        "emergency fund", "financial hardship", "can't afford", "cannot afford",
-        "safe walk", "unsafe", "harassed", "emergency", "campus police",
-        # How someone in trouble actually types it. All of these routed to
-        # `general` and got a generic answer instead of the care resources —
-        # the one place a miss costs more than a bad answer.
-        "losing it", "falling apart", "can't keep up", "cant keep up",
-        "drowning", "barely holding", "can't cope", "cant cope", "at my limit",
-        "breaking point", "want to give up", "giving up", "behind on everything",
-        "spiraling", "spiralling", "panicking", "panic attack", "crying",
-        "too much going on", "can't do this", "cant do this",
-        "recreation", "recsports", "intramural", "writing center", "tutoring",
-        "calculus help",
-    ]
-    wellbeing_token = re.search(r"\b(caps|uhs|lrc|gym|sick|broke)\b", q)
-
-    # Ring 3 — career, activities, research. These used to live in the wellbeing
-    # list, so "how do I find an internship?" was answered from a block that
-    # opens with counselling and the 988 crisis line. Checked AFTER wellbeing, so
-    # "I'm stressed about finding a job" still routes to support.
-    career_keywords = [
-        "career", "internship", "internships", "co-op", "cooperative education",
-        "resume", "résumé", "cover letter", "handshake", "job", "jobs",
-        "employer", "hiring", "linkedin", "networking", "career fair",
-        "club", "clubs", "student org", "orgcentral", "extracurricular",
-        "get involved", "should i join", "what to join", "somewhere to belong",
-        "meet people", "find my people", "research opportunity", "undergraduate research",
-        "research lab", "work in a lab", "study abroad", "volunteer",
-        "grad school", "graduate school", "portfolio",
-    ]
-
-    # Visa/immigration — unambiguous, checked first; ACE refers, never advises.
-    # Visa/immigration acronyms need WORD BOUNDARIES — bare substrings like "opt"
-    # or "ead" false-match "option"/"deadline". Regex for the short tokens,
-    # plain phrases for the longer ones.
-    intl_acronym = re.search(
-        r"\b(opt|cpt|ead|dso|sevis|uscis|dissa|visas?|i-?20|i-?94|ds-?2019|f-?1|j-?1|h-?1b)\b",
-        q,
-    )
-    international_phrases = [
-        "international student", "optional practical training",
-        "curricular practical training", "immigration", "travel signature",
-        "out of status", "study permit", "work authorization",
-        "penn state global", "designated school official",
-    ]
+]
 
-    financial_aid_keywords = [
-        "financial aid", "fafsa", "scholarship", "scholarships", "grant", "grants",
-        "student loan", "student loans", "work study", "work-study", "student aid",
-        "net price", "cost of attendance", "pay for college", "pay for school",
-        "paying for college", "afford tuition", "aid package", "aid eligibility",
-        "pell grant", "subsidized loan", "loan forgiveness", "tuition assistance",
-    ]
+# Gen-ed category codes are two-letter tokens that also live inside ordinary
+# words: "sign up" contains "gn ", "things" contains "gs ", "through"
+# contains "gh ". As bare substrings they routed "how do things work here?"
+# to gen_ed. Match them as standalone tokens, same as the ap/ib fix above.
+_GEN_ED_TOKENS = r"\b(ga|gh|gq|gn|gs|gha|ghw|gws|il)\b"
+
+_GEN_ED_KEYWORDS = [
+    "gen ed", "general education", "gened", "us culture",
+    "international culture", "il course", "arts requirement",
+    "humanities requirement", "social science requirement",
+    "natural science requirement", "quantification", "health requirement",
+    "diversity requirement", "writing requirement", "speaking requirement",
+    "gen ed requirement", "gen-ed", "general ed",
+    "what counts for", "what satisfies", "double dip", "double-dip",
+    "kines 082", "phil 010", "musc 007", "musc 008", "thea 100",
+    "psych 100", "econ 102", "anth 001", "intl 100",
+]
 
-    if intl_acronym or any(p in q for p in international_phrases):
-        return "international"
+# How the machine works, as opposed to when it happens. "How do I register"
+# and "when does registration open" are different questions with different
+# answers; both used to land on `deadline` and get a wall of dates. Keep
+# these phrases specific — bare "registration" belongs to deadline.
+_LOGISTICS_KEYWORDS = [
+    "how do i register", "how to register", "how does registration work",
+    "how do i enroll", "how to enroll", "how does enrollment work",
+    "how do i sign up for class", "how do i add a class", "how do i drop a class",
+    "how do i swap", "how do i pick classes", "how do i choose classes",
+    "how do i build my schedule", "how do i get into a class",
+    "registration hold", "advising hold", "hold on my account", "clear my hold",
+    "lionpath", "lion path", "student center", "course cart", "schedule builder",
+    "enrollment appointment", "registration appointment", "registration window",
+    "orientation", "new student", "just enrolled", "just got accepted",
+    "just committed", "just started", "what do i do first", "where do i start",
+    "first steps", "waitlist", "wait list", "closed section", "class is full",
+    "how do i see my schedule", "how do i find my classes",
+]
 
-    if any(keyword in q for keyword in financial_aid_keywords):
-        return "financial_aid"
+# Asking ACE to propose, not to recite. These get a plan, not a requirement
+# dump — see the recommendation grounding in ask_advisor_stream.
+_RECOMMENDATION_KEYWORDS = [
+    "what should i take", "what should i sign up", "what should i register",
+    "what classes should i", "what courses should i", "which classes should i",
+    "which courses should i", "what do you recommend", "what would you suggest",
+    "recommend a course", "recommend classes", "recommend courses",
+    "course recommendation", "suggest a schedule", "suggest classes",
+    "suggest courses", "suggest a course", "build me a schedule",
+    "plan my semester", "plan my next semester", "help me plan",
+    "how many credits should i take", "good course load", "what's a good schedule",
+]
+# "recommend"/"suggest" on their own are too broad ("suggest an advisor"), so
+# require them to be about coursework.
+_PROPOSE_VERB = re.compile(r"\b(recommend|suggest|advise)\b")
+_PROPOSE_OBJECT = re.compile(r"\b(class|classes|course|courses|schedule|semester|term|credits?)\b")
+
+_DEADLINE_KEYWORDS = [
+    "deadline", "deadlines", "due date", "last day to", "last day of",
+    "drop/add", "drop add", "add/drop", "add drop",
+    "withdraw", "withdrawal", "late drop", "late withdrawal",
+    "registration", "register", "enroll", "enrollment",
+    "when can i register", "when does registration",
+    "academic calendar", "calendar", "schedule of classes",
+    "final exam", "finals week", "finals schedule",
+    "semester end", "semester ends", "last day of class",
+    "spring 2026", "fall 2026", "summer 2026",
+    "tuition due", "payment deadline", "bill due",
+    "grade appeal", "grade deadline",
+    # "what deadlines are coming up?" routed here and drew the term strip;
+    # "what are the key dates this semester?" — the same question in the
+    # words most students reach for — fell through to `general`, which
+    # claims the cards block, found nothing, and answered with an apology.
+    "key date", "key dates", "important date", "important dates",
+    "term timeline", "what's due", "whats due", "what is due",
+    "dates this semester", "dates this term", "dates i should know",
+]
 
-    # Logistics before deadline: "how do I register" is a steps question, and
-    # deadline owns bare "registration"/"register", so it would swallow it.
-    if any(keyword in q for keyword in logistics_keywords):
-        return "logistics"
+# Distress and support. The short tokens here were the worst offenders in the
+# whole router: "org" lives inside "organic", "rec" inside "record", "broke"
+# inside "broken", so "do I need organic chemistry?" was answered out of the
+# CAPS / 988 crisis block. Bare "health" is gone too — "health requirement"
+# is the GHW gen-ed category, not a wellbeing question.
+_WELLBEING_KEYWORDS = [
+    "stress", "stressed", "anxiety", "anxious", "overwhelmed", "burnout",
+    "mental health", "depressed", "depression", "struggling", "counseling",
+    "student health", "health center", "therapy", "therapist", "crisis",
+    "emergency fund", "financial hardship", "can't afford", "cannot afford",
+    "safe walk", "unsafe", "harassed", "emergency", "campus police",
+    # How someone in trouble actually types it. All of these routed to
+    # `general` and got a generic answer instead of the care resources —
+    # the one place a miss costs more than a bad answer.
+    "losing it", "falling apart", "can't keep up", "cant keep up",
+    "drowning", "barely holding", "can't cope", "cant cope", "at my limit",
+    "breaking point", "want to give up", "giving up", "behind on everything",
+    "spiraling", "spiralling", "panicking", "panic attack", "crying",
+    "too much going on", "can't do this", "cant do this",
+    "recreation", "recsports", "intramural", "writing center", "tutoring",
+    "calculus help",
+]
+_WELLBEING_TOKENS = r"\b(caps|uhs|lrc|gym|sick|broke)\b"
+
+# Ring 3 — career, activities, research. These used to live in the wellbeing
+# list, so "how do I find an internship?" was answered from a block that
+# opens with counselling and the 988 crisis line. Checked AFTER wellbeing, so
+# "I'm stressed about finding a job" still routes to support.
+_CAREER_KEYWORDS = [
+    "career", "internship", "internships", "co-op", "cooperative education",
+    "resume", "résumé", "cover letter", "handshake", "job", "jobs",
+    "employer", "hiring", "linkedin", "networking", "career fair",
+    "club", "clubs", "student org", "orgcentral", "extracurricular",
+    "get involved", "should i join", "what to join", "somewhere to belong",
+    "meet people", "find my people", "research opportunity", "undergraduate research",
+    "research lab", "work in a lab", "study abroad", "volunteer",
+    "grad school", "graduate school", "portfolio",
+]
 
-    if any(keyword in q for keyword in deadline_keywords):
-        return "deadline"
+# Visa/immigration — unambiguous, checked first; ACE refers, never advises.
+# Visa/immigration acronyms need WORD BOUNDARIES — bare substrings like "opt"
+# or "ead" false-match "option"/"deadline". Regex for the short tokens,
+# plain phrases for the longer ones.
+_INTERNATIONAL_TOKENS = (
+    r"\b(opt|cpt|ead|dso|sevis|uscis|dissa|visas?|i-?20|i-?94|ds-?2019|f-?1|j-?1|h-?1b)\b"
+)
+_INTERNATIONAL_PHRASES = [
+    "international student", "optional practical training",
+    "curricular practical training", "immigration", "travel signature",
+    "out of status", "study permit", "work authorization",
+    "penn state global", "designated school official",
+]
 
-    # Before courses/gen_ed, both of which match "take"/"class" and would turn a
-    # request for a proposal into a requirement recital.
-    if proposes_courses or any(keyword in q for keyword in recommendation_keywords):
-        return "recommendation"
+_FINANCIAL_AID_KEYWORDS = [
+    "financial aid", "fafsa", "scholarship", "scholarships", "grant", "grants",
+    "student loan", "student loans", "work study", "work-study", "student aid",
+    "net price", "cost of attendance", "pay for college", "pay for school",
+    "paying for college", "afford tuition", "aid package", "aid eligibility",
+    "pell grant", "subsidized loan", "loan forgiveness", "tuition assistance",
+]
 
-    if gen_ed_code or any(keyword in q for keyword in gen_ed_keywords):
-        return "gen_ed"
 
-    if wellbeing_token or any(keyword in q for keyword in wellbeing_keywords):
-        return "wellbeing"
+def _trie_pattern(keywords):
+    """An alternation of `keywords` factored into a prefix trie.
 
-    if any(keyword in q for keyword in career_keywords):
-        return "career"
+    Python's re tries every branch of a flat alternation at every position, so
+    a flat list of 50 phrases was slower than 50 `in` checks. Factored, a
+    position that starts no keyword fails on its first character. A keyword
+    that is a prefix of another ends in an optional group, so the longer,
+    more specific one is the match reported ("registration window", not
+    "registration").
+    """
+    root = {}
+    for keyword in keywords:
+        node = root
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node):
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(root)
+
+
+def _compile_triggers(keywords, tokens=None):
+    """One regex matching any keyword as a substring, or any of `tokens`."""
+    pattern = _trie_pattern(keywords)
+    return re.compile(f"{tokens}|{pattern}" if tokens else pattern)
+
+
+# Priority order. Notes on the ordering that matters:
+#  - logistics before deadline: "how do I register" is a steps question, and
+#    deadline owns bare "registration"/"register", so it would swallow it.
+#  - recommendation before courses/gen_ed, both of which match "take"/"class"
+#    and would turn a request for a proposal into a requirement recital.
+_INTENT_TRIGGERS = [
+    ("international", _compile_triggers(_INTERNATIONAL_PHRASES, _INTERNATIONAL_TOKENS)),
+    ("financial_aid", _compile_triggers(_FINANCIAL_AID_KEYWORDS)),
+    ("logistics", _compile_triggers(_LOGISTICS_KEYWORDS)),
+    ("deadline", _compile_triggers(_DEADLINE_KEYWORDS)),
+    ("recommendation", _compile_triggers(_RECOMMENDATION_KEYWORDS)),
+    ("gen_ed", _compile_triggers(_GEN_ED_KEYWORDS, _GEN_ED_TOKENS)),
+    ("wellbeing", _compile_triggers(_WELLBEING_KEYWORDS, _WELLBEING_TOKENS)),
+    ("career", _compile_triggers(_CAREER_KEYWORDS)),
+    ("student_progress", _compile_triggers(_PERSONAL_PROGRESS_KEYWORDS)),
+    ("contact", _compile_triggers(_CONTACT_KEYWORDS)),
+    ("transfer", _compile_triggers(_TRANSFER_KEYWORDS, _TRANSFER_TOKENS)),
+    ("etm", _compile_triggers(_ETM_KEYWORDS)),
+    ("substitution", _compile_triggers(_SUBSTITUTION_KEYWORDS)),
+    ("courses", _compile_triggers(_COURSE_KEYWORDS)),
+]
+_COURSE_VERB_TRIGGERS = _compile_triggers(_COURSE_VERBS)
 
-    if any(keyword in q for keyword in personal_progress_keywords):
-        return "student_progress"
 
-    if any(keyword in q for keyword in contact_keywords):
-        return "contact"
+def classify_intent(question):
+    """(intent, trigger): the routed intent and the text in the question that
+    decided it. trigger is None for `general`.
 
-    if transfer_acronym or any(keyword in q for keyword in transfer_keywords):
-        return "transfer"
+    Each intent's keywords are one precompiled regex, built at import; a
+    question costs at most one search per intent, stopping at the first that
+    matches, where the keyword lists used to be rebuilt and scanned phrase by
+    phrase on every call.
+    """
+    q = question.lower()
+    for intent, triggers in _INTENT_TRIGGERS:
+        match = triggers.search(q)
+        if match:
+            return intent, match.group(0)
+        if intent == "recommendation":
+            verb = _PROPOSE_VERB.search(q)
+            if verb and _PROPOSE_OBJECT.search(q):
+                return intent, verb.group(0)
 
-    if any(keyword in q for keyword in etm_keywords):
-        return "etm"
+    if _ACADEMIC_CONTEXT.search(q) or not detect_place_categories(q):
+        match = _COURSE_VERB_TRIGGERS.search(q)
+        if match:
+            return "courses", match.group(0)
 
-    if any(keyword in q for keyword in substitution_keywords):
-        return "substitution"
+    return "general", None
 
-    if any(keyword in q for keyword in course_keywords):
-        return "courses"
 
-    return "general"
+def detect_question_intent(question):
+    return classify_intent(question)[0]
 
 
 # "need" and "take" were in course_keywords as bare words, so "I need to see a
@@ -349,30 +388,37 @@ def filter_records_by_scope(records, major_kind):
     return scoped or records
 
 
-def select_top_records(records, intent):
-    handbook = [r for r in records if r.get("source_type") == "pdf_handbook"]
-    bulletin = [r for r in records if r.get("source_type") == "web_bulletin"]
-
-    if intent in ["courses", "student_progress"]:
-        # Handbook is primary, bulletin secondary
-        return handbook[:4] + bulletin[:3]
+# What select_top_records keeps for each intent: (source_type, how many), in
+# the order the groups appear. Retrieval asks for exactly these counts.
+_RECORD_SELECTION = {
+    # Handbook is primary, bulletin secondary
+    "courses": (("pdf_handbook", 4), ("web_bulletin", 3)),
+    "student_progress": (("pdf_handbook", 4), ("web_bulletin", 3)),
+    "substitution": (("pdf_handbook", 4), ("web_bulletin", 2)),
+    # Procedural questions — the handbooks carry ETM rules, petitions,
+    # substitution process, and department contacts; the bulletins don't.
+    "transfer": (("pdf_handbook", 4), ("web_bulletin", 2)),
+    "etm": (("pdf_handbook", 4), ("web_bulletin", 2)),
+    "contact": (("pdf_handbook", 4), ("web_bulletin", 2)),
+    "gen_ed": (("pdf_handbook", 3), ("web_bulletin", 3)),
+    "deadline": (("web_bulletin", 2), ("pdf_handbook", 2)),
+}
+_GENERAL_SELECTION = (("web_bulletin", 2), ("pdf_handbook", 3))
 
-    if intent == "substitution":
-        return handbook[:4] + bulletin[:2]
+# Index partition (embedding_service.record_scope) for each RAG-backed major.
+_RETRIEVAL_SCOPES = {"cs": "cmpsc", "ds": "dtsce"}
 
-    if intent in ["transfer", "etm", "contact"]:
-        # Procedural questions — the handbooks carry ETM rules, petitions,
-        # substitution process, and department contacts; the bulletins don't.
-        return handbook[:4] + bulletin[:2]
 
-    if intent == "gen_ed":
-        return handbook[:3] + bulletin[:3]
+def record_quotas(intent):
+    """{source_type: count} that select_top_records will keep for `intent`."""
+    return dict(_RECORD_SELECTION.get(intent, _GENERAL_SELECTION))
 
-    if intent == "deadline":
-        return bulletin[:2] + handbook[:2]
 
-    # general
-    return bulletin[:2] + handbook[:3]
+def select_top_records(records, intent):
+    picked = []
+    for source_type, count in _RECORD_SELECTION.get(intent, _GENERAL_SELECTION):
+        picked += [r for r in records if r.get("source_type") == source_type][:count]
+    return picked
 
 
 def format_record_for_context(record, index):
@@ -969,18 +1015,99 @@ _HANDBOOK_INTENTS = {"etm", "transfer", "substitution"}
 _ACADEMIC_INTENTS = {"courses", "gen_ed", "student_progress", "recommendation"}
 
 
-def _has_other_grounding(question, intent, user_major) -> bool:
+def _freeze(value):
+    """A hashable stand-in for a lookup argument (lists of codes, interests)."""
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_freeze(v) for v in value))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+class GroundingContext:
+    """The structured lookups one question needs, each run at most once.
+
+    Routing, the visual counter, the block builder and the snippet builders all
+    ask the same questions of the same datasets — find_places(question) ran four
+    times per message, find_procedures three, the career club search four. One
+    of these lives for one request; every lookup goes through it and is
+    memoised on its arguments.
+
+    The find_*/search_clubs methods take the same arguments as the functions
+    they wrap, so they can be handed to a snippet builder's `find=`/`search=`.
+    """
+
+    def __init__(self, question=""):
+        self.question = question
+        self._memo = {}
+        self._reused = 0
+
+    def _once(self, name, fn, *args, **kwargs):
+        key = (name, _freeze(args), _freeze(kwargs))
+        if key in self._memo:
+            self._reused += 1
+            return self._memo[key]
+        value = self._memo[key] = fn(*args, **kwargs)
+        logger.debug("grounding | computed %s%r → %s", name, args,
+                     f"{len(value)} items" if isinstance(value, (list, tuple)) else type(value).__name__)
+        return value
+
+    def find_procedures(self, question):
+        return self._once("find_procedures", find_procedures, question)
+
+    def find_places(self, question):
+        return self._once("find_places", find_places, question)
+
+    def find_money(self, question):
+        return self._once("find_money", find_money, question)
+
+    def find_events(self, question, interests=None):
+        return self._once("find_events", find_events, question, interests)
+
+    def search_clubs(self, interests):
+        return self._once("search_clubs", search_clubs, interests)
+
+    def career_clubs(self, question, user_major):
+        """Clubs matched on the question, else on the student's major."""
+        return self.search_clubs([question]) or (
+            self.search_clubs([user_major.split(",")[0]]) if user_major else []
+        )
+
+    def audit_states(self, student_doc):
+        # One student per request, so the document itself needn't be the key.
+        key = ("audit_states", bool(student_doc), ())
+        if key not in self._memo:
+            self._memo[key] = _audit_course_states(student_doc)
+        else:
+            self._reused += 1
+        return self._memo[key]
+
+    def recommendation_context(self, program_name, completed, in_progress=None):
+        return self._once("build_recommendation_context", build_recommendation_context,
+                          program_name, completed, in_progress=in_progress)
+
+    def prereq_graph(self, code, completed, in_progress=None):
+        return self._once("build_prereq_graph", build_prereq_graph,
+                          code, completed, in_progress=in_progress)
+
+    def log_summary(self):
+        logger.debug("grounding | %d lookups computed, %d answered from memo: %s",
+                     len(self._memo), self._reused,
+                     sorted({name for name, _, _ in self._memo}))
+
+
+def _has_other_grounding(question, intent, user_major, grounding=None) -> bool:
     """True when a structured dataset already answers this, so the handbook is
     not needed as a fallback. Cheap local lookups only."""
+    g = grounding or GroundingContext(question)
     try:
-        if find_procedures(question) or find_places(question) or find_money(question):
+        if g.find_procedures(question) or g.find_places(question) or g.find_money(question):
             return True
-        if mentions_events(question) and not is_events_stale() and find_events(question):
+        if mentions_events(question) and not is_events_stale() and g.find_events(question):
             return True
-        if intent == "career" and (
-            search_clubs([question])
-            or (search_clubs([user_major.split(",")[0]]) if user_major else [])
-        ):
+        if intent == "career" and g.career_clubs(question, user_major):
             return True
         if intent in ("recommendation", "gen_ed", "courses", "student_progress") and user_major:
             return True
@@ -1097,33 +1224,33 @@ def _build_prereq_snippet(graph) -> str:
     return "\n".join(lines)
 
 
-def _build_block_data(block, question, intent, user_major, student_doc):
+def _build_block_data(block, question, intent, user_major, student_doc, grounding=None):
     """The payload for a non-map block, or None when there is nothing to draw."""
+    g = grounding or GroundingContext(question)
     try:
         if block == "cards":
             if intent == "career":
-                clubs = search_clubs([question]) or (
-                    search_clubs([user_major.split(",")[0]]) if user_major else [])
+                clubs = g.career_clubs(question, user_major)
                 if clubs:
                     return B.clubs_cards(clubs)
             # Places before events: "where can I eat on campus?" matched the
             # events trigger "on campus" and came back with a social calendar.
             # A place question names a place; an event question names a time.
-            places = find_places(question)
+            places = g.find_places(question)
             if places:
                 return B.places_cards(places)
             if mentions_events(question) and not is_events_stale():
-                evs = find_events(question)
+                evs = g.find_events(question)
                 if evs:
                     return B.events_cards(evs, events_local_time)
-            ctx = _recommendation_context(user_major, student_doc)
+            ctx = _recommendation_context(user_major, student_doc, g)
             return B.course_cards(ctx["propose"]) if ctx and ctx.get("propose") else None
 
         if block == "checklist":
-            return B.procedure_checklist(find_procedures(question))
+            return B.procedure_checklist(g.find_procedures(question))
 
         if block == "plan":
-            ctx = _recommendation_context(user_major, student_doc)
+            ctx = _recommendation_context(user_major, student_doc, g)
             prog = get_program(user_major) if user_major else None
             audit = (student_doc or {}).get("audit_parse") or {}
             totals = audit.get("overall_totals") or {}
@@ -1138,11 +1265,12 @@ def _build_block_data(block, question, intent, user_major, student_doc):
     return None
 
 
-def _recommendation_context(user_major, student_doc):
+def _recommendation_context(user_major, student_doc, grounding=None):
     if not user_major:
         return None
-    done, doing = _audit_course_states(student_doc)
-    return build_recommendation_context(user_major, done, in_progress=doing)
+    g = grounding or GroundingContext()
+    done, doing = g.audit_states(student_doc)
+    return g.recommendation_context(user_major, done, in_progress=doing)
 
 
 def _map_target_codes(question, history=None):
@@ -1157,7 +1285,8 @@ def _map_target_codes(question, history=None):
     return codes
 
 
-def _count_visual_material(question, intent, user_major, student_doc, history=None):
+def _count_visual_material(question, intent, user_major, student_doc, history=None,
+                           grounding=None):
     """How many items each visual block would actually have to work with.
 
     All local lookups — JSON and dict reads, no API calls — so this is cheap to
@@ -1171,21 +1300,20 @@ def _count_visual_material(question, intent, user_major, student_doc, history=No
     # diagram disagreeing in the same reply is worse than either alone.
     if mentions_elsewhere(question):
         return counts
+    g = grounding or GroundingContext(question)
     try:
-        procs = find_procedures(question)
+        procs = g.find_procedures(question)
         if procs:
             counts["checklist"] = max(len(p.get("steps") or []) for p in procs)
 
-        places = find_places(question)
+        places = g.find_places(question)
         # Mirror build_clubs_snippet's own fallback: question first, then the
         # student's major. Without it the counter said "no cards" while the
         # snippet was happily listing six clubs — the policy and the grounding
         # disagreed about what data existed.
         clubs = []
         if intent == "career":
-            clubs = search_clubs([question]) or (
-                search_clubs([user_major.split(",")[0]]) if user_major else []
-            )
+            clubs = g.career_clubs(question, user_major)
         cards = len(places) + len(clubs)
         if cards:
             counts["cards"] = cards
@@ -1196,14 +1324,14 @@ def _count_visual_material(question, intent, user_major, student_doc, history=No
         # Events were never counted, so "what's happening this week" could not
         # reach a block no matter how many events the snippet had found.
         if mentions_events(question) and not is_events_stale():
-            found = find_events(question)
+            found = g.find_events(question)
             if found:
                 counts["cards"] = max(counts.get("cards", 0), len(found))
 
         if user_major and intent in ("recommendation", "student_progress"):
             audit = (student_doc or {}).get("audit_parse") or {}
             done = [c.get("code") for c in audit.get("completed_courses", []) if c.get("code")]
-            ctx = build_recommendation_context(user_major, done)
+            ctx = g.recommendation_context(user_major, done)
             if ctx and ctx.get("propose"):
                 counts["plan"] = len(ctx["propose"])
 
@@ -1223,8 +1351,8 @@ def _count_visual_material(question, intent, user_major, student_doc, history=No
                 # a direct request, for the one shape the map exists to show —
                 # drew nothing at all. Only reached when prereqs is empty, so
                 # the extra lookup is rare.
-                done, doing = _audit_course_states(student_doc)
-                opens = len((build_prereq_graph(code, done, in_progress=doing)
+                done, doing = g.audit_states(student_doc)
+                opens = len((g.prereq_graph(code, done, in_progress=doing)
                              or {}).get("unlocks") or [])
                 if opens:
                     counts["map"] = opens + 1
@@ -1250,7 +1378,7 @@ def _upcoming_deadline_count() -> int:
         return 0
 
 
-def _build_recommendation_snippet(program_name, student_doc):
+def _build_recommendation_snippet(program_name, student_doc, grounding=None):
     """Grounding for "what should I take next semester?".
 
     ACE's other answers recite what is required. This one proposes: it locates
@@ -1258,8 +1386,9 @@ def _build_recommendation_snippet(program_name, student_doc):
     prerequisites they have not met yet. Everything proposed comes from the
     program's own suggested plan — the model is never asked to invent a schedule.
     """
-    completed, doing = _audit_course_states(student_doc)
-    ctx = build_recommendation_context(program_name, completed, in_progress=doing)
+    g = grounding or GroundingContext()
+    completed, doing = g.audit_states(student_doc)
+    ctx = g.recommendation_context(program_name, completed, in_progress=doing)
     if not ctx:
         return (
             "\n\n=== COURSE RECOMMENDATION ===\n"
@@ -1570,20 +1699,15 @@ def build_degree_audit_advisory(doc_type, declared):
     return ""
 
 
-def ask_advisor_stream(question, history=None, user_id: str = None, major: str = None,
-                       conversation_id: str = None):
-    """Generator that yields SSE-formatted chunks for the chat response.
+def _route_question(question, state, major=None):
+    """Intent, major and whether the handbook index is consulted at all.
 
-    history: list of {"role": "user"|"assistant", "content": str} dicts
-             representing the prior conversation turns.
-    user_id: Clerk user ID of the signed-in student; used to look up their
-             uploaded document and (if `major` is not given) their major.
-    major:   Optional explicit program name to ground on, bypassing the DB
-             lookup. Used by the eval harness to test a major without a
-             persisted user. Falls back to the user's stored major when None.
+    Decided before anything is retrieved, so the async pipeline knows whether a
+    question embedding is needed before it asks for one. `state` is the
+    request's StudentState; it rides along in the route for _prepare_answer.
     """
-    intent = detect_question_intent(question)
-    user_major = major or (get_user_major(user_id) if user_id else None)
+    intent, trigger = classify_intent(question)
+    user_major = major or state.major
     major_kind = classify_major(user_major)        # 'cs' | 'ds' | 'other' | None
     structured_only = major_kind == "other"
     # The RAG index is 100% CMPSC/DTSCE. We only let it drive the answer for
@@ -1599,14 +1723,172 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
     # arrived with 3,855 tokens of handbook competing with the 693-token answer,
     # and came back citing the handbook. The launch cohort got the worst prompts
     # in the product precisely because they were the only ones with an index.
+    grounding = GroundingContext(question)
     use_handbook = not suppress_cs_ds and (
-        intent in _HANDBOOK_INTENTS or not _has_other_grounding(question, intent, user_major)
+        intent in _HANDBOOK_INTENTS
+        or not _has_other_grounding(question, intent, user_major, grounding)
     )
     logger.info(
-        "ask_advisor_stream | intent=%r | major=%r (%s) | question=%r",
-        intent, user_major, major_kind or "none", question[:80],
+        "ask_advisor_stream | intent=%r (on %r) | major=%r (%s) | question=%r",
+        intent, trigger, user_major, major_kind or "none", question[:80],
     )
 
+    return {
+        "intent": intent,
+        "intent_trigger": trigger,
+        "user_major": user_major,
+        "major_kind": major_kind,
+        "structured_only": structured_only,
+        "suppress_cs_ds": suppress_cs_ds,
+        "use_handbook": use_handbook,
+        "grounding": grounding,
+        "state": state,
+    }
+
+
+# Grounding sections of the system prompt: (priority, cap in tokens). When the
+# prompt is over budget the lowest priority is trimmed first; None is never
+# trimmed. The blocks the answer rules call authoritative — handbook policy,
+# prerequisites, procedures — go last, and the crisis resources never do.
+_PROMPT_SECTIONS = {
+    "policy":                (90, None),
+    "prereq":                (90, None),
+    "procedures":            (85, None),
+    "deadline":              (80, None),
+    "recommendation":        (80, None),
+    "student_doc":           (75, 1500),
+    "context":               (70, 3000),
+    "rule_summary":          (65, None),
+    "program":               (60, 2000),
+    "gen_ed":                (60, None),
+    "money":                 (55, None),
+    "places":                (55, None),
+    "events":                (50, None),
+    "career":                (50, None),
+    "logistics":             (50, None),
+    "aid":                   (50, None),
+    "intl":                  (50, None),
+    "profile":               (40, None),
+    "degree_audit_advisory": (40, None),
+    "resources":             (None, None),
+}
+
+
+# The part of the system prompt that is the same for every request, byte for
+# byte. OpenAI caches a prompt prefix it has seen recently (from 1,024 tokens,
+# billed at the cached_input rate and faster to first token), so everything that
+# varies goes AFTER this: first what varies by major, then by student, then by
+# question. test_chat_stream asserts the prefix never moves.
+_SYSTEM_PROMPT_PREFIX = """You are ACE, the Academic Counselling Engine for Penn State University students.
+
+=== WHAT ACE IS FOR ===
+ACE answers questions about being a student at Penn State: degree requirements,
+courses and prerequisites, registration and deadlines, campus places and
+services, student organisations and events, procedures when something has gone
+wrong, and this student's own record. That is the whole of it.
+
+Anything else gets ONE short line saying it is outside what ACE does, and a
+pointer to who would know — then stop. Do not answer it anyway "just this once",
+and do not answer a diluted version of it. Specifically:
+
+- Another city, campus or institution. ACE knows Penn State. "Where should I eat
+  in New York?" is not a Penn State question, and the Penn State dining halls are
+  not an answer to it.
+- General knowledge, current events, products, sport, weather, celebrities.
+- Writing to order: poems, essays, cover letters, stories, code, translations.
+  A student asking ACE to write their essay is asking the wrong tool.
+- Medical, legal, immigration, investment or tax advice. Naming the Penn State
+  office that handles it is right; advising is not.
+
+NEVER mention your training data, your knowledge cutoff, what model you are, or
+what you "cannot access". A student does not need to know how you are built —
+they need to know whether you can help and who can. Say what ACE covers and
+where to go instead.
+
+=== HOW TO ANSWER ===
+SHAPE — every answer is the verdict, then the substance, then the citation.
+1. VERDICT first, in ONE line. If they asked a yes/no question, the first word is
+   Yes or No — UNLESS the grounding says ACE cannot determine it for this student
+   (no audit uploaded, no record). Then the first line says so plainly and states
+   what the rule is instead. A confident "Yes, you can" to someone whose
+   transcript ACE has never seen is a guess wearing a verdict's clothes.
+   Never open by restating the question, and never open with "Great
+   question", "As your academic counselling engine", or any preamble.
+2. SUBSTANCE — everything they asked for. Follow the VISUAL POLICY at the end:
+   when it says a block is RENDERED beneath your answer, state the point in prose
+   and let the block show the items; otherwise the items must appear in your
+   answer, because nothing else will show them.
+3. CITATION — name where it came from when a source is present. Nothing else.
+
+- Ground every answer in the records, rules and student document provided; use the conversation history only to follow context.
+- List courses as bullets when you are listing several — unless the VISUAL POLICY says a block is rendered, in which case list nothing; this rule loses to it. Do NOT bullet section labels (e.g. "Probability and Statistics (6 credits)") — use them as headings.
+- For contact questions, use the advisor name from the student document first; only mention department contacts as secondary.
+- Quote exact handbook language when available. Do not say "typically" or "likely" unless the records themselves are uncertain.
+- When a DEPARTMENT HANDBOOK POLICIES block is present, it outranks the advising records for procedure questions (ETM, petitions, substitutions, transfer credit, who to contact). Use its exact numbers and name the step the student has to take.
+- Never invent courses, policies, contacts, grades, or substitutions not present in the records.
+- If records are insufficient, say so clearly.
+- Do not mention internal record numbers.
+- If a Degree Audit Advisory is present below, include the recommendation naturally in your answer when it is relevant to what the student asked.
+- Be specific. A student can act on "email the Bursar at 814-865-2979"; they cannot act on "contact the appropriate office".
+- The sections below are this student and this question. Where a rule in THIS ANSWER conflicts with one above, THIS ANSWER wins.
+"""
+
+
+def _render_system_prompt(s, intent, user_major, major_guidance, register,
+                          either_rule, no_record_rule, visual_directive):
+    """The system prompt around the grounding sections `s` (name → text).
+
+    Ordered from most to least shared, so consecutive requests share the
+    longest possible prefix: the static contract, then the student's program,
+    then the student's own record, then this question. Rendered once with every
+    section empty, to count the fixed text the budget must leave room for, then
+    again with the budgeted sections.
+    """
+    program = f"""
+=== STUDENT'S PROGRAM ===
+{"The student's selected major is: " + user_major if user_major else ""}{major_guidance}{s["program"]}
+"""
+    student = f"""
+=== STUDENT DOCUMENT ===
+{s["student_doc"] or "No student document uploaded."}{s["profile"]}
+"""
+    question = f"""
+=== THIS QUESTION ===
+The detected intent for the current question is: {intent}
+
+=== ADVISING RECORDS (current question) ===
+{s["context"]}
+
+=== EXTRACTED RULES ===
+{s["rule_summary"]}{s["degree_audit_advisory"]}{s["prereq"]}{s["policy"]}{s["resources"]}{s["career"]}{s["recommendation"]}{s["procedures"]}{s["places"]}{s["money"]}{s["events"]}{s["logistics"]}{s["deadline"]}{s["aid"]}{s["intl"]}{s["gen_ed"]}
+
+=== THIS ANSWER ===
+REGISTER — {register}
+{either_rule}
+{no_record_rule}{_INTENT_ANSWER_RULES.get(intent, "")}{visual_directive}"""
+    return _SYSTEM_PROMPT_PREFIX + program + student + question
+
+
+def _prepare_answer(question, history, user_id, route, question_embedding=None):
+    """Everything before the model call: grounding, visual plan, prompt.
+
+    Returns a plan dict. plan["answer"] is set when the answer is deterministic
+    and no model call is needed; otherwise plan["messages"] is what to send.
+    plan["done"] is the payload of the final SSE event, minus message_id.
+
+    `question_embedding` is a precomputed embedding of the question; the async
+    pipeline awaits it before handing over. Blocking — run it on a worker
+    thread from async code.
+    """
+    intent = route["intent"]
+    user_major = route["user_major"]
+    major_kind = route["major_kind"]
+    structured_only = route["structured_only"]
+    suppress_cs_ds = route["suppress_cs_ds"]
+    use_handbook = route["use_handbook"]
+    g = route["grounding"]
+    state = route["state"]
+
     if not use_handbook:
         records = []
         rule_summary = ""
@@ -1628,9 +1910,14 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
             )
             sources = []
     else:
-        # Retrieve wide, then drop the other program's handbook/bulletin before
-        # selecting — top_k=16 so the scoped set is still deep enough.
-        retrieved_records = filter_records_by_scope(semantic_search(question, top_k=16), major_kind)
+        # Score only the student's own program (plus shared material), and ask
+        # for exactly what select_top_records keeps. Retrieving 16 across both
+        # programs and filtering afterwards could leave a CS student with two
+        # handbook chunks when the ranking happened to favour DTSCE pages.
+        retrieved_records = semantic_search(
+            question, scope=_RETRIEVAL_SCOPES.get(major_kind), quotas=record_quotas(intent),
+            question_embedding=question_embedding,
+        )
         records = select_top_records(retrieved_records, intent)
         logger.debug("ask_advisor_stream | retrieved=%d selected=%d", len(retrieved_records), len(records))
         context = build_context_from_records(records)
@@ -1638,11 +1925,9 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
         rule_summary = build_rule_summary(rules)
         sources = build_sources(records)
 
-    student_doc_context = ""
-    student_doc = get_current_student_doc(user_id) if (user_id and has_student_doc(user_id)) else {}
-
-    if user_id and has_student_doc(user_id):
-        student_doc_context = build_student_doc_context(user_id)
+    student_doc, student_doc_context = (
+        (state.doc, state.doc_context) if state.has_doc else ({}, "")
+    )
 
     doc_type = student_doc.get("doc_type") if student_doc else None
     declared = detect_declared_major(question, history, doc_type)
@@ -1669,7 +1954,7 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
     # How much visual the answer may reach for. Counted from what actually
     # matched — a block never fires on data that isn't there.
     visual_counts = _count_visual_material(
-        question, intent, user_major, student_doc, history=history
+        question, intent, user_major, student_doc, history=history, grounding=g
     )
     visual = decide_visual(question, intent, visual_counts, bool(student_doc))
     visual_directive = build_visual_directive(
@@ -1690,8 +1975,8 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
             _map_target_codes(question, history) if visual.get("block") == "map" else []
         )
         if codes:
-            done, doing = _audit_course_states(student_doc)
-            prereq_graph = build_prereq_graph(codes[0], done, in_progress=doing)
+            done, doing = g.audit_states(student_doc)
+            prereq_graph = g.prereq_graph(codes[0], done, in_progress=doing)
     prereq_snippet = _build_prereq_snippet(prereq_graph)
 
     # Payload for whichever block the policy chose. The map already has its
@@ -1702,7 +1987,7 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
         visual["data"] = prereq_graph
     elif visual.get("level", 0) >= 2 and visual.get("block"):
         visual["data"] = _build_block_data(
-            visual.get("block"), question, intent, user_major, student_doc
+            visual.get("block"), question, intent, user_major, student_doc, grounding=g
         )
         if not visual["data"]:
             visual["block"] = None
@@ -1716,11 +2001,12 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
     clubs_snippet = ""
     if intent == "career":
         clubs_snippet = build_clubs_snippet(
-            (get_profile(user_id) or {}).get("interests") if user_id else None,
+            state.profile.get("interests") if user_id else None,
             question=question,
             major=user_major or "",
+            search=g.search_clubs,
         )
-    profile_snippet = build_profile_snippet(user_id) if user_id else ""
+    profile_snippet = build_profile_snippet(user_id, state.profile) if user_id else ""
     # Logistics gets the calendar too: "when is my registration window" is a
     # steps question whose answer needs real dates.
     deadline_snippet = (
@@ -1731,18 +2017,20 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
     # retroactively withdraw" routes to `deadline` on the word "withdraw" and
     # would come back with a wall of dates — exactly the wrong answer for
     # someone who has already missed the deadline.
-    procedures_snippet = build_procedures_snippet(question)
+    procedures_snippet = build_procedures_snippet(question, find=g.find_procedures)
     # Campus places, matched on the question for the same reason procedures are:
     # "where can I study tonight" has no intent of its own and would otherwise
     # fall through to `general` with nothing behind it.
-    places_snippet = build_places_snippet(question)
-    money_snippet = build_money_snippet(question)
+    places_snippet = build_places_snippet(question, find=g.find_places)
+    money_snippet = build_money_snippet(question, find=g.find_money)
     events_snippet = build_events_snippet(
         question,
-        (get_profile(user_id) or {}).get("interests") if user_id else None,
+        state.profile.get("interests") if user_id else None,
+        find=g.find_events,
     )
+    g.log_summary()
     recommendation_snippet = (
-        _build_recommendation_snippet(user_major, student_doc)
+        _build_recommendation_snippet(user_major, student_doc, g)
         if intent == "recommendation" and user_major else ""
     )
     aid_snippet = FINANCIAL_AID_RESOURCES_SNIPPET if intent == "financial_aid" else ""
@@ -1884,107 +2172,250 @@ def ask_advisor_stream(question, history=None, user_id: str = None, major: str =
             logger.info("ask_advisor_stream | using deterministic path")
             if doc_type == "what_if_report":
                 deterministic_answer += _DEGREE_AUDIT_FOOTER
-            yield f"data: {json.dumps({'text': deterministic_answer})}\n\n"
-            message_id = save_exchange(
-                user_id, conversation_id, question, deterministic_answer, intent, sources
-            )
-            yield f"data: {json.dumps({'done': True, 'sources': sources, 'intent': intent, 'used_student_doc': True, 'message_id': message_id})}\n\n"
-            return
+            return {
+                "intent": intent, "sources": sources,
+                "answer": deterministic_answer, "messages": None,
+                "done": {"done": True, "sources": sources, "intent": intent,
+                         "used_student_doc": True},
+            }
+
+    # All context lives in the system prompt so history messages stay lightweight.
+    # The grounding sections are held to the prompt budget first: each to its
+    # own cap, then the lowest-priority ones trimmed until the whole call fits.
+    sections = {
+        "context": context, "rule_summary": rule_summary,
+        "student_doc": student_doc_context, "profile": profile_snippet,
+        "degree_audit_advisory": degree_audit_advisory, "program": program_snippet,
+        "prereq": prereq_snippet, "policy": policy_snippet,
+        "resources": resources_snippet, "career": career_snippet,
+        "recommendation": recommendation_snippet, "procedures": procedures_snippet,
+        "places": places_snippet, "money": money_snippet, "events": events_snippet,
+        "logistics": logistics_snippet, "deadline": deadline_snippet,
+        "aid": aid_snippet, "intl": intl_snippet, "gen_ed": gen_ed_snippet,
+    }
+    prompt_args = (intent, user_major, major_guidance, register,
+                   either_rule, no_record_rule, visual_directive)
+    recent_history = (history or [])[-6:]
+    fixed = count_tokens(_render_system_prompt(dict.fromkeys(sections, ""), *prompt_args))
+    fixed += sum(count_tokens(m["content"]) for m in recent_history) + count_tokens(question)
+    fitted, breakdown = fit_sections(
+        [(name, text, *_PROMPT_SECTIONS[name]) for name, text in sections.items()],
+        PROMPT_TOKEN_BUDGET - fixed,
+    )
+    if student_doc_context and not fitted["student_doc"]:
+        fitted["student_doc"] = "(Uploaded, but left out to fit the prompt budget.)"
+    system_prompt = _render_system_prompt(fitted, *prompt_args)
+    prompt_breakdown = {"budget": PROMPT_TOKEN_BUDGET, "fixed": fixed, "sections": breakdown}
+    logger.info(
+        "prompt budget | %d fixed + %d grounding of %d | %s", fixed,
+        sum(v["tokens"] for v in breakdown.values()), PROMPT_TOKEN_BUDGET,
+        " ".join(f"{name}={v['tokens']}" + (f"(<{v['trimmed_from']})" if "trimmed_from" in v else "")
+                 for name, v in breakdown.items()),
+    )
 
-    # All context lives in the system prompt so history messages stay lightweight
-    system_prompt = f"""You are ACE, the Academic Counselling Engine for Penn State University students.
-The detected intent for the current question is: {intent}
-{"The student's selected major is: " + user_major if user_major else ""}{major_guidance}
+    # Reusable only when nothing about this student or this conversation went
+    # into the prompt; then the prompt itself is the key (see answer_cache).
+    personal = bool(student_doc_context or profile_snippet or history)
+    cache_scope = None if personal else answer_scope(
+        intent, user_major, system_prompt, question, question_embedding,
+        dated=bool(fitted["deadline"] or fitted["events"]),
+    )
 
-=== ADVISING RECORDS (current question) ===
-{context}
+    # Build messages: system → history (capped at 6) → current question
+    messages_list = [{"role": "system", "content": system_prompt}]
 
-=== EXTRACTED RULES ===
-{rule_summary}
+    for msg in recent_history:
+        messages_list.append({"role": msg["role"], "content": msg["content"]})
 
-=== STUDENT DOCUMENT ===
-{student_doc_context if student_doc_context else "No student document uploaded."}{profile_snippet}{degree_audit_advisory}{program_snippet if program_snippet else ""}{prereq_snippet}{policy_snippet}{resources_snippet}{career_snippet}{recommendation_snippet}{procedures_snippet}{places_snippet}{money_snippet}{events_snippet}{logistics_snippet}{deadline_snippet}{aid_snippet}{intl_snippet}{gen_ed_snippet}
+    messages_list.append({"role": "user", "content": question})
 
-=== WHAT ACE IS FOR ===
-ACE answers questions about being a student at Penn State: degree requirements,
-courses and prerequisites, registration and deadlines, campus places and
-services, student organisations and events, procedures when something has gone
-wrong, and this student's own record. That is the whole of it.
+    return {
+        "intent": intent, "sources": sources,
+        "answer": None, "messages": messages_list, "prompt_breakdown": prompt_breakdown,
+        "cache_scope": cache_scope,
+        "done": {"done": True, "sources": sources, "intent": intent,
+                 "used_student_doc": bool(student_doc_context), "visual": visual},
+    }
 
-Anything else gets ONE short line saying it is outside what ACE does, and a
-pointer to who would know — then stop. Do not answer it anyway "just this once",
-and do not answer a diluted version of it. Specifically:
 
-- Another city, campus or institution. ACE knows Penn State. "Where should I eat
-  in New York?" is not a Penn State question, and the Penn State dining halls are
-  not an answer to it.
-- General knowledge, current events, products, sport, weather, celebrities.
-- Writing to order: poems, essays, cover letters, stories, code, translations.
-  A student asking ACE to write their essay is asking the wrong tool.
-- Medical, legal, immigration, investment or tax advice. Naming the Penn State
-  office that handles it is right; advising is not.
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
 
-NEVER mention your training data, your knowledge cutoff, what model you are, or
-what you "cannot access". A student does not need to know how you are built —
-they need to know whether you can help and who can. Say what ACE covers and
-where to go instead.
 
-=== HOW TO ANSWER ===
-SHAPE — every answer is the verdict, then the substance, then the citation.
-1. VERDICT first, in ONE line. If they asked a yes/no question, the first word is
-   Yes or No — UNLESS the grounding says ACE cannot determine it for this student
-   (no audit uploaded, no record). Then the first line says so plainly and states
-   what the rule is instead. A confident "Yes, you can" to someone whose
-   transcript ACE has never seen is a guess wearing a verdict's clothes.
-   Never open by restating the question, and never open with "Great
-   question", "As your academic counselling engine", or any preamble.
-2. SUBSTANCE — everything they asked for. Follow the VISUAL POLICY at the end:
-   when it says a block is RENDERED beneath your answer, state the point in prose
-   and let the block show the items; otherwise the items must appear in your
-   answer, because nothing else will show them.
-3. CITATION — name where it came from when a source is present. Nothing else.
+def _done_event(plan, message_id):
+    """The final SSE payload; message_id sits where it always has, before visual."""
+    done = {k: v for k, v in plan["done"].items() if k != "visual"}
+    done["message_id"] = message_id
+    if "visual" in plan["done"]:
+        done["visual"] = plan["done"]["visual"]
+    return _sse(done)
 
-REGISTER — {register}
 
-- Ground every answer in the records, rules and student document provided; use the conversation history only to follow context.
-- List courses as bullets when you are listing several — unless the VISUAL POLICY says a block is rendered, in which case list nothing; this rule loses to it. Do NOT bullet section labels (e.g. "Probability and Statistics (6 credits)") — use them as headings.
-{either_rule}
-{no_record_rule}- For contact questions, use the advisor name from the student document first; only mention department contacts as secondary.
-- Quote exact handbook language when available. Do not say "typically" or "likely" unless the records themselves are uncertain.
-- When a DEPARTMENT HANDBOOK POLICIES block is present, it outranks the advising records for procedure questions (ETM, petitions, substitutions, transfer credit, who to contact). Use its exact numbers and name the step the student has to take.
-- Never invent courses, policies, contacts, grades, or substitutions not present in the records.
-- If records are insufficient, say so clearly.
-- Do not mention internal record numbers.
-- If a Degree Audit Advisory is present above, include the recommendation naturally in your answer when it is relevant to what the student asked.
-- Be specific. A student can act on "email the Bursar at 814-865-2979"; they cannot act on "contact the appropriate office".
-{_INTENT_ANSWER_RULES.get(intent, "")}{visual_directive}"""
+def _cached_answer(plan):
+    """A stored answer for this plan, or None — counting the lookup either way."""
+    cache = get_answer_cache()
+    if cache is None:
+        return None
+    if plan["cache_scope"] is None:
+        cache.skip()
+        return None
+    answer = cache.lookup(plan["cache_scope"])
+    if answer is not None:
+        logger.info("answer cache | hit | intent=%r", plan["intent"])
+    return answer
 
-    try:
-        # Build messages: system → history (capped at 6) → current question
-        messages_list = [{"role": "system", "content": system_prompt}]
 
-        if history:
-            for msg in history[-6:]:
-                messages_list.append({"role": msg["role"], "content": msg["content"]})
+def _store_answer(plan, answer):
+    cache = get_answer_cache()
+    if cache is not None and plan["cache_scope"] is not None:
+        cache.store(plan["cache_scope"], answer)
+
+
+def _after_answer(message_id, answer, sources, user_id, question):
+    """Queue what follows a streamed answer: its transcript row, then profile
+    learning from what the student said. Neither sits in front of the done frame."""
+    work = get_work_queue()
+    work.submit(finish_exchange, message_id, answer, sources)
+    work.submit(remember, user_id, question)
+
+
+def ask_advisor_stream(question, history=None, user_id: str = None, major: str = None,
+                       conversation_id: str = None):
+    """Generator that yields SSE-formatted chunks for the chat response.
+
+    history: list of {"role": "user"|"assistant", "content": str} dicts
+             representing the prior conversation turns.
+    user_id: Clerk user ID of the signed-in student; used to look up their
+             uploaded document and (if `major` is not given) their major.
+    major:   Optional explicit program name to ground on, bypassing the DB
+             lookup. Used by the eval harness to test a major without a
+             persisted user. Falls back to the user's stored major when None.
 
-        messages_list.append({"role": "user", "content": question})
+    The blocking twin of aask_advisor_stream, kept for the eval runner and
+    scripts; /chat/stream serves the async one.
+    """
+    state = load_student_state(user_id) if user_id else StudentState()
+    route = _route_question(question, state, major)
+    plan = _prepare_answer(question, history, user_id, route)
+    intent = plan["intent"]
+
+    if plan["answer"] is not None:
+        logger.info("ask_advisor_stream | using deterministic path")
+        yield _sse({"text": plan["answer"]})
+        message_id = save_exchange(
+            user_id, conversation_id, question, plan["answer"], intent, plan["sources"]
+        )
+        yield _done_event(plan, message_id)
+        return
 
+    # The transcript rows go in before the model call, so the done frame has its
+    # message id the moment the last token is out.
+    message_id = reserve_exchange(user_id, conversation_id, question, intent)
+    finished = False
+    try:
+        messages_list = plan["messages"]
         logger.info("ask_advisor_stream | calling model=%r messages=%d", llm.CHAT_MODEL, len(messages_list))
 
+        # A cached answer replays as one chunk, with no model call behind it.
+        cached = _cached_answer(plan)
+        deltas = [cached] if cached is not None else llm.chat_stream(
+            messages_list, user_id=user_id, prompt_breakdown=plan["prompt_breakdown"])
         answer_parts = []
-        for delta in llm.chat_stream(messages_list, user_id=user_id):
+        for delta in deltas:
             answer_parts.append(delta)
-            yield f"data: {json.dumps({'text': delta})}\n\n"
+            yield _sse({"text": delta})
+        if cached is None:
+            _store_answer(plan, "".join(answer_parts))
 
-        logger.info("ask_advisor_stream | stream complete | sources=%d", len(sources))
-        message_id = save_exchange(
-            user_id, conversation_id, question, "".join(answer_parts), intent, sources
-        )
-        # Learn from what the student said, after their answer is already on
-        # screen — the extraction call must never sit in front of the response.
-        remember(user_id, question)
-        yield f"data: {json.dumps({'done': True, 'sources': sources, 'intent': intent, 'used_student_doc': bool(student_doc_context), 'message_id': message_id, 'visual': visual})}\n\n"
+        logger.info("ask_advisor_stream | stream complete | sources=%d", len(plan["sources"]))
+        _after_answer(message_id, "".join(answer_parts), plan["sources"], user_id, question)
+        finished = True
+        yield _done_event(plan, message_id)
 
     except Exception as e:
         logger.error("ask_advisor_stream | error: %s", e, exc_info=True)
-        yield f"data: {json.dumps({'error': str(e), 'done': True, 'sources': [], 'intent': intent})}\n\n"
\ No newline at end of file
+        yield _sse({"error": str(e), "done": True, "sources": [], "intent": intent})
+    finally:
+        # An error or a disconnected client: the reserved rows are never filled.
+        if not finished:
+            get_work_queue().submit(finish_exchange, message_id, "", None)
+
+
+def _discard_reservation(reserving):
+    """Done-callback: queue the removal of an exchange whose answer never came."""
+    if not reserving.cancelled() and reserving.exception() is None:
+        get_work_queue().submit(finish_exchange, reserving.result(), "", None)
+
+
+async def _replay(answer):
+    yield answer
+
+
+async def aask_advisor_stream(question, history=None, user_id: str = None, major: str = None,
+                              conversation_id: str = None):
+    """Async generator twin of ask_advisor_stream — same arguments, same events.
+
+    Nothing here blocks the event loop. The student's state is read in one
+    query, and routed, on worker threads; the question embedding, when the
+    handbook is consulted, is awaited on the pooled async client; the rest of
+    the grounding is CPU-bound and runs on a thread; the model stream is
+    awaited. The transcript write and profile learning go to the post-answer
+    work queue, so the done frame follows the last token directly.
+    """
+    state = await asyncio.to_thread(load_student_state, user_id) if user_id else StudentState()
+    route = await asyncio.to_thread(_route_question, question, state, major)
+    question_embedding = await aembed_question(question) if route["use_handbook"] else None
+    plan = await asyncio.to_thread(
+        _prepare_answer, question, history, user_id, route, question_embedding,
+    )
+    intent = plan["intent"]
+
+    if plan["answer"] is not None:
+        logger.info("aask_advisor_stream | using deterministic path")
+        yield _sse({"text": plan["answer"]})
+        message_id = await asyncio.to_thread(
+            save_exchange, user_id, conversation_id, question, plan["answer"], intent, plan["sources"],
+        )
+        yield _done_event(plan, message_id)
+        return
+
+    # Inserted while the model answers; awaited only for the done frame's id.
+    reserving = asyncio.ensure_future(asyncio.to_thread(
+        reserve_exchange, user_id, conversation_id, question, intent,
+    ))
+    finished = False
+    try:
+        messages_list = plan["messages"]
+        logger.info("aask_advisor_stream | calling model=%r messages=%d", llm.CHAT_MODEL, len(messages_list))
+
+        # On the SQLite backend a lookup or store is a write and a commit behind
+        # other workers' — off the loop, like every other database call here.
+        cached = await asyncio.to_thread(_cached_answer, plan)
+        deltas = _replay(cached) if cached is not None else llm.achat_stream(
+            messages_list, user_id=user_id, prompt_breakdown=plan["prompt_breakdown"])
+        answer_parts = []
+        async for delta in deltas:
+            answer_parts.append(delta)
+            yield _sse({"text": delta})
+        if cached is None:
+            await asyncio.to_thread(_store_answer, plan, "".join(answer_parts))
+
+        logger.info("aask_advisor_stream | stream complete | sources=%d", len(plan["sources"]))
+        # Shielded: a client that leaves now must not cancel the insert under us.
+        message_id = await asyncio.shield(reserving)
+        _after_answer(message_id, "".join(answer_parts), plan["sources"], user_id, question)
+        finished = True
+        yield _done_event(plan, message_id)
+
+    except Exception as e:
+        logger.error("aask_advisor_stream | error: %s", e, exc_info=True)
+        yield _sse({"error": str(e), "done": True, "sources": [], "intent": intent})
+    finally:
+        # An error or a disconnected client: the reserved rows are never filled.
+        # Dropped from a callback on the insert itself — a disconnect cancels the
+        # whole scope, this await included, and the cleanup must not ride on it.
+        if not finished:
+            reserving.add_done_callback(_discard_reservation)
+            # Still waited for (wait() neither raises the insert's error nor
+            # cancels it), so a loop closing right after cannot cancel the insert.
+            await asyncio.wait([reserving])
\ No newline at end of file
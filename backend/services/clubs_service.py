@@ -166,13 +166,15 @@ def _major_terms(major: str) -> list[str]:
     return [re.split(r"\s*,\s*", major)[0]]
 
 
-def build_clubs_snippet(interests, question="", major="") -> str:
+def build_clubs_snippet(interests, question="", major="", search=search_clubs) -> str:
     """Grounding for a clubs question. '' when the dataset can't help.
 
     Three sources, in descending order of how much they say about this student:
     what ACE has learned they like, the words of the question ("are there dance
     clubs?"), and failing both, their major — "what clubs should I join as a CS
     major?" is all scaffolding words, but the major itself is a real signal.
+
+    `search` stands in for search_clubs — chat_service passes its per-request memo.
     """
     if not load_clubs():
         return ""
@@ -195,7 +197,7 @@ def build_clubs_snippet(interests, question="", major="") -> str:
          ("major", field))
     )
     for basis, terms in order:
-        matches = search_clubs(terms)
+        matches = search(terms)
         if matches:
             break
     if not matches:
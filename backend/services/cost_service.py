@@ -7,6 +7,7 @@ Single source of truth for model pricing and per-call cost. Powers BOTH:
 
 Prices are USD per 1,000,000 tokens. Update when OpenAI changes pricing.
 """
+import json
 import logging
 from datetime import datetime, timezone, timedelta
 
@@ -61,9 +62,12 @@ def tokens_from_usage(usage):
     return int(inp), int(out), int(cached)
 
 
-def record_usage(feature, model, usage, user_id=None):
+def record_usage(feature, model, usage, user_id=None, prompt_breakdown=None):
     """Persist one call's tokens + computed cost. Best-effort: never raises
-    into the caller — cost logging must not break a chat or a search."""
+    into the caller — cost logging must not break a chat or a search.
+
+    prompt_breakdown is the chat prompt's per-section token count
+    (prompt_budget.fit_sections), stored as JSON beside the totals."""
     try:
         from backend.database import SessionLocal
         from backend.models import ApiUsage
@@ -75,6 +79,7 @@ def record_usage(feature, model, usage, user_id=None):
                 feature=feature, model=model,
                 input_tokens=inp, output_tokens=out, cached_tokens=cached,
                 cost_usd=cost, user_id=user_id,
+                prompt_breakdown_json=json.dumps(prompt_breakdown) if prompt_breakdown else None,
             ))
             db.commit()
         finally:
@@ -100,14 +105,19 @@ def summarize(db):
             func.coalesce(func.sum(ApiUsage.input_tokens), 0),
             func.coalesce(func.sum(ApiUsage.output_tokens), 0),
             func.coalesce(func.sum(ApiUsage.cost_usd), 0.0),
+            func.coalesce(func.sum(ApiUsage.cached_tokens), 0),
         )
         if since is not None:
             q = q.filter(ApiUsage.created_at >= since)
-        calls, inp, out, cost = q.one()
+        calls, inp, out, cost, cached = q.one()
         return {
             "calls": int(calls or 0),
             "input_tokens": int(inp or 0),
             "output_tokens": int(out or 0),
+            "cached_input_tokens": int(cached or 0),
+            # Share of input tokens served from the provider's prompt cache —
+            # how well the prefix-stable system prompt is paying off.
+            "cached_input_ratio": round(int(cached or 0) / int(inp), 4) if inp else 0.0,
             "cost_usd": round(float(cost or 0.0), 4),
         }
 
@@ -0,0 +1,232 @@
+"""Query-embedding cache in front of llm.embed.
+
+Every handbook-path question is embedded before retrieval — a 100–300 ms round
+trip. Students in one cohort ask the same questions ("what is ETM?") within
+minutes of each other, so the same text was being embedded over and over.
+
+The cache is keyed on the normalised question (case and whitespace folded) plus
+the embedding model, bounded LRU, with an optional TTL. Two backends:
+
+    memory  per-process OrderedDict (default) — nothing to set up
+    sqlite  one file on disk, shared by every uvicorn worker on the host
+
+Only a miss reaches the provider, so only a miss is metered in api_usage.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from backend.config import (
+    QUERY_EMBED_CACHE_BACKEND, QUERY_EMBED_CACHE_PATH,
+    QUERY_EMBED_CACHE_SIZE, QUERY_EMBED_CACHE_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(text):
+    """The cache's notion of "the same question": case and spacing don't count."""
+    return " ".join(str(text).split()).casefold()
+
+
+def cache_key(text, model):
+    return hashlib.sha256(f"{model}\n{normalize_question(text)}".encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """LRU in this process only. Entries are (vector, stored_at)."""
+
+    def __init__(self, maxsize=QUERY_EMBED_CACHE_SIZE, ttl=QUERY_EMBED_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            vector, stored_at = entry
+            if self.ttl and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return vector
+
+    def set(self, key, vector):
+        with self._lock:
+            self._entries[key] = (vector, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteBackend:
+    """LRU in a SQLite file, so every worker on the host shares one cache.
+
+    Vectors are stored as float32 bytes — the retrieval matrix is float32, so
+    nothing is lost that retrieval would have kept.
+    """
+
+    def __init__(self, path=QUERY_EMBED_CACHE_PATH, maxsize=QUERY_EMBED_CACHE_SIZE,
+                 ttl=QUERY_EMBED_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL,"
+            " stored_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, stored_at FROM query_embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM query_embeddings WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE query_embeddings SET used_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def set(self, key, vector):
+        now = time.time()
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, vector, stored_at, used_at)"
+                " VALUES (?, ?, ?, ?)", (key, blob, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM query_embeddings WHERE key IN ("
+                " SELECT key FROM query_embeddings ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.maxsize,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM query_embeddings")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+
+class EmbeddingCache:
+    """get-or-embed over a backend, counting hits and misses for this process."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key):
+        try:
+            vector = self.backend.get(key)
+        except Exception as exc:
+            logger.warning("embedding cache read failed: %s", exc)
+            vector = None
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+
+    def _store(self, key, vector):
+        try:
+            self.backend.set(key, vector)
+        except Exception as exc:
+            logger.warning("embedding cache write failed: %s", exc)
+
+    def get_or_embed(self, text, model, embed):
+        """Cached vector for (text, model), else embed(text) — stored, then returned.
+
+        A backend failure is logged and treated as a miss: the cache must never
+        be the reason a question goes unanswered.
+        """
+        key = cache_key(text, model)
+        vector = self._lookup(key)
+        if vector is None:
+            vector = embed(text)
+            self._store(key, vector)
+        return vector
+
+    async def aget_or_embed(self, text, model, aembed):
+        """get_or_embed with an awaitable aembed(text) for the miss.
+
+        In memory the backend is a dict lookup and runs inline. In SQLite even
+        a hit is an UPDATE and a commit, which waits on any other worker holding
+        the write lock — so those calls go to a thread, off the event loop.
+        """
+        key = cache_key(text, model)
+        if isinstance(self.backend, SqliteBackend):
+            vector = await asyncio.to_thread(self._lookup, key)
+            if vector is None:
+                vector = await aembed(text)
+                await asyncio.to_thread(self._store, key, vector)
+            return vector
+        vector = self._lookup(key)
+        if vector is None:
+            vector = await aembed(text)
+            self._store(key, vector)
+        return vector
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": len(self.backend),
+        }
+
+    def clear(self):
+        self.backend.clear()
+        self.hits = self.misses = 0
+
+
+_query_cache = None
+
+
+def get_query_cache():
+    """The process-wide cache, built from config on first use."""
+    global _query_cache
+
+    if _query_cache is None:
+        if QUERY_EMBED_CACHE_BACKEND == "sqlite":
+            backend = SqliteBackend()
+        else:
+            backend = MemoryBackend()
+        _query_cache = EmbeddingCache(backend)
+        logger.info("Query-embedding cache: %s (max %d, ttl %ss)",
+                    type(backend).__name__, backend.maxsize, backend.ttl or "none")
+    return _query_cache
@@ -1,8 +1,28 @@
+import logging
+import math
 import re
 import numpy as np
-from backend.services.index_service import load_index, get_embedding
+from backend.config import (
+    RETRIEVAL_MODE, HYBRID_FUSION, HYBRID_DENSE_WEIGHT, HYBRID_BM25_WEIGHT,
+    HYBRID_RRF_K, BM25_K1, BM25_B,
+    RETRIEVAL_ANN, ANN_MIN_RECORDS, ANN_N_PROBE, ANN_KMEANS_ITERS, ANN_LEXICAL_TOP,
+)
+from backend.services.ann_index import IVFIndex
+from backend.services.embedding_cache import get_query_cache
+from backend.services.index_service import (
+    load_index, load_index_columns, get_embedding, normalize_rows,
+)
+from backend.services import llm
+from backend.services.llm import EMBEDDING_MODEL
+
+logger = logging.getLogger(__name__)
 
 _cached_records = None
+# The scoring matrix, built once per worker from the loaded index. semantic_search
+# used to rebuild two np.arrays and two norms per record per question — 73 tiny
+# Python-level dot products, and the count grows with every handbook we add. Now
+# the rows are normalised up front, so cosine is one matrix-vector product.
+_retrieval_index = None
 
 
 def cosine_similarity(a, b):
@@ -40,9 +60,103 @@ def get_all_records_with_embeddings():
     return _cached_records
 
 
-def keyword_score(question, record):
-    q = question.lower()
-    content = " ".join([
+# Program scopes the corpus is partitioned by, matched in a record's
+# source_name ("CMPSC-handbook-2024-2025.pdf", "DTSCE University Bulletin").
+# A record can also name its scope outright with a "scope" field.
+SCOPE_MARKERS = ("cmpsc", "dtsce")
+
+
+def record_scope(record):
+    """The program a record belongs to, or None for material shared by all."""
+    if record.get("scope"):
+        return str(record["scope"]).lower()
+    source = str(record.get("source_name", "")).lower()
+    return next((marker for marker in SCOPE_MARKERS if marker in source), None)
+
+
+def _build_partitions(records):
+    """scope → ascending row ids of that scope's records (None: shared ones)."""
+    partitions = {}
+    for i, record in enumerate(records):
+        partitions.setdefault(record_scope(record), []).append(i)
+    return {scope: np.array(ids, dtype=np.intp) for scope, ids in partitions.items()}
+
+
+def _scope_rows(partitions, scope):
+    """Rows a query scoped to `scope` scores: its partition plus shared records.
+
+    None when there is nothing to narrow to — no scope asked for, or a scope
+    with no records of its own (answer from everything rather than nothing).
+    """
+    if scope is None or scope not in partitions:
+        return None
+    shared = partitions.get(None)
+    if shared is None:
+        return partitions[scope]
+    return np.union1d(partitions[scope], shared)
+
+
+def _build_ann(matrix, partitions, ann=RETRIEVAL_ANN, min_records=ANN_MIN_RECORDS):
+    """One IVF per scope big enough to need it (over its partition plus shared
+    rows), plus one over every row (key "*") for unscoped queries. Empty when
+    ANN is off."""
+    if ann == "off":
+        return {}
+    if ann != "ivf":
+        raise ValueError(f"unknown RETRIEVAL_ANN {ann!r}; expected 'off' or 'ivf'")
+    targets = [("*", np.arange(matrix.shape[0], dtype=np.intp))]
+    targets += [(scope, _scope_rows(partitions, scope)) for scope in partitions if scope is not None]
+    return {
+        key: IVFIndex(matrix, rows, iterations=ANN_KMEANS_ITERS)
+        for key, rows in targets
+        if len(rows) >= min_records
+    }
+
+
+def build_retrieval_index(records, matrix=None, ann=RETRIEVAL_ANN, ann_min_records=ANN_MIN_RECORDS):
+    """Pre-normalised embedding matrix, the records it was built from, their
+    lexical and BM25 indexes, the row ids of each scope, and (when enabled)
+    an ANN index per large partition.
+
+    With `matrix` given, it is taken as already unit-normalised with row i
+    belonging to records[i] — the shape index_service loads from disk, often a
+    read-only memory map that must not be copied. Otherwise the matrix is built
+    from each record's "embedding"; records without one are left out, exactly
+    as the per-record loop skipped them. A zero row scores 0.0, the same answer
+    cosine_similarity gives for a zero vector.
+    """
+    if matrix is not None:
+        kept = list(records)
+    else:
+        kept = [r for r in records if r.get("embedding") is not None]
+        if kept:
+            matrix = normalize_rows([r["embedding"] for r in kept])
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+    logger.info("Retrieval index: %d records × %d dims", matrix.shape[0],
+                matrix.shape[1] if matrix.ndim == 2 else 0)
+    partitions = _build_partitions(kept)
+    return {
+        "matrix": matrix,
+        "records": kept,
+        "lexical": build_lexical_index(kept),
+        "bm25": build_bm25_index(kept),
+        "partitions": partitions,
+        "ann": _build_ann(matrix, partitions, ann, ann_min_records),
+    }
+
+
+def get_retrieval_index():
+    global _retrieval_index
+
+    if _retrieval_index is None:
+        records, matrix = load_index_columns()
+        _retrieval_index = build_retrieval_index(records, matrix)
+    return _retrieval_index
+
+
+def _keyword_text(record):
+    return " ".join([
         str(record.get("Title", "")),
         str(record.get("Category", "")),
         str(record.get("Subcategory", "")),
@@ -50,6 +164,19 @@ def keyword_score(question, record):
         str(record.get("Content", "")),
     ]).lower()
 
+
+def _course_code_text(record):
+    return " ".join([
+        str(record.get("Title", "")),
+        str(record.get("Content", "")),
+        str(record.get("Subcategory", "")),
+    ]).upper()
+
+
+def keyword_score(question, record):
+    q = question.lower()
+    content = _keyword_text(record)
+
     score = 0
 
     for word in q.split():
@@ -65,11 +192,7 @@ def course_code_score(question, record):
     if not question_codes:
         return 0.0
 
-    record_text = " ".join([
-        str(record.get("Title", "")),
-        str(record.get("Content", "")),
-        str(record.get("Subcategory", "")),
-    ]).upper()
+    record_text = _course_code_text(record)
 
     score = 0.0
 
@@ -80,25 +203,316 @@ def course_code_score(question, record):
     return score
 
 
-def semantic_search(question, top_k=10):
-    question_embedding = get_embedding(question, record=True)
-    records = get_all_records_with_embeddings()
-
-    scored_records = []
-
-    for record in records:
-        embedding = record.get("embedding")
-        if embedding is None:
+# Every "LETTERS ###" / "LETTERS###" substring of a record, overlapping — the
+# lookahead matches at every start position. A question code (see
+# extract_course_codes) is a substring of the record text exactly when it is one
+# of these, so a posting-list lookup agrees with course_code_score's `in`.
+_CODE_SUBSTRINGS = re.compile(r"(?=([A-Z]{2,6} ?\d{3}))")
+
+# Query words seen so far → records containing them; bounded so a long-lived
+# worker doesn't keep every word it has ever been asked.
+_WORD_MEMO_MAX = 4096
+
+
+def _running_sums(step, n):
+    """[0, step, step+step, …] added one at a time, as the scoring loops do, so
+    a looked-up total is bit-identical to the loop's, not just close."""
+    sums = [0.0]
+    for _ in range(n):
+        sums.append(sums[-1] + step)
+    return np.array(sums)
+
+
+def build_lexical_index(records):
+    """Inverted indexes behind keyword_score and course_code_score.
+
+    keyword_score asks whether each query word is a substring of a record's
+    lowercased text. A query word has no whitespace, so it can only match inside
+    one whitespace-separated token; "tokens" maps each distinct token to the
+    records holding it, and a word's records are the union over the tokens that
+    contain it — a scan of the vocabulary once per new word, not of every record
+    per question. "codes" maps every course-code-shaped substring of a record's
+    uppercased text to the records holding it.
+    """
+    tokens, codes = {}, {}
+    for i, record in enumerate(records):
+        for token in set(_keyword_text(record).split()):
+            tokens.setdefault(token, []).append(i)
+        for code in set(_CODE_SUBSTRINGS.findall(_course_code_text(record))):
+            codes.setdefault(code, []).append(i)
+
+    as_array = lambda ids: np.array(ids, dtype=np.intp)  # noqa: E731
+    return {
+        "size": len(records),
+        "tokens": {t: as_array(ids) for t, ids in tokens.items()},
+        "codes": {c: as_array(ids) for c, ids in codes.items()},
+        "words": {},
+    }
+
+
+def _records_containing(lexical, word):
+    words = lexical["words"]
+    hits = words.get(word)
+    if hits is None:
+        matched = [ids for token, ids in lexical["tokens"].items() if word in token]
+        hits = np.unique(np.concatenate(matched)) if matched else np.zeros(0, dtype=np.intp)
+        if len(words) >= _WORD_MEMO_MAX:
+            words.clear()
+        words[word] = hits
+    return hits
+
+
+def lexical_boosts(question, lexical):
+    """keyword_score + course_code_score for every record, as one float array.
+
+    Identical, value for value, to calling the two functions per record.
+    """
+    n = lexical["size"]
+    keyword_hits = np.zeros(n, dtype=np.intp)
+    words = [w for w in question.lower().split() if len(w) >= 4]
+    for word in words:
+        keyword_hits[_records_containing(lexical, word)] += 1
+
+    code_hits = np.zeros(n, dtype=np.intp)
+    codes = extract_course_codes(question)
+    for code in codes:
+        ids = lexical["codes"].get(code)
+        if ids is not None:
+            code_hits[ids] += 1
+
+    return (_running_sums(0.05, len(words))[keyword_hits]
+            + _running_sums(0.35, len(codes))[code_hits])
+
+
+def _top_k_indices(scores, top_k):
+    """Indices of the top_k scores, best first.
+
+    argpartition finds the top_k without sorting the whole array; only those are
+    then sorted. Ties keep index order, as the stable sort this replaced did.
+    """
+    n = scores.shape[0]
+    if top_k <= 0 or n == 0:
+        return np.zeros(0, dtype=np.intp)
+    if top_k < n:
+        # Widen the cut to everything tied with the k-th score, so which of the
+        # tied records survive is decided by index order and not by partition.
+        kth = scores[np.argpartition(scores, n - top_k)[n - top_k]]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(n)
+    order = np.lexsort((candidates, -scores[candidates]))
+    return candidates[order][:top_k]
+
+
+def embed_question(question):
+    """The question's embedding, from the query cache when it has been asked before."""
+    return get_query_cache().get_or_embed(
+        question, EMBEDDING_MODEL, lambda text: get_embedding(text, record=True),
+    )
+
+
+# Words for BM25: letters/digits runs, plus each course code run together
+# ("cmpsc 465" → also "cmpsc465"), so a code is one rare term, not a common
+# department name and a number that also appears in page counts and dates.
+_BM25_WORDS = re.compile(r"[a-z0-9]+")
+_BM25_CODES = re.compile(r"\b([a-z]{2,6})\s?(\d{3})\b")
+
+
+def bm25_tokens(text):
+    text = text.lower()
+    return _BM25_WORDS.findall(text) + [a + b for a, b in _BM25_CODES.findall(text)]
+
+
+def build_bm25_index(records):
+    """Postings (term → record ids, term frequencies), document lengths and
+    IDFs for BM25 over the same fields keyword_score reads."""
+    postings = {}
+    lengths = np.zeros(len(records), dtype=np.float64)
+    for i, record in enumerate(records):
+        terms = bm25_tokens(_keyword_text(record))
+        lengths[i] = len(terms)
+        counts = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, tf in counts.items():
+            ids, tfs = postings.setdefault(term, ([], []))
+            ids.append(i)
+            tfs.append(tf)
+
+    n = len(records)
+    return {
+        "size": n,
+        "lengths": lengths,
+        "avg_length": float(lengths.mean()) if n and lengths.sum() else 1.0,
+        "postings": {
+            term: (np.array(ids, dtype=np.intp), np.array(tfs, dtype=np.float64),
+                   math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5)))
+            for term, (ids, tfs) in postings.items()
+        },
+    }
+
+
+def bm25_scores(question, bm25, k1=BM25_K1, b=BM25_B):
+    scores = np.zeros(bm25["size"], dtype=np.float64)
+    norm = k1 * (1 - b + b * bm25["lengths"] / bm25["avg_length"])
+    for term in dict.fromkeys(bm25_tokens(question)):
+        posting = bm25["postings"].get(term)
+        if posting is None:
             continue
-
-        semantic = cosine_similarity(question_embedding, embedding)
-        keyword = keyword_score(question, record)
-        course_boost = course_code_score(question, record)
-
-        final_score = semantic + keyword + course_boost
-        scored_records.append((final_score, record))
-
-    scored_records.sort(key=lambda x: x[0], reverse=True)
-
-    top_records = [record for score, record in scored_records[:top_k]]
-    return top_records
\ No newline at end of file
+        ids, tfs, idf = posting
+        scores[ids] += idf * tfs * (k1 + 1) / (tfs + norm[ids])
+    return scores
+
+
+def _ranks(scores):
+    """1-based rank of each score, best first; ties keep index order."""
+    ranks = np.empty(scores.shape[0], dtype=np.float64)
+    ranks[np.lexsort((np.arange(scores.shape[0]), -scores))] = np.arange(1, scores.shape[0] + 1)
+    return ranks
+
+
+def _min_max(scores):
+    span = scores.max() - scores.min() if scores.size else 0.0
+    return (scores - scores.min()) / span if span > 0 else np.zeros_like(scores)
+
+
+def fuse_scores(dense, lexical, fusion=HYBRID_FUSION, dense_weight=HYBRID_DENSE_WEIGHT,
+                lexical_weight=HYBRID_BM25_WEIGHT, rrf_k=HYBRID_RRF_K):
+    """One ranking from a dense and a lexical score per record.
+
+    "rrf" (reciprocal-rank fusion) adds weight / (rrf_k + rank) from each list,
+    so the two scales never have to agree; a record no query term matched gets
+    nothing from the lexical side. "weighted" min-max scales both to [0, 1] and
+    takes the weighted sum.
+    """
+    if fusion == "rrf":
+        lexical_part = np.where(lexical > 0, lexical_weight / (rrf_k + _ranks(lexical)), 0.0)
+        return dense_weight / (rrf_k + _ranks(dense)) + lexical_part
+    if fusion == "weighted":
+        return dense_weight * _min_max(dense) + lexical_weight * _min_max(lexical)
+    raise ValueError(f"unknown fusion {fusion!r}; expected 'rrf' or 'weighted'")
+
+
+def _strong_lexical_rows(index, question, lexical, rows, top=ANN_LEXICAL_TOP):
+    """Rows the lexical side vouches for: every record holding a course code the
+    question names, plus the `top` best lexical scores within `rows`.
+
+    Not every row with a nonzero score — any shared 4+ letter word ("what",
+    "courses") earns the flat keyword boost, which is most of the partition.
+    """
+    codes = index["lexical"]["codes"]
+    matched = [codes[code] for code in extract_course_codes(question) if code in codes]
+    hits = np.unique(np.concatenate(matched)) if matched else np.zeros(0, dtype=np.intp)
+    if rows is not None:
+        hits = np.intersect1d(hits, rows, assume_unique=True)
+
+    scoped = lexical if rows is None else lexical[rows]
+    if scoped.shape[0] > top:
+        best = np.argpartition(-scoped, top)[:top]
+    else:
+        best = np.arange(scoped.shape[0])
+    best = best[scoped[best] > 0]
+    return np.union1d(hits, best if rows is None else rows[best])
+
+
+def _rows_to_score(index, scope, query, question, lexical, top_k):
+    """Row ids semantic_search scores, ascending, or None for every row.
+
+    A scope narrows to its partition plus shared records (see _scope_rows).
+    With ANN on, a partition that has an IVF narrows further to the probed
+    clusters — plus the strongest lexical matches (see _strong_lexical_rows),
+    so a course code or rare term the clusters missed is still scored.
+    """
+    rows = _scope_rows(index["partitions"], scope)
+    ann = index["ann"].get("*" if rows is None else scope)
+    if ann is None:
+        return rows
+
+    probed = ann.search(query, ANN_N_PROBE, min_candidates=top_k)
+    return np.union1d(probed, _strong_lexical_rows(index, question, lexical, rows))
+
+
+def _take_quotas(ranked, records, quotas):
+    """Walk row ids best-first, keeping up to quotas[source_type] of each type."""
+    remaining = dict(quotas)
+    left = sum(remaining.values())
+    picked = []
+    for i in ranked:
+        if left == 0:
+            break
+        source_type = records[i].get("source_type")
+        if remaining.get(source_type, 0) > 0:
+            remaining[source_type] -= 1
+            left -= 1
+            picked.append(i)
+    return picked
+
+
+async def aembed_question(question):
+    """embed_question for async callers: a cache miss awaits llm.aembed."""
+    return await get_query_cache().aget_or_embed(
+        question, EMBEDDING_MODEL, lambda text: llm.aembed(text, record=True),
+    )
+
+
+def semantic_search(question, top_k=10, mode=None, scope=None, quotas=None,
+                    question_embedding=None):
+    """The top_k handbook/bulletin records for a question, best first.
+
+    mode "dense" scores cosine similarity plus flat keyword and course-code
+    boosts; "hybrid" fuses cosine with BM25 (see fuse_scores). Defaults to
+    RETRIEVAL_MODE. scope (see record_scope) scores only that program's
+    partition plus shared records, instead of filtering after ranking.
+    quotas ({source_type: count}) replaces top_k: the best `count` records of
+    each source type, still in overall rank order. question_embedding skips
+    embedding the question, for callers that already have it.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in ("dense", "hybrid"):
+        raise ValueError(f"unknown retrieval mode {mode!r}; expected 'dense' or 'hybrid'")
+
+    if question_embedding is None:
+        question_embedding = embed_question(question)
+    index = get_retrieval_index()
+    records = index["records"]
+
+    if not records:
+        return []
+
+    query = np.asarray(question_embedding, dtype=np.float32)
+    query_norm = np.linalg.norm(query)
+    if query_norm != 0:
+        query = query / query_norm
+
+    if mode == "hybrid":
+        lexical = bm25_scores(question, index["bm25"])
+    else:
+        lexical = lexical_boosts(question, index["lexical"])
+
+    if quotas is not None:
+        top_k = sum(quotas.values())
+    rows = _rows_to_score(index, scope, query, question, lexical, top_k)
+    matrix = index["matrix"] if rows is None else index["matrix"][rows]
+    if rows is not None:
+        lexical = lexical[rows]
+
+    if query_norm == 0:
+        semantic = np.zeros(matrix.shape[0], dtype=np.float64)
+    else:
+        semantic = (matrix @ query).astype(np.float64)
+
+    if mode == "hybrid":
+        scores = fuse_scores(semantic, lexical)
+    else:
+        scores = semantic + lexical
+
+    if quotas is None:
+        top = _top_k_indices(scores, top_k)
+    else:
+        # Quotas can reach past the overall top_k (four handbook chunks ranked
+        # below five bulletin ones), so rank every scored row.
+        top = _top_k_indices(scores, scores.shape[0])
+    ranked = top if rows is None else rows[top]
+    if quotas is not None:
+        ranked = _take_quotas(ranked, records, quotas)
+    return [records[i] for i in ranked]
@@ -177,8 +177,11 @@ def format_event(e: dict) -> str:
     return line + extra
 
 
-def build_events_snippet(question: str, interests=None) -> str:
-    """Grounding for "what's happening". '' when the question isn't about events."""
+def build_events_snippet(question: str, interests=None, find=find_events) -> str:
+    """Grounding for "what's happening". '' when the question isn't about events.
+
+    `find` stands in for find_events — chat_service passes its per-request memo.
+    """
     if not mentions_events(question):
         return ""
     if not _load():
@@ -193,7 +196,7 @@ def build_events_snippet(question: str, interests=None) -> str:
             f"event. Tell the student to check {EVENTS_PAGE} for what is on."
         )
 
-    matches = find_events(question, interests)
+    matches = find(question, interests)
     if not matches:
         return ""
 
@@ -1,15 +1,47 @@
+"""Build and load the CMPSC/DTSCE handbook retrieval index.
+
+On disk the index is two files, written together:
+
+    ace_index.npy        float32 [records × dims], rows unit-normalised
+    ace_index.meta.json  format version, model, dims, and one metadata dict
+                         per row (everything a record carries except its vector)
+
+The old format was one pickle holding a list of dicts, each with its embedding
+as a list of 1,536 Python floats — ~110k float objects unpickled into every
+uvicorn worker before the first question. The .npy is opened with
+mmap_mode="r", so workers share the same page-cache pages and a cold start
+allocates nothing per vector. The legacy pickle is still read when the new
+files are absent, so an old checkout keeps working until it is rebuilt.
+
+Each record's metadata carries "content_hash", the SHA-256 of the text that was
+embedded for it. build_index() re-embeds only records whose hash the previous
+index does not already hold, so refreshing one bulletin page costs one embedding.
+"""
+
+import hashlib
+import json
 import logging
 import os
 import pickle
+from datetime import datetime, timezone
+
+import numpy as np
 from dotenv import load_dotenv
-from backend.config import INDEX_FILE
+from backend.config import (
+    INDEX_FILE, INDEX_EMBEDDINGS_FILE, INDEX_META_FILE, OPENAI_EMBEDDING_MODEL,
+)
 from backend.data.vault_loader import load_psu_cmpsc_vault
+from backend.services.llm import EMBEDDING_MODEL, embed_batch
 from backend.services.llm import embed as get_embedding  # noqa: F401 — re-exported
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Bump when the meaning of either file changes. A reader that finds a version it
+# does not know treats the index as missing rather than guessing at it.
+INDEX_FORMAT_VERSION = 1
+
 
 def build_embedding_text(record):
     parts = [
@@ -23,40 +55,236 @@ def build_embedding_text(record):
     return " | ".join(part for part in parts if part)
 
 
-def build_index():
+def content_hash(record):
+    """SHA-256 of the text build_index embeds for `record`."""
+    return hashlib.sha256(build_embedding_text(record).encode("utf-8")).hexdigest()
+
+
+def normalize_rows(vectors):
+    """float32 rows scaled to unit length; an all-zero row stays zero."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2:
+        matrix = matrix.reshape(len(vectors), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _replace_atomically(path, write):
+    """Write to a sibling temp file, then rename over `path`.
+
+    A worker booting mid-rebuild must see the old file or the new one, never
+    half of either.
+    """
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.tmp{ext}"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def write_index(records, model=None):
+    """Persist records (each carrying an "embedding") in the columnar format.
+
+    `model` is the embedding model that produced the vectors; defaults to the
+    active one.
+    """
+    model = model or EMBEDDING_MODEL
+    vectors = [r["embedding"] for r in records]
+    matrix = normalize_rows(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    meta = {
+        "format_version": INDEX_FORMAT_VERSION,
+        "model": model,
+        "dims": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "count": len(records),
+        "normalized": True,
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "records": [
+            {**{k: v for k, v in r.items() if k != "embedding"},
+             "content_hash": r.get("content_hash") or content_hash(r)}
+            for r in records
+        ],
+    }
+
+    os.makedirs(os.path.dirname(INDEX_EMBEDDINGS_FILE) or ".", exist_ok=True)
+    # Embeddings first: a meta file never points at rows that aren't there yet.
+    _replace_atomically(INDEX_EMBEDDINGS_FILE, lambda p: np.save(p, matrix))
+
+    def _write_meta(p):
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+
+    _replace_atomically(INDEX_META_FILE, _write_meta)
+    logger.info(
+        "Index saved to %r + %r (%d records × %d dims)",
+        INDEX_EMBEDDINGS_FILE, INDEX_META_FILE, meta["count"], meta["dims"],
+    )
+    return meta
+
+
+def _previous_vectors(model):
+    """content_hash → unit vector from the index on disk, if built with `model`.
+
+    Vectors from a different embedding model live in a different space, so an
+    index built with one is never mixed into an index for another.
+    """
+    if os.path.exists(INDEX_META_FILE):
+        with open(INDEX_META_FILE, encoding="utf-8") as f:
+            previous_model = json.load(f).get("model")
+    else:
+        previous_model = OPENAI_EMBEDDING_MODEL  # the legacy pickle predates the field
+    if previous_model != model:
+        logger.info("Previous index used %r, not %r — re-embedding everything", previous_model, model)
+        return {}
+
+    columns = _read_columns() or _read_legacy_pickle()
+    if columns is None:
+        return {}
+    records, matrix = columns
+    # np.array copies the row out of the memory map before the file is replaced.
+    return {
+        (r.get("content_hash") or content_hash(r)): np.array(matrix[i])
+        for i, r in enumerate(records)
+    }
+
+
+def build_index(full=False):
+    """Rebuild the index from the vault, re-embedding only what changed.
+
+    A record whose content hash is already in the previous index keeps its
+    vector; everything else is embedded. full=True ignores the previous index.
+    Returns the counts it also logs: records added, removed and reused, and how
+    many were embedded.
+    """
     logger.info("Building embedding index...")
     records = load_psu_cmpsc_vault()
+    for record in records:
+        record["content_hash"] = content_hash(record)
 
-    for i, record in enumerate(records):
-        text_for_embedding = build_embedding_text(record)
-        record["embedding"] = get_embedding(text_for_embedding)
-        if (i + 1) % 50 == 0:
-            logger.info("Embedded %d / %d records", i + 1, len(records))
+    previous = {} if full else _previous_vectors(EMBEDDING_MODEL)
+    stale = [r for r in records if r["content_hash"] not in previous]
+    vectors = embed_batch([build_embedding_text(record) for record in stale])
+    for record, vector in zip(stale, vectors):
+        record["embedding"] = vector
+    for record in records:
+        if "embedding" not in record:
+            record["embedding"] = previous[record["content_hash"]]
 
-    os.makedirs("backend/data", exist_ok=True)
+    write_index(records)
 
-    with open(INDEX_FILE, "wb") as f:
-        pickle.dump(records, f)
+    current = {r["content_hash"] for r in records}
+    report = {
+        "count": len(records),
+        "added": len(current - previous.keys()),
+        "removed": len(previous.keys() - current),
+        "reused": len(records) - len(stale),
+        "embedded": len(stale),
+    }
+    logger.info(
+        "Index built (%d records): %d added, %d removed, %d reused, %d embedded",
+        report["count"], report["added"], report["removed"], report["reused"], report["embedded"],
+    )
+    return report
 
-    logger.info("Index built and saved to %r (%d records)", INDEX_FILE, len(records))
-    return records
 
+def _read_columns():
+    """(records, matrix) from the columnar files, or None if unusable."""
+    if not (os.path.exists(INDEX_META_FILE) and os.path.exists(INDEX_EMBEDDINGS_FILE)):
+        return None
 
-def load_index():
-    if not os.path.exists(INDEX_FILE):
-        logger.info("Index file not found — building from scratch")
-        return build_index()
+    with open(INDEX_META_FILE, encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != INDEX_FORMAT_VERSION:
+        logger.warning(
+            "Index format version %r at %r is not %r — ignoring it",
+            meta.get("format_version"), INDEX_META_FILE, INDEX_FORMAT_VERSION,
+        )
+        return None
+    if meta.get("model") != EMBEDDING_MODEL:
+        # Question vectors from one model are meaningless against another's.
+        logger.warning(
+            "Index at %r was built with %r, but the active embedding model is %r — "
+            "ignoring it; rebuild with build_index()",
+            INDEX_META_FILE, meta.get("model"), EMBEDDING_MODEL,
+        )
+        return None
 
-    logger.info("Loading index from %r", INDEX_FILE)
+    matrix = np.load(INDEX_EMBEDDINGS_FILE, mmap_mode="r")
+    records = meta.get("records") or []
+    if matrix.shape[0] != len(records):
+        logger.warning(
+            "Index at %r has %d rows for %d records — ignoring it",
+            INDEX_EMBEDDINGS_FILE, matrix.shape[0], len(records),
+        )
+        return None
+    if not meta.get("normalized"):
+        matrix = normalize_rows(matrix)
+    return records, matrix
+
+
+def _read_legacy_pickle():
+    """(records, matrix) from the pre-columnar pickle, or None if absent."""
+    if not os.path.exists(INDEX_FILE) or EMBEDDING_MODEL != OPENAI_EMBEDDING_MODEL:
+        return None
+
+    logger.info("Loading legacy pickled index from %r", INDEX_FILE)
     with open(INDEX_FILE, "rb") as f:
-        records = pickle.load(f)
+        legacy = pickle.load(f)
+
+    legacy = [r for r in legacy if r.get("embedding") is not None]
+    records = [{k: v for k, v in r.items() if k != "embedding"} for r in legacy]
+    if not legacy:
+        return records, np.zeros((0, 0), dtype=np.float32)
+    return records, normalize_rows([r["embedding"] for r in legacy])
+
+
+def load_index_columns():
+    """(records, matrix): row i of the float32 matrix is records[i]'s unit vector.
+
+    The matrix is a read-only memory map when loaded from the columnar files.
+    Falls back to the legacy pickle, then to a fresh build.
+    """
+    columns = _read_columns()
+    if columns is not None:
+        logger.info("Index loaded: %d records (mmap %r)", len(columns[0]), INDEX_EMBEDDINGS_FILE)
+        return columns
+
+    columns = _read_legacy_pickle()
+    if columns is not None:
+        logger.info("Index loaded: %d records (legacy pickle)", len(columns[0]))
+        return columns
+
+    logger.info("Index file not found — building from scratch")
+    build_index()
+    return _read_columns()
+
+
+def load_index():
+    """Records as dicts, each with its "embedding" row.
+
+    The rows are views into the index matrix, not copies — kept for callers
+    that want the old list-of-dicts shape.
+    """
+    records, matrix = load_index_columns()
+    return [{**r, "embedding": matrix[i]} for i, r in enumerate(records)]
+
+
+def convert_legacy_index():
+    """Rewrite the legacy pickle in the columnar format without re-embedding.
 
-    logger.info("Index loaded: %d records", len(records))
-    return records
+    Returns the number of records written, or 0 if there was no pickle.
+    """
+    columns = _read_legacy_pickle()
+    if columns is None:
+        return 0
+    records, matrix = columns
+    write_index([{**r, "embedding": matrix[i]} for i, r in enumerate(records)])
+    return len(records)
 
 
 def delete_index_file():
-    if os.path.exists(INDEX_FILE):
-        os.remove(INDEX_FILE)
-        return True
-    return False
\ No newline at end of file
+    removed = False
+    for path in (INDEX_EMBEDDINGS_FILE, INDEX_META_FILE, INDEX_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+            removed = True
+    return removed
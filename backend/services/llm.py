@@ -1,19 +1,42 @@
 """The one place ACE talks to a language-model provider.
 
-Everything else — chat_service, index_service, the eval runner — calls the three
+Everything else — chat_service, index_service, the eval runner — calls the
 functions below and never imports a provider SDK. Moving off OpenAI (to a hosted
 alternative, or to a model we own) means rewriting this file and nothing else.
 
 Token usage is recorded here too, so no caller can forget to meter a call.
+
+Each call has an async twin (achat, achat_stream, aembed) on AsyncOpenAI. They
+share one pooled httpx client per worker — keep-alive, and HTTP/2 when the h2
+package is installed — so a streaming chat holds a connection, not a thread.
+
+Embeddings can come from a local model instead (EMBEDDING_BACKEND=local): no
+network hop before retrieval, and nothing to meter. EMBEDDING_MODEL names
+whichever model is active, and the index records it, so an index built by one
+model is never queried with vectors from another.
 """
 
+import asyncio
+import importlib.util
 import logging
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import (
+    OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient,
+    APIConnectionError, APITimeoutError, InternalServerError, RateLimitError,
+)
 
-from backend.config import OPENAI_CHAT_MODEL, OPENAI_EMBEDDING_MODEL
+from backend.config import (
+    OPENAI_CHAT_MODEL, OPENAI_EMBEDDING_MODEL, EMBEDDING_BACKEND, LOCAL_EMBEDDING_MODEL,
+    EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_CONCURRENCY, EMBEDDING_MAX_RETRIES,
+    LLM_MAX_CONNECTIONS, LLM_MAX_KEEPALIVE, LLM_KEEPALIVE_EXPIRY,
+    LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT,
+)
 from backend.services.cost_service import record_usage
 
 # This module owns client creation, so it owns finding the key — callers that
@@ -23,9 +46,11 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 CHAT_MODEL = OPENAI_CHAT_MODEL
-EMBEDDING_MODEL = OPENAI_EMBEDDING_MODEL
+EMBEDDING_MODEL = LOCAL_EMBEDDING_MODEL if EMBEDDING_BACKEND == "local" else OPENAI_EMBEDDING_MODEL
 
 _client = None
+_async_client = None
+_local_model = None
 
 
 def _get_client():
@@ -36,6 +61,56 @@ def _get_client():
     return _client
 
 
+def _get_async_client():
+    """The worker's AsyncOpenAI, over one pooled httpx client, made on first use."""
+    global _async_client
+    if _async_client is None:
+        http2 = importlib.util.find_spec("h2") is not None
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=DefaultAsyncHttpxClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+            ),
+        )
+        logger.info("Async LLM client ready (pool %d, http2=%s)", LLM_MAX_CONNECTIONS, http2)
+    return _async_client
+
+
+async def aclose():
+    """Close the pooled async client — call once at worker shutdown."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+def _get_local_model():
+    """The local embedding model, loaded on first use (a few seconds, once)."""
+    global _local_model
+    if _local_model is None:
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as exc:
+            raise RuntimeError(
+                "EMBEDDING_BACKEND=local needs sentence-transformers: "
+                "pip install sentence-transformers"
+            ) from exc
+        _local_model = SentenceTransformer(LOCAL_EMBEDDING_MODEL, device="cpu")
+        logger.info("Local embedding model loaded: %s", LOCAL_EMBEDDING_MODEL)
+    return _local_model
+
+
+def _local_embed(texts, batch_size=EMBEDDING_BATCH_SIZE):
+    vectors = _get_local_model().encode(list(texts), batch_size=batch_size)
+    return [[float(x) for x in v] for v in vectors]
+
+
 def chat(messages, temperature=0.0, response_format=None, feature="chat", user_id=None):
     """One non-streaming completion. Returns the answer text."""
     kwargs = {"model": CHAT_MODEL, "messages": messages, "temperature": temperature}
@@ -46,11 +121,12 @@ def chat(messages, temperature=0.0, response_format=None, feature="chat", user_i
     return completion.choices[0].message.content
 
 
-def chat_stream(messages, temperature=0.0, feature="chat", user_id=None):
+def chat_stream(messages, temperature=0.0, feature="chat", user_id=None, prompt_breakdown=None):
     """Yield answer text deltas, then record the call's token usage.
 
     Usage arrives on the final chunk, so metering happens after the last delta —
     a consumer that abandons the generator early simply isn't metered.
+    prompt_breakdown, when given, is stored on the same usage row.
     """
     stream = _get_client().chat.completions.create(
         model=CHAT_MODEL,
@@ -65,7 +141,7 @@ def chat_stream(messages, temperature=0.0, feature="chat", user_id=None):
             usage = chunk.usage
         if chunk.choices and chunk.choices[0].delta.content:
             yield chunk.choices[0].delta.content
-    record_usage(feature, CHAT_MODEL, usage, user_id=user_id)
+    record_usage(feature, CHAT_MODEL, usage, user_id=user_id, prompt_breakdown=prompt_breakdown)
 
 
 def embed(text, record=False):
@@ -73,8 +149,113 @@ def embed(text, record=False):
 
     record=False for the offline index build — 73 bulk embeds would flood the
     usage table for a cost we pay once. Query-time embeds pass record=True.
+    A local model costs nothing, so it is never metered.
     """
+    if EMBEDDING_BACKEND == "local":
+        return _local_embed([text])[0]
     response = _get_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
     if record:
         record_usage("embedding", EMBEDDING_MODEL, response.usage)
     return response.data[0].embedding
+
+
+# Worth retrying: the provider is busy or the network blinked. A 400 or a bad
+# key will fail identically on every attempt, so those raise at once.
+_RETRYABLE = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+def _embed_with_retry(batch, max_retries):
+    """One embeddings request for a list of inputs, with exponential backoff."""
+    for attempt in range(max_retries + 1):
+        try:
+            return _get_client().embeddings.create(model=EMBEDDING_MODEL, input=batch)
+        except _RETRYABLE as exc:
+            if attempt == max_retries:
+                raise
+            # 1s, 2s, 4s … capped at 30s, with jitter so parallel batches that
+            # hit the same rate limit don't all come back at the same instant.
+            delay = min(30.0, 2 ** attempt) * (0.5 + random.random() / 2)
+            logger.warning("embed_batch | %s — retry %d/%d in %.1fs",
+                           type(exc).__name__, attempt + 1, max_retries, delay)
+            time.sleep(delay)
+
+
+def embed_batch(texts, record=False, batch_size=EMBEDDING_BATCH_SIZE,
+                max_concurrency=EMBEDDING_MAX_CONCURRENCY, max_retries=EMBEDDING_MAX_RETRIES):
+    """Embedding vectors for many strings, in input order.
+
+    Sends `batch_size` inputs per request and keeps at most `max_concurrency`
+    requests in flight, so an index rebuild is a handful of round-trips rather
+    than one per chunk. Each request retries with backoff on rate limits and
+    transient failures; anything else raises. A local model encodes in
+    `batch_size` chunks on this machine instead.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    if EMBEDDING_BACKEND == "local":
+        return _local_embed(texts, batch_size=batch_size)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    vectors = [None] * len(texts)
+
+    def run(n):
+        response = _embed_with_retry(batches[n], max_retries)
+        if record:
+            record_usage("embedding", EMBEDDING_MODEL, response.usage)
+        # The API reports each vector's input position; don't trust list order.
+        for item in response.data:
+            vectors[n * batch_size + item.index] = item.embedding
+        logger.info("embed_batch | batch %d / %d (%d inputs)", n + 1, len(batches), len(batches[n]))
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(batches)))) as pool:
+        # list() re-raises the first failure instead of dropping it silently.
+        list(pool.map(run, range(len(batches))))
+
+    missing = sum(v is None for v in vectors)
+    if missing:
+        raise RuntimeError(f"embed_batch: provider returned no vector for {missing} input(s)")
+    return vectors
+
+
+# ── Async twins ──────────────────────────────────────────────────────────────
+# Same arguments, same metering. record_usage is a blocking DB write, so it runs
+# on a worker thread rather than stalling every other stream on the event loop.
+
+async def achat(messages, temperature=0.0, response_format=None, feature="chat", user_id=None):
+    """Async chat(): one non-streaming completion. Returns the answer text."""
+    kwargs = {"model": CHAT_MODEL, "messages": messages, "temperature": temperature}
+    if response_format:
+        kwargs["response_format"] = response_format
+    completion = await _get_async_client().chat.completions.create(**kwargs)
+    await asyncio.to_thread(record_usage, feature, CHAT_MODEL, completion.usage, user_id=user_id)
+    return completion.choices[0].message.content
+
+
+async def achat_stream(messages, temperature=0.0, feature="chat", user_id=None,
+                       prompt_breakdown=None):
+    """Async chat_stream(): yield answer text deltas, then record usage."""
+    stream = await _get_async_client().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=messages,
+        temperature=temperature,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    usage = None
+    async for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+    await asyncio.to_thread(record_usage, feature, CHAT_MODEL, usage, user_id=user_id,
+                            prompt_breakdown=prompt_breakdown)
+
+
+async def aembed(text, record=False):
+    """Async embed(). A local model is CPU-bound, so it runs on a thread."""
+    if EMBEDDING_BACKEND == "local":
+        return (await asyncio.to_thread(_local_embed, [text]))[0]
+    response = await _get_async_client().embeddings.create(model=EMBEDDING_MODEL, input=text)
+    if record:
+        await asyncio.to_thread(record_usage, "embedding", EMBEDDING_MODEL, response.usage)
+    return response.data[0].embedding
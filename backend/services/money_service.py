@@ -165,9 +165,12 @@ def format_record(r: dict) -> str:
     return "\n".join(lines)
 
 
-def build_money_snippet(question: str) -> str:
-    """Grounding for a student-account question. '' when none applies."""
-    matches = find_money(question)
+def build_money_snippet(question: str, find=find_money) -> str:
+    """Grounding for a student-account question. '' when none applies.
+
+    `find` stands in for find_money — chat_service passes its per-request memo.
+    """
+    matches = find(question)
     if not matches:
         # A pure advice question ("should I take out a loan?") matches no
         # navigational topic, so without this it would get no guardrail at all —
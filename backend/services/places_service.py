@@ -319,9 +319,12 @@ def find_places(question: str, limit=MAX_PLACES) -> list[dict]:
     return picked[:limit]
 
 
-def build_places_snippet(question: str) -> str:
-    """Grounding for a where-on-campus question. '' when none fits."""
-    matches = find_places(question)
+def build_places_snippet(question: str, find=find_places) -> str:
+    """Grounding for a where-on-campus question. '' when none fits.
+
+    `find` stands in for find_places — chat_service passes its per-request memo.
+    """
+    matches = find(question)
     if not matches:
         return ""
 
@@ -212,9 +212,12 @@ def format_procedure(p: dict) -> str:
     return "\n".join(lines)
 
 
-def build_procedures_snippet(question: str) -> str:
-    """Grounding for a 'how do I actually do this' question. '' when none fits."""
-    matches = find_procedures(question)
+def build_procedures_snippet(question: str, find=find_procedures) -> str:
+    """Grounding for a 'how do I actually do this' question. '' when none fits.
+
+    `find` stands in for find_procedures — chat_service passes its per-request memo.
+    """
+    matches = find(question)
     if not matches:
         return ""
 
@@ -64,13 +64,18 @@ _EXTRACT_SYSTEM = (
 )
 
 
-def _load(user) -> dict:
+def parse_profile(profile_json) -> dict:
+    """A stored profile_json column as a dict; {} when empty or unreadable."""
     try:
-        return json.loads(user.profile_json) if user.profile_json else {}
+        return json.loads(profile_json) if profile_json else {}
     except (TypeError, ValueError):
         return {}
 
 
+def _load(user) -> dict:
+    return parse_profile(user.profile_json)
+
+
 def _merge(existing: list, incoming: list, cap: int) -> list:
     """Append what's new, case-insensitively, newest last, capped."""
     out = list(existing or [])
@@ -183,9 +188,14 @@ def set_profile(user_id: str, interests=None, career_goals=None, db=None) -> dic
             db.close()
 
 
-def build_profile_snippet(user_id: str) -> str:
-    """The prompt block. Empty string when ACE knows nothing yet."""
-    profile = get_profile(user_id)
+def build_profile_snippet(user_id: str, profile: dict = None) -> str:
+    """The prompt block. Empty string when ACE knows nothing yet.
+
+    Pass `profile` when it is already loaded (chat_service's StudentState) to
+    skip the read.
+    """
+    if profile is None:
+        profile = get_profile(user_id)
     interests = profile.get("interests") or []
     goals = profile.get("career_goals") or []
     if not interests and not goals:
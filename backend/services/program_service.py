@@ -5,26 +5,414 @@ Loads programs.json and courses.json once at module import time and provides
 fast in-memory lookups for the rest of the backend.  All public functions are
 safe to call at import time; if the data files are missing the functions return
 sensible empty results and log a warning.
+
+Courses and programs come back as Course / Program records: read-only,
+dict-compatible views (see "Catalog records" below). dict(record) copies one
+into a dict to modify; json.dumps(record, default=dict) serialises one, nested
+prerequisite and requirement rows included.
+
+The per-program builders (prerequisite map, suggested plan, gen-ed payload,
+double dips, chat snippet) are memoised per loaded catalog and return shared
+objects — copy before changing one.
 """
 
+import functools
+import hashlib
 import json
 import logging
+import mmap
+import os
+import pickle
 import re
-from difflib import SequenceMatcher
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import Counter, deque
+from collections.abc import Mapping
+from itertools import chain
 from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
 _DATA_DIR = Path(__file__).parent.parent / "data"
 
+# ── Catalog records ────────────────────────────────────────────────────────────
+# 9,439 courses and 749 programs sit in every worker, with ~30k prerequisite
+# and requirement rows under them. As plain dicts each one carries a hash
+# table, and every course its description — text the chat path almost never
+# reads. Records keep the fields in slots instead, and a course loaded from the
+# snapshot leaves its description in the snapshot file until asked for. All are
+# read-only Mappings: .get(), [], `in`, iteration and dict(record) behave as
+# they did on the dicts.
+
+# Marks a field the source record did not have. Ellipsis is never a JSON value,
+# and pickles as itself.
+_MISSING = ...
+
+
+class _Record(Mapping):
+    """Known fields in slots, in source order; anything else in `_extra`.
+
+    Pickled by slot (copyreg's default for __slots__ classes), which the
+    unpickler restores in C — no Python call per record at load.
+    """
+
+    __slots__ = ("_extra",)
+    _FIELDS: tuple[str, ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELD_SET = frozenset(cls._FIELDS)
+
+    def __init__(self, data: dict):
+        for name in self._FIELDS:
+            setattr(self, name, data.get(name, _MISSING))
+        extra = {k: v for k, v in data.items() if k not in self._FIELD_SET}
+        self._extra = extra or None
+
+    def _value(self, name, value):
+        return value
+
+    def __getitem__(self, key):
+        if key in self._FIELD_SET:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return self._value(key, value)
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for name in self._FIELDS:
+            if getattr(self, name) is not _MISSING:
+                yield name
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(getattr(self, n) is not _MISSING for n in self._FIELDS) + len(self._extra or ())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class _TextTable:
+    """Long text kept off the heap: UTF-8 in the snapshot file, decoded on read.
+
+    Pickled as its offsets alone; _read_snapshot attaches the file's mmap.
+    """
+
+    __slots__ = ("offsets", "_buf", "_base")
+
+    def __init__(self, offsets: array):
+        self.offsets = offsets
+        self._buf = None
+        self._base = 0
+
+    def __reduce__(self):
+        return _TextTable, (self.offsets,)
+
+    def attach(self, buf, base: int) -> None:
+        self._buf, self._base = buf, base
+
+    def __getitem__(self, i: int) -> str:
+        start, end = self.offsets[i] + self._base, self.offsets[i + 1] + self._base
+        return self._buf[start:end].decode("utf-8")
+
+
+class Prerequisite(_Record):
+    """One enforced prerequisite of a course: its code (or None) and condition."""
+
+    _FIELDS = ("code", "enforced", "condition")
+    __slots__ = _FIELDS
+
+
+class RequiredCourse(_Record):
+    """One course row in a program's requirement table, or one option of a choice."""
+
+    _FIELDS = ("code", "title", "credits", "min_grade")
+    __slots__ = _FIELDS
+
+
+class Course(_Record):
+    """A course, as a read-only dict. `description` may live in a _TextTable."""
+
+    _FIELDS = ("code", "title", "credits", "department", "description",
+               "prerequisites", "cross_listed", "gen_ed")
+    __slots__ = _FIELDS + ("_texts",)
+
+    def __init__(self, data: dict, texts: list[str] | None = None):
+        super().__init__(data)
+        self._texts = None
+        # Codes, departments and gen-ed categories repeat across the catalog
+        # and are dict keys everywhere; one shared string each.
+        if isinstance(self.code, str):
+            self.code = sys.intern(self.code)
+        if isinstance(self.department, str):
+            self.department = sys.intern(self.department)
+        if isinstance(self.gen_ed, dict) and self.gen_ed.get("categories"):
+            self.gen_ed["categories"] = [sys.intern(c) for c in self.gen_ed["categories"]]
+        if isinstance(self.prerequisites, list):
+            self.prerequisites = [Prerequisite(p) for p in self.prerequisites]
+        if texts is not None and isinstance(self.description, str):
+            texts.append(self.description)
+            self.description = len(texts) - 1
+
+    def _value(self, name, value):
+        if name == "description" and type(value) is int:
+            return self._texts[value]
+        return value
+
+    def bind_texts(self, table: _TextTable) -> None:
+        self._texts = table
+
+
+class Program(_Record):
+    """A program, as a read-only dict. The requirement table stays a plain dict;
+    the course rows in it are RequiredCourse records."""
+
+    _FIELDS = ("program_name", "degree_type", "college", "plan_codes", "campuses",
+               "campuses_begin", "campuses_end", "total_credits", "gen_ed_credits",
+               "major_credits", "gen_ed_overlap", "gen_ed_overlap_note",
+               "requirements", "suggested_plan", "url")
+    __slots__ = _FIELDS
+
+    def __init__(self, data: dict):
+        super().__init__(data)
+        for name in ("college", "degree_type"):
+            value = getattr(self, name)
+            if isinstance(value, str):
+                setattr(self, name, sys.intern(value))
+        reqs = self.requirements
+        if isinstance(reqs, dict):
+            if reqs.get("prescribed"):
+                reqs["prescribed"] = [RequiredCourse(i) for i in reqs["prescribed"]]
+            for item in reqs.get("additional") or []:
+                if isinstance(item, dict) and item.get("options"):
+                    item["options"] = [RequiredCourse(o) for o in item["options"]]
+
+
 # ── In-memory indexes ──────────────────────────────────────────────────────────
-_programs: list[dict] = []
-_courses_by_code: dict[str, dict] = {}        # "CMPSC 465"  → course dict
-_programs_by_name: dict[str, dict] = {}       # lower name   → program dict
-_programs_by_plan_code: dict[str, dict] = {}  # "CMPSC_BS"   → program dict
-_courses_by_dept: dict[str, list] = {}        # "CMPSC"      → [course, ...]
-_courses_by_gen_ed: dict[str, list] = {}      # "GQ"         → [course, ...]
-_popular_courses: set[str] = set()            # codes appearing in 5+ programs
+_programs: list[Program] = []
+_courses_by_code: dict[str, Course] = {}        # "CMPSC 465"  → course
+_programs_by_name: dict[str, Program] = {}      # lower name   → program
+_programs_by_plan_code: dict[str, Program] = {} # "CMPSC_BS"   → program
+_courses_by_dept: dict[str, list] = {}          # "CMPSC"      → [course, ...]
+_courses_by_gen_ed: dict[str, list] = {}        # "GQ"         → [course, ...]
+_popular_courses: set[str] = set()              # codes appearing in 5+ programs
+
+
+# ── Program search index ───────────────────────────────────────────────────────
+# /programs?q= is type-ahead: a request per keystroke. Scoring every program
+# name with SequenceMatcher was O(programs × name²) each time. Instead, every
+# program is reachable through a few search keys — its name, the field before
+# the comma, that field's initials ("cs", "ds"), its plan codes — and a gram
+# index over the keys hands the scorer only the keys sharing a gram with the
+# query.
+
+# Shorthand students type that is neither a prefix of the real word nor its
+# initials. Prefixes ("psych", "econ", "comp sci") and initials already match.
+_SEARCH_ALIASES = {
+    "stats": "statistics",
+    "compsci": "computer science",
+    "polisci": "political science",
+    "poli sci": "political science",
+    "premed": "premedicine",
+    "kines": "kinesiology",
+    "bme": "biomedical engineering",
+    "ist": "information sciences and technology",
+}
+_ACRONYM_SKIP = {"and", "of", "the", "in", "for"}
+
+
+def _search_text(text: str) -> str:
+    """Lowercase words only: 'Computer Science, B.S.' → 'computer science b s'."""
+    return " ".join(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+
+def _grams(text: str) -> set[str]:
+    """Trigrams of the padded text, plus a ' x' gram for each word's first
+    letter so a one-letter query still finds the words it starts."""
+    padded = f" {text} "
+    grams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+    grams.update(" " + word[0] for word in text.split())
+    return grams
+
+
+class _ProgramSearch:
+    """Gram → search-key postings over every program's names and aliases."""
+
+    def __init__(self, programs: list[Program]):
+        self.keys: list[str] = []
+        self.key_grams: list[int] = []        # gram count per key, for similarity
+        self.key_program: list[int] = []      # key id → index into programs
+        self.postings: dict[str, list[int]] = {}
+        for i, prog in enumerate(programs):
+            for key in self._keys_for(prog):
+                key_id = len(self.keys)
+                grams = _grams(key)
+                self.keys.append(key)
+                self.key_grams.append(len(grams))
+                self.key_program.append(i)
+                for gram in grams:
+                    self.postings.setdefault(gram, []).append(key_id)
+
+    @staticmethod
+    def _keys_for(prog) -> list[str]:
+        name = prog.get("program_name", "") or ""
+        keys = [_search_text(name)]
+        field = _search_text(name.split(",")[0])
+        if field and field != keys[0]:
+            keys.append(field)
+        initials = "".join(w[0] for w in field.split() if w not in _ACRONYM_SKIP)
+        if len(initials) >= 2:
+            keys.append(initials)
+        for plan_code in prog.get("plan_codes") or []:
+            code = _search_text(plan_code)
+            if code:
+                keys.append(code)
+        return list(dict.fromkeys(k for k in keys if k))
+
+    def search(self, query: str) -> dict[int, float]:
+        """Best score per program index, for programs scoring above 0.3."""
+        q = _search_text(query)
+        q = _SEARCH_ALIASES.get(q) or " ".join(_SEARCH_ALIASES.get(w, w) for w in q.split())
+        if not q:
+            return {}
+        q_grams = _grams(q)
+        shared = Counter(chain.from_iterable(self.postings.get(g, ()) for g in q_grams))
+
+        q_words = q.split()
+        # A prefix or substring hit misses at most a word's leading grams and
+        # the last word's trailing one; a word-prefix hit, the trailing and
+        # joining grams of each word. Fewer shared than that, and too few for
+        # the fuzzy threshold, and the key cannot score — skip the string work.
+        floor = len(q_grams) - max(3, 2 * len(q_words))
+        best: dict[int, float] = {}
+        for key_id, n in shared.items():
+            if n < floor and 2 * n <= 0.3 * (len(q_grams) + self.key_grams[key_id]):
+                continue
+            key = self.keys[key_id]
+            if key == q:
+                score = 4.0
+            elif key.startswith(q):
+                score = 3.0 + len(q) / len(key)
+            elif all(any(w.startswith(qw) for w in key.split()) for qw in q_words):
+                score = 2.0 + len(q) / len(key)
+            elif q in key:
+                score = 1.0 + len(q) / len(key)
+            else:
+                # Dice over grams: the typo-tolerant tail, as SequenceMatcher was.
+                score = 2 * n / (len(q_grams) + self.key_grams[key_id])
+            if score > 0.3:
+                program = self.key_program[key_id]
+                if score > best.get(program, 0.0):
+                    best[program] = score
+        return best
+
+
+_program_search = _ProgramSearch([])
+
+
+# ── Per-program artifacts ──────────────────────────────────────────────────────
+# The prerequisite map, suggested plan, gen-ed payload, double dips and chat
+# snippet depend on nothing but the program and the catalog, and were rebuilt
+# on every request and every chat turn. Each is built once per program and
+# catalog, then shared.
+
+class _ArtifactCache:
+    """Built artifacts keyed on (catalog version, artifact, program), with hit
+    and miss counts per artifact for this process."""
+
+    def __init__(self):
+        self.version = ""
+        self._entries: dict[tuple, object] = {}
+        self._hits: Counter = Counter()
+        self._misses: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, artifact: str, program: str | None, build):
+        version = self.version
+        key = (version, artifact, program)
+        with self._lock:
+            if key in self._entries:
+                self._hits[artifact] += 1
+                return self._entries[key]
+            self._misses[artifact] += 1
+        value = build()
+        with self._lock:
+            # Built from a catalog that has since been replaced: hand it back,
+            # but don't keep it.
+            if self.version == version:
+                value = self._entries.setdefault(key, value)
+        return value
+
+    def reset(self, version: str) -> None:
+        """Drop every artifact; what follows is built from catalog `version`."""
+        with self._lock:
+            self.version = version
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = Counter(artifact for _, artifact, _ in self._entries)
+            artifacts = {}
+            for name in sorted(set(sizes) | set(self._hits) | set(self._misses)):
+                hits, misses = self._hits[name], self._misses[name]
+                artifacts[name] = {
+                    "entries": sizes[name],
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                }
+            return {
+                "catalog_version": self.version,
+                "entries": len(self._entries),
+                "artifacts": artifacts,
+            }
+
+
+_artifacts = _ArtifactCache()
+_artifact_builders: list = []
+
+
+def _per_program(build):
+    """Memoise build(program_name) in _artifacts under the program it resolves to.
+
+    Every name that resolves to no program shares one entry (None): the
+    builders' answer for an unknown program does not depend on the name, and
+    keying on the raw ?major= string would let the cache grow without bound.
+    """
+    @functools.wraps(build)
+    def cached(program_name):
+        prog = get_program(program_name) if program_name else None
+        key = prog["program_name"] if prog else None
+        # Built from the canonical name, whichever spelling arrived first.
+        return _artifacts.get_or_build(build.__name__, key, lambda: build(key or ""))
+
+    _artifact_builders.append(cached)
+    return cached
+
+
+def warm_program_artifacts() -> int:
+    """Build every per-program artifact for every program now, instead of on
+    each one's first request. Returns how many are cached afterwards."""
+    started = time.perf_counter()
+    for build in _artifact_builders:
+        build(None)
+        for prog in _programs:
+            build(prog["program_name"])
+    entries = _artifacts.stats()["entries"]
+    logger.info("program_service: warmed %d program artifacts in %.0f ms",
+                entries, (time.perf_counter() - started) * 1000)
+    return entries
+
+
+def program_artifact_stats() -> dict:
+    """Size and hit rates of the per-program artifact cache, for /admin."""
+    return _artifacts.stats()
 
 
 # ── Internal helpers ───────────────────────────────────────────────────────────
@@ -41,64 +429,99 @@ def _normalize_code(code: str) -> str:
 _VARIANT_SUFFIXES = set("ABEGHMST")
 
 
-def _canonical_code(code: str) -> str:
+def _canonical_code(code: str, courses: dict | None = None) -> str:
     """Collapse a lettered course variant to its base when the base exists.
 
     'MATH 141H' → 'MATH 141' (base in catalog); 'CMPSC 431W' stays (W kept,
     and no base 'CMPSC 431'); codes with no trailing letter are unchanged.
+    `courses` is the catalog to check against — the loaded one by default.
     """
     c = _normalize_code(code)
     m = re.match(r"^([A-Z]{2,8} \d{1,3})([A-Z])$", c)
-    if m and m.group(2) in _VARIANT_SUFFIXES and m.group(1) in _courses_by_code:
+    if m and m.group(2) in _VARIANT_SUFFIXES and m.group(1) in (
+            _courses_by_code if courses is None else courses):
         return m.group(1)
     return c
 
 
-def _load_data() -> None:
-    global _programs
+# Bump when the snapshot's shape, or what _build_catalog normalises, changes.
+CATALOG_SNAPSHOT_VERSION = 4
+_SNAPSHOT_PATH = _DATA_DIR / "catalog.snapshot.pkl"
+_POPULAR_THRESHOLD = 5
 
-    programs_path = _DATA_DIR / "programs.json"
-    courses_path  = _DATA_DIR / "courses.json"
 
-    # ── Programs ──────────────────────────────────────────────────────────────
-    if programs_path.exists():
-        _programs = json.loads(programs_path.read_text(encoding="utf-8"))
-        for prog in _programs:
-            name = prog.get("program_name", "").strip()
-            if name:
-                _programs_by_name[name.lower()] = prog
-            for pc in prog.get("plan_codes", []):
-                if pc:
-                    _programs_by_plan_code[pc.strip().upper()] = prog
-        logger.info("program_service: loaded %d programs", len(_programs))
-    else:
-        logger.warning("program_service: programs.json not found at %s", programs_path)
+def _code_fingerprint() -> str:
+    """sha256 of this module's source.
 
-    # ── Courses ───────────────────────────────────────────────────────────────
-    if courses_path.exists():
-        all_courses = json.loads(courses_path.read_text(encoding="utf-8"))
-        for course in all_courses:
-            # Normalize any leftover non-breaking spaces in prereq conditions
-            for prereq in course.get("prerequisites", []):
-                if prereq.get("condition"):
-                    prereq["condition"] = prereq["condition"].replace("\xa0", " ")
-                if prereq.get("code"):
-                    prereq["code"] = prereq["code"].replace("\xa0", " ")
-            code = _normalize_code(course.get("code", ""))
-            if code:
-                _courses_by_code[code] = course
-            dept = course.get("department", "").strip().upper()
-            if dept:
-                _courses_by_dept.setdefault(dept, []).append(course)
-            for cat in course.get("gen_ed", {}).get("categories", []):
-                _courses_by_gen_ed.setdefault(cat, []).append(course)
-        logger.info("program_service: loaded %d courses", len(_courses_by_code))
-    else:
-        logger.warning("program_service: courses.json not found at %s", courses_path)
+    The snapshot holds what code built — the search index (aliases, grams) and
+    the prerequisite graph (condition parsing) — not only the JSON. An edit
+    here retires it, whether or not anyone remembered to bump the version.
+    """
+    try:
+        return hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+    except OSError:
+        return ""
+
+
+_CODE_FINGERPRINT = _code_fingerprint()
+
+
+def _source_digest() -> str:
+    """sha256 over programs.json and courses.json — what a snapshot was built from.
+
+    Content, not mtimes: a fresh checkout touches every file, and hashing a few
+    MB is still far cheaper than parsing them.
+    """
+    h = hashlib.sha256()
+    for path in (_DATA_DIR / "programs.json", _DATA_DIR / "courses.json"):
+        h.update(path.name.encode())
+        h.update(path.read_bytes() if path.exists() else b"-")
+    return h.hexdigest()
+
+
+def _build_catalog(raw_programs: list[dict], raw_courses: list[dict],
+                   texts: list[str] | None = None) -> dict:
+    """Normalise the raw bulletin data into records and build every index.
+
+    With `texts`, course descriptions are appended there and each course keeps
+    only its index — the snapshot writer turns the list into a _TextTable.
+    """
+    programs = [Program(prog) for prog in raw_programs]
+    by_name: dict[str, Program] = {}
+    by_plan_code: dict[str, Program] = {}
+    for prog in programs:
+        name = prog.get("program_name", "").strip()
+        if name:
+            by_name[name.lower()] = prog
+        for pc in prog.get("plan_codes", []):
+            if pc:
+                by_plan_code[pc.strip().upper()] = prog
+
+    by_code: dict[str, Course] = {}
+    by_dept: dict[str, list] = {}
+    by_gen_ed: dict[str, list] = {}
+    courses = []
+    for raw in raw_courses:
+        # Normalize any leftover non-breaking spaces in prereq conditions
+        for prereq in raw.get("prerequisites", []):
+            if prereq.get("condition"):
+                prereq["condition"] = prereq["condition"].replace("\xa0", " ")
+            if prereq.get("code"):
+                prereq["code"] = prereq["code"].replace("\xa0", " ")
+        course = Course(raw, texts)
+        courses.append(course)
+        code = _normalize_code(course.get("code", ""))
+        if code:
+            by_code[code] = course
+        dept = course.get("department", "").strip().upper()
+        if dept:
+            by_dept.setdefault(dept, []).append(course)
+        for cat in course.get("gen_ed", {}).get("categories", []):
+            by_gen_ed.setdefault(cat, []).append(course)
 
     # ── Popularity index ──────────────────────────────────────────────────────
     code_freq: dict[str, int] = {}
-    for prog in _programs:
+    for prog in programs:
         reqs = prog.get("requirements", {})
         for item in reqs.get("prescribed", []):
             c = item.get("code", "")
@@ -109,66 +532,210 @@ def _load_data() -> None:
                 c = opt.get("code", "")
                 if c:
                     code_freq[c] = code_freq.get(c, 0) + 1
-    threshold = 5
-    _popular_courses.update(c for c, n in code_freq.items() if n >= threshold)
-    logger.info(
-        "program_service: %d popular courses (appears in %d+ programs)",
-        len(_popular_courses), threshold,
-    )
 
+    return {
+        "programs": programs,
+        "program_search": _ProgramSearch(programs),
+        "courses": courses,
+        "programs_by_name": by_name,
+        "programs_by_plan_code": by_plan_code,
+        "courses_by_code": by_code,
+        "courses_by_dept": by_dept,
+        "courses_by_gen_ed": by_gen_ed,
+        "popular_courses": {c for c, n in code_freq.items() if n >= _POPULAR_THRESHOLD},
+        "prereq_graph": _PrereqGraph(by_code),
+    }
 
-_load_data()
+
+def _read_json() -> tuple[list[dict], list[dict]]:
+    programs_path = _DATA_DIR / "programs.json"
+    courses_path  = _DATA_DIR / "courses.json"
+    programs: list[dict] = []
+    courses: list[dict] = []
+    if programs_path.exists():
+        programs = json.loads(programs_path.read_text(encoding="utf-8"))
+    else:
+        logger.warning("program_service: programs.json not found at %s", programs_path)
+    if courses_path.exists():
+        courses = json.loads(courses_path.read_text(encoding="utf-8"))
+    else:
+        logger.warning("program_service: courses.json not found at %s", courses_path)
+    return programs, courses
+
+
+# Snapshot layout: an 8-byte length, that many bytes of course text, then two
+# pickles — a small header, and the catalog. The header comes before the
+# catalog so a stale snapshot is rejected without unpickling the rest; the text
+# sits in the same file so it can never belong to a different build.
+_TEXT_LENGTH = struct.Struct("<Q")
+
+
+def _read_snapshot(digest: str) -> dict | None:
+    """The snapshot's catalog if it was built from these sources by this version."""
+    try:
+        with open(_SNAPSHOT_PATH, "rb") as f:
+            (text_length,) = _TEXT_LENGTH.unpack(f.read(_TEXT_LENGTH.size))
+            f.seek(text_length, os.SEEK_CUR)
+            header = pickle.load(f)
+            if (header.get("version"), header.get("sources"), header.get("code")) != (
+                    CATALOG_SNAPSHOT_VERSION, digest, _CODE_FINGERPRINT):
+                logger.info("program_service: catalog snapshot is stale, reading JSON")
+                return None
+            catalog = pickle.load(f)
+            if text_length:
+                # Pages of the mapping are shared by every worker on the host.
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                catalog["texts"].attach(buf, _TEXT_LENGTH.size)
+            return catalog
+    except FileNotFoundError:
+        return None
+    except Exception as e:  # noqa: BLE001 — a bad snapshot must not stop the boot
+        logger.warning("program_service: catalog snapshot unreadable (%s), reading JSON", e)
+        return None
+
+
+def _share_strings(obj, pool: dict):
+    """Replace every string in obj with one shared instance per distinct value.
+
+    json.loads makes a new object for each occurrence of "C or better", "GQ" or
+    a college name; pickle then writes each out, and every worker holds them
+    all. Shared before pickling, each is stored — and loaded — once.
+    """
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            obj[key] = _share_strings(value, pool)
+    elif isinstance(obj, list):
+        for i, value in enumerate(obj):
+            obj[i] = _share_strings(value, pool)
+    elif isinstance(obj, str):
+        return pool.setdefault(obj, obj)
+    return obj
+
+
+def write_catalog_snapshot(path: Path | None = None) -> dict:
+    """Build the catalog from JSON and write it as a snapshot for _load_data.
+
+    Written to a temp file and renamed, so a worker booting mid-write reads the
+    old snapshot or the new one, never half of one. Returns the header.
+    """
+    path = Path(path or _SNAPSHOT_PATH)
+    digest = _source_digest()
+    raw_programs, raw_courses = _read_json()
+    _share_strings(raw_programs, {})
+    _share_strings(raw_courses, {})
+    texts: list[str] = []
+    catalog = _build_catalog(raw_programs, raw_courses, texts)
+
+    encoded = [t.encode("utf-8") for t in texts]
+    offsets = array("Q", [0])
+    for blob in encoded:
+        offsets.append(offsets[-1] + len(blob))
+    table = _TextTable(offsets)
+    for course in catalog["courses"]:
+        course.bind_texts(table)
+    catalog["texts"] = table
+
+    header = {
+        "version": CATALOG_SNAPSHOT_VERSION,
+        "sources": digest,
+        "code": _CODE_FINGERPRINT,
+        "programs": len(catalog["programs"]),
+        "courses": len(catalog["courses_by_code"]),
+    }
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(_TEXT_LENGTH.pack(offsets[-1]))
+        f.writelines(encoded)
+        pickle.dump(header, f, protocol=5)
+        pickle.dump(catalog, f, protocol=5)
+    os.replace(tmp, path)
+    return header
+
+
+def _install(catalog: dict, version: str = "") -> None:
+    global _programs, _program_search, _prereq_graph
+
+    _programs = catalog["programs"]
+    _program_search = catalog["program_search"]
+    _prereq_graph = catalog["prereq_graph"]
+    for index, built in (
+        (_programs_by_name, catalog["programs_by_name"]),
+        (_programs_by_plan_code, catalog["programs_by_plan_code"]),
+        (_courses_by_code, catalog["courses_by_code"]),
+        (_courses_by_dept, catalog["courses_by_dept"]),
+        (_courses_by_gen_ed, catalog["courses_by_gen_ed"]),
+        (_popular_courses, catalog["popular_courses"]),
+    ):
+        index.clear()
+        index.update(built)
+    _artifacts.reset(version)
+
+
+def _load_data() -> None:
+    """Load the catalog: the prebuilt snapshot when it matches the JSON, else the JSON.
+
+    The snapshot is one unpickle of already-normalised data and ready indexes;
+    the JSON path parses both files and builds them. Same result either way.
+    """
+    started = time.perf_counter()
+    digest = _source_digest()
+    catalog = _read_snapshot(digest)
+    source = "snapshot"
+    if catalog is None:
+        catalog = _build_catalog(*_read_json())
+        source = "json"
+    _install(catalog, digest[:12])
+    logger.info(
+        "program_service: loaded %d programs, %d courses, %d popular (in %d+ programs) "
+        "from %s in %.0f ms",
+        len(_programs), len(_courses_by_code), len(_popular_courses), _POPULAR_THRESHOLD,
+        source, (time.perf_counter() - started) * 1000,
+    )
 
 
 # ── Public lookup API ──────────────────────────────────────────────────────────
 
-def get_all_programs() -> list[dict]:
+def get_all_programs() -> list[Program]:
     """Return list of all programs."""
     return _programs
 
 
-def get_program(name: str) -> dict | None:
+def get_program(name: str) -> Program | None:
     """Exact case-insensitive lookup by program_name."""
     return _programs_by_name.get(name.strip().lower())
 
 
-def get_program_by_plan_code(plan_code: str) -> dict | None:
+def get_program_by_plan_code(plan_code: str) -> Program | None:
     """Find program by plan code (e.g. 'CMPSC_BS')."""
     return _programs_by_plan_code.get(plan_code.strip().upper())
 
 
-def search_programs(query: str, limit: int = 20) -> list[dict]:
-    """Fuzzy search over program names. Substring matches scored higher."""
-    q = query.strip().lower()
-    if not q:
-        return _programs[:limit]
-
-    results: list[tuple[float, dict]] = []
-    for prog in _programs:
-        name = prog.get("program_name", "").lower()
-        if q in name:
-            score = 1.0 + len(q) / max(len(name), 1)
-        else:
-            score = SequenceMatcher(None, q, name).ratio()
-        if score > 0.3:
-            results.append((score, prog))
+def search_programs(query: str, limit: int = 20) -> list[Program]:
+    """Type-ahead search over program names, initials, plan codes and aliases.
 
-    results.sort(key=lambda x: -x[0])
-    return [p for _, p in results[:limit]]
+    Ranked: an exact key, then a key the query starts, then every query word
+    starting a word of the key ("comp sci"), then a substring, then a fuzzy
+    gram match. Ties keep catalog order.
+    """
+    if not query.strip():
+        return _programs[:limit]
+    scores = _program_search.search(query)
+    ranked = sorted(scores, key=lambda i: (-scores[i], i))
+    return [_programs[i] for i in ranked[:limit]]
 
 
-def get_programs_by_college(college: str) -> list[dict]:
+def get_programs_by_college(college: str) -> list[Program]:
     """Return programs for a college slug (e.g. 'engineering')."""
     c = college.strip().lower()
     return [p for p in _programs if p.get("college", "").lower() == c]
 
 
-def get_course(code: str) -> dict | None:
+def get_course(code: str) -> Course | None:
     """Lookup a course by code; normalizes whitespace/case."""
     return _courses_by_code.get(_normalize_code(code))
 
 
-def get_courses_by_department(dept: str) -> list[dict]:
+def get_courses_by_department(dept: str) -> list[Course]:
     """Return all courses for a department code."""
     return _courses_by_dept.get(dept.strip().upper(), [])
 
@@ -179,7 +746,7 @@ def get_prerequisites(code: str) -> list[dict]:
     return (course or {}).get("prerequisites", [])
 
 
-def get_gen_ed_courses(category: str) -> list[dict]:
+def get_gen_ed_courses(category: str) -> list[Course]:
     """Return all courses carrying a gen-ed category code (e.g. 'GQ')."""
     return _courses_by_gen_ed.get(category.strip().upper(), [])
 
@@ -200,6 +767,7 @@ def _get_all_program_codes(program: dict) -> set[str]:
     return codes
 
 
+@_per_program
 def get_double_dips(program_name: str) -> list[dict]:
     """
     Return courses in the program that also carry gen-ed categories.
@@ -265,6 +833,7 @@ _GEN_ED_CATEGORIES = [
 ]
 
 
+@_per_program
 def build_gen_ed_response(program_name: str | None) -> dict:
     """
     Build the payload for GET /gen-ed.
@@ -366,6 +935,7 @@ def detect_major_from_text(text: str) -> str | None:
 _MAX_REQUIREMENT_GROUPS = 40
 
 
+@_per_program
 def build_program_context_snippet(program_name: str) -> str:
     """
     Return a concise text block describing the program's requirements,
@@ -464,25 +1034,24 @@ def _codes_in_text(text: str) -> list[str]:
     return out
 
 
-def _unmet_prereqs(code: str, done: set) -> list[str]:
+def _unmet_prereqs(code: str, done: set | int) -> list[str]:
     """Prerequisites still standing between the student and this course.
 
     Alternatives matter: CMPSC 121 lists MATH 110 *or* MATH 140, so a student who
     took MATH 140 is eligible. Treating the list as a conjunction would tell them
-    they are blocked by a course they never needed. _prereq_mode already knows
-    how to read the condition — reuse it rather than re-deriving.
+    they are blocked by a course they never needed. The compiled graph read the
+    condition once, with _prereq_mode, when the catalog was built.
+
+    `done` is canonical codes, or — to ask about many courses — their bitset
+    from _prereq_graph.bits_of, made once.
     """
-    prereqs = [p for p in get_prerequisites(code) if p.get("code")]
-    codes = [_canonical_code(p["code"]) for p in prereqs]
-    if not codes:
-        return []
-    outstanding = [c for c in dict.fromkeys(codes) if c not in done]
-    if not outstanding:
+    graph = _prereq_graph
+    i = graph.course_id(code)
+    if i is None:
         return []
-    # 'any' => one satisfied prerequisite unlocks the course.
-    if _prereq_mode(get_course(code), set(codes)) == "any" and len(outstanding) < len(set(codes)):
-        return []
-    return outstanding
+    if not isinstance(done, int):
+        done = graph.bits_of(done)
+    return [graph.codes[j] for j in graph.unmet(i, done)]
 
 
 def build_recommendation_context(program_name: str, completed_codes=None,
@@ -561,8 +1130,9 @@ def build_recommendation_context(program_name: str, completed_codes=None,
             if len(propose) >= 4:
                 break
 
+    done_bits = _prereq_graph.bits_of(done)
     for course in propose[:6]:
-        course["unmet_prereqs"] = _unmet_prereqs(course["code"], done)
+        course["unmet_prereqs"] = _unmet_prereqs(course["code"], done_bits)
 
     return {
         "plan_label": label,
@@ -610,7 +1180,7 @@ _PREREQ_MAP_MAX_NODES = 60
 _CODE_RE = re.compile(r"[A-Z]{2,8}\s*\d{1,3}[A-Z]?")
 
 
-def _prereq_mode(course: dict | None, prereq_set: set) -> str:
+def _prereq_mode(course: dict | None, prereq_set: set, courses: dict | None = None) -> str:
     """'all' only when the prereq condition is a pure conjunction, else 'any'.
 
     Keeps alternative prereqs (X or Y) from permanently locking a course.
@@ -620,7 +1190,7 @@ def _prereq_mode(course: dict | None, prereq_set: set) -> str:
     conds = " ".join(
         p.get("condition", "")
         for p in course.get("prerequisites", [])
-        if _canonical_code(p.get("code", "")) in prereq_set
+        if _canonical_code(p.get("code", ""), courses) in prereq_set
     ).lower()
     return "all" if (" and " in conds and " or " not in conds) else "any"
 
@@ -637,17 +1207,17 @@ def _extract_catalog_codes(text: str) -> list[str]:
 
 def _build_map_nodes(node_tiers: dict[str, int], kind_of: dict[str, str]) -> list[dict]:
     """Build node dicts (with in-set prerequisite edges) from {code: tier}."""
+    graph = _prereq_graph
     node_set = set(node_tiers)
     id_of = {c: c.replace(" ", "") for c in node_tiers}
     nodes: list[dict] = []
     for code, t in node_tiers.items():
         course = _courses_by_code.get(code)
-        prs: list[str] = []
-        if course:
-            for pr in course.get("prerequisites", []):
-                pc = _canonical_code(pr.get("code", ""))
-                if pc in node_set and pc != code and pc not in prs:
-                    prs.append(pc)
+        i = graph.course_id(code)
+        prs = [] if i is None else [
+            pc for pc in (graph.codes[j] for j in graph.requires[i])
+            if pc in node_set and pc != code
+        ]
         nodes.append({
             "id": id_of[code],
             "code": code,
@@ -661,6 +1231,7 @@ def _build_map_nodes(node_tiers: dict[str, int], kind_of: dict[str, str]) -> lis
     return nodes
 
 
+@_per_program
 def build_prereq_map(program_name: str) -> dict | None:
     """
     Build a course dependency graph for ANY major, two ways:
@@ -733,47 +1304,20 @@ def build_prereq_map(program_name: str) -> dict | None:
                 _add(opt["code"], "choice")
 
     # Transitive feeders so chains like CMPSC 121 → 122 → 221 are visible.
-    queue = list(node_codes)
+    graph = _prereq_graph
+    queue = deque(graph.ids[c] for c in node_codes)
     while queue and len(node_codes) < _PREREQ_MAP_MAX_NODES:
-        course = _courses_by_code.get(queue.pop(0))
-        if not course:
-            continue
-        for pr in course.get("prerequisites", []):
-            pc = _canonical_code(pr.get("code", ""))
-            if pc and pc in _courses_by_code and pc not in seen:
-                if _add(pc, "prereq"):
-                    queue.append(pc)
+        for j in graph.requires[queue.popleft()]:
+            if j < graph.n_courses and _add(graph.codes[j], "prereq"):
+                queue.append(j)
                 if len(node_codes) >= _PREREQ_MAP_MAX_NODES:
                     break
 
     if not node_codes:
         return {**base, "source": "none", "tier_labels": {}, "max_tier": 0, "courses": []}
 
-    node_set = set(node_codes)
-    prereq_codes = {
-        code: [
-            pc for pr in (_courses_by_code.get(code) or {}).get("prerequisites", [])
-            for pc in [_canonical_code(pr.get("code", ""))]
-            if pc in node_set and pc != code
-        ]
-        for code in node_codes
-    }
-    # dedup preserving order
-    prereq_codes = {k: list(dict.fromkeys(v)) for k, v in prereq_codes.items()}
-
-    tier: dict[str, int] = {}
-
-    def _depth(code: str, stack: frozenset) -> int:
-        if code in tier:
-            return tier[code]
-        if code in stack:
-            return 0
-        prs = prereq_codes.get(code, [])
-        d = 0 if not prs else 1 + max(_depth(p, stack | {code}) for p in prs)
-        tier[code] = d
-        return d
-
-    node_tiers = {code: _depth(code, frozenset()) + 1 for code in node_codes}
+    depth = graph.tiers([graph.ids[c] for c in node_codes])
+    node_tiers = {code: depth[graph.ids[code]] + 1 for code in node_codes}
     max_tier = max(node_tiers.values(), default=0)
     return {
         **base,
@@ -811,6 +1355,7 @@ def _semester_sort_key(key: str) -> tuple:
     return (_YEAR_ORDINAL.get(parts[0], 99), _SEASON_ORDER.get(parts[-1], 9))
 
 
+@_per_program
 def build_suggested_plan(program_name: str) -> dict | None:
     """
     Build the college's suggested semester-by-semester academic plan for a
@@ -853,24 +1398,188 @@ def build_suggested_plan(program_name: str) -> dict | None:
 
 # ── Prerequisite graph, for the map block ─────────────────────────────────────
 
-_unlock_index: dict[str, list[str]] | None = None
+def _bits(ids) -> int:
+    out = 0
+    for i in ids:
+        out |= 1 << i
+    return out
+
+
+class _PrereqGraph:
+    """Every course's prerequisites, compiled once per catalog to integer ids.
 
+    Node i is codes[i]. Courses that some other course requires come first, in
+    topological order — a prerequisite before whatever it unlocks — then the
+    rest of the catalog, then prerequisite codes the catalog has no record of.
+    Sets of nodes are ints used as bitsets, bit i for node i, so "which of these
+    are done?" is an `&`; numbering the feeders first keeps an ancestor set as
+    short as the feeders are few.
 
-def _build_unlock_index() -> dict[str, list[str]]:
-    """code → courses that list it as a prerequisite. Built once, 9k courses."""
-    global _unlock_index
-    if _unlock_index is None:
-        idx: dict[str, list[str]] = {}
-        for code, course in _courses_by_code.items():
-            for p in course.get("prerequisites", []):
-                key = _normalize_code(p.get("code", ""))
-                if key:
-                    idx.setdefault(key, []).append(code)
-        _unlock_index = idx
-    return _unlock_index
+        requires[i]   canonical prerequisite ids, in listing order
+        any_of[i]     one of them is enough (_prereq_mode says "any")
+        groups[i]     parse_prereq_groups, as AND-ed tuples of OR-ed ids
+        prereqs[i]    requires less unknown codes, i itself, and any edge that
+                      would close a cycle
+        unlocks[i]    the courses requiring i — the reverse edges
+        depth[i]      longest `prereqs` chain below i
+        ancestors[i]  bitset of every course below i, transitively
 
+    Pickled into the catalog snapshot, so a worker never compiles it.
+    """
 
-def parse_prereq_groups(condition: str, codes: list[str]) -> list[list[str]]:
+    __slots__ = ("codes", "ids", "n_courses", "canon", "requires", "any_of", "groups",
+                 "prereqs", "unlocks", "depth", "ancestors")
+
+    def __init__(self, courses: dict):
+        # Parse against provisional ids, in catalog order.
+        codes = list(courses)
+        ids = {code: i for i, code in enumerate(codes)}
+
+        def node(code: str) -> int:
+            if code not in ids:
+                ids[code] = len(codes)
+                codes.append(code)
+            return ids[code]
+
+        requires, any_of, groups = [], [], []
+        for code in list(codes):
+            course = courses[code]
+            prereqs = [p for p in course.get("prerequisites", []) if p.get("code")]
+            listed = [p["code"] for p in prereqs]
+            canonical = [_canonical_code(c, courses) for c in listed]
+            requires.append(tuple(node(c) for c in dict.fromkeys(canonical)))
+            any_of.append(bool(canonical) and
+                          _prereq_mode(course, set(canonical), courses) == "any")
+            condition = next((p.get("condition") for p in prereqs if p.get("condition")), "")
+            groups.append(tuple(
+                tuple(node(c) for c in group)
+                for group in parse_prereq_groups(condition, listed, courses)
+            ))
+        n, n_courses = len(codes), len(courses)
+        requires += [()] * (n - n_courses)
+        any_of += [False] * (n - n_courses)
+        groups += [()] * (n - n_courses)
+
+        # Depth-first, prerequisites before dependents. An edge back to a course
+        # still on the stack is a cycle in the bulletin data; it is dropped, so
+        # everything after can assume a DAG.
+        feeds = [[j for j in required if j < n_courses and j != i]
+                 for i, required in enumerate(requires)]
+        kept = [[] for _ in range(n)]
+        state = bytearray(n)            # 0 unseen, 1 on the stack, 2 finished
+        order: list[int] = []
+        for root in range(n_courses):
+            if state[root]:
+                continue
+            state[root] = 1
+            stack = [(root, iter(feeds[root]))]
+            while stack:
+                i, pending = stack[-1]
+                for j in pending:
+                    if state[j] == 1:
+                        continue
+                    kept[i].append(j)
+                    if state[j] == 0:
+                        state[j] = 1
+                        stack.append((j, iter(feeds[j])))
+                        break
+                else:
+                    stack.pop()
+                    state[i] = 2
+                    order.append(i)
+
+        feeder = bytearray(n)
+        for below in kept:
+            for j in below:
+                feeder[j] = 1
+        final = ([i for i in order if feeder[i]]
+                 + [i for i in range(n_courses) if not feeder[i]]
+                 + list(range(n_courses, n)))
+        new_id = [0] * n
+        for k, i in enumerate(final):
+            new_id[i] = k
+
+        def remap(old_ids) -> tuple:
+            return tuple(new_id[j] for j in old_ids)
+
+        self.codes = [codes[i] for i in final]
+        self.ids = {code: k for k, code in enumerate(self.codes)}
+        self.n_courses = n_courses
+        self.canon = [self.ids[_canonical_code(code, courses)] for code in self.codes]
+        self.requires = [remap(requires[i]) for i in final]
+        self.any_of = [any_of[i] for i in final]
+        self.groups = [tuple(remap(g) for g in groups[i]) for i in final]
+        self.prereqs = [remap(kept[i]) for i in final]
+
+        unlocks = [[] for _ in range(n)]
+        for i, required in enumerate(self.requires):
+            for j in required:
+                if j != i:
+                    unlocks[j].append(i)
+        self.unlocks = [tuple(u) for u in unlocks]
+
+        # Ids are a topological order now, so one forward pass fills both.
+        self.depth = [0] * n
+        self.ancestors = [0] * n
+        for i, below in enumerate(self.prereqs):
+            if below:
+                self.depth[i] = 1 + max(self.depth[j] for j in below)
+                ancestors = 0
+                for j in below:
+                    ancestors |= 1 << j | self.ancestors[j]
+                self.ancestors[i] = ancestors
+
+    def course_id(self, code: str) -> int | None:
+        """The node for a catalog course, by its own (not canonical) code."""
+        i = self.ids.get(_normalize_code(code))
+        return i if i is not None and i < self.n_courses else None
+
+    def bits_of(self, codes) -> int:
+        """Bitset of the canonical nodes for `codes`; unknown codes are skipped."""
+        out = 0
+        for code in codes:
+            i = self.ids.get(code)
+            if i is None:
+                i = self.ids.get(_canonical_code(code))
+                if i is None:
+                    continue
+            out |= 1 << self.canon[i]
+        return out
+
+    def unmet(self, i: int, done: int) -> list[int]:
+        """Prerequisites of i not in `done`, or none if an alternative is done."""
+        required = self.requires[i]
+        outstanding = [j for j in required if not done >> j & 1]
+        if self.any_of[i] and len(outstanding) < len(required):
+            return []
+        return outstanding
+
+    def satisfied(self, i: int, done: int) -> bool:
+        """Every AND-ed group of i has at least one option in `done`."""
+        canon = self.canon
+        return all(any(done >> canon[j] & 1 for j in group) for group in self.groups[i])
+
+    def tiers(self, ids: list[int]) -> dict[int, int]:
+        """Prerequisite depth of each of `ids`, counting only edges among them.
+
+        When the set holds every course below its members — the usual case —
+        that is the catalog-wide depth, read straight from the table.
+        """
+        members = _bits(ids)
+        if all(not self.ancestors[i] & ~members for i in ids):
+            return {i: self.depth[i] for i in ids}
+        tier: dict[int, int] = {}
+        for i in sorted(ids):
+            below = [tier[j] for j in self.prereqs[i] if j in tier]
+            tier[i] = 1 + max(below) if below else 0
+        return tier
+
+
+_prereq_graph = _PrereqGraph({})
+
+
+def parse_prereq_groups(condition: str, codes: list[str],
+                        courses: dict | None = None) -> list[list[str]]:
     """Turn a catalog condition into AND-ed groups of OR-ed alternatives.
 
     "( CMPSC 122 or CMPSC 132 ) and ( CMPSC 360 or MATH 311W )"
@@ -878,7 +1587,10 @@ def parse_prereq_groups(condition: str, codes: list[str]) -> list[list[str]]:
 
     That shape is the whole reason the map beats a sentence: prose has to say
     "you need 122 or 132, and also 360 or 311W", which nobody parses.
+    _PrereqGraph parses every course's condition once, against `courses`; the
+    loaded catalog is the default.
     """
+    courses = _courses_by_code if courses is None else courses
     text = re.sub(r"^.*?:", "", condition or "", count=1).strip().rstrip(".")
     known = {_normalize_code(c) for c in codes}
 
@@ -904,8 +1616,8 @@ def parse_prereq_groups(condition: str, codes: list[str]) -> list[list[str]]:
     if not groups and known:
         # No usable condition text: fall back to the and/or mode we can infer.
         ordered = [c for c in (_normalize_code(x) for x in codes) if c]
-        course = _courses_by_code.get(_normalize_code(codes[0])) if codes else None
-        if _prereq_mode(course, known) == "any":
+        course = courses.get(_normalize_code(codes[0])) if codes else None
+        if _prereq_mode(course, known, courses) == "any":
             groups = [ordered]
         else:
             groups = [[c] for c in ordered]
@@ -922,27 +1634,26 @@ def build_prereq_graph(code: str, completed=None, max_unlocks: int = 6,
     in CMPSC 360, one of the two courses it was waiting on.
     """
     target = get_course(code)
-    if not target:
+    graph = _prereq_graph
+    i = graph.course_id(code)
+    if not target or i is None:
         return None
 
-    done = {_canonical_code(c) for c in (completed or [])}
-    doing = {_canonical_code(c) for c in (in_progress or [])} - done
-    prereqs = [p for p in get_prerequisites(code) if p.get("code")]
-    codes = [p["code"] for p in prereqs]
-    condition = next((p.get("condition") for p in prereqs if p.get("condition")), "")
+    done = graph.bits_of(completed or [])
+    doing = graph.bits_of(in_progress or []) & ~done
 
-    def node(c):
-        info = _courses_by_code.get(_normalize_code(c)) or {}
-        canon = _canonical_code(c)
-        return {"code": _normalize_code(c),
+    def node(j):
+        c = graph.codes[j]
+        info = _courses_by_code.get(c) or {}
+        return {"code": c,
                 "title": (info.get("title") or "").strip(),
-                "done": canon in done,
-                "in_progress": canon in doing}
+                "done": bool(done >> graph.canon[j] & 1),
+                "in_progress": bool(doing >> graph.canon[j] & 1)}
 
-    groups = [[node(c) for c in group] for group in parse_prereq_groups(condition, codes)]
+    groups = [[node(j) for j in group] for group in graph.groups[i]]
     unlocks = [
         {"code": c, "title": (_courses_by_code.get(c, {}).get("title") or "").strip()}
-        for c in sorted(_build_unlock_index().get(_normalize_code(code), []))
+        for c in sorted(graph.codes[j] for j in graph.unlocks[graph.canon[i]])
     ]
 
     return {
@@ -952,12 +1663,15 @@ def build_prereq_graph(code: str, completed=None, max_unlocks: int = 6,
         "groups": groups,
         # A group is satisfied when ANY of its options is done; the course is
         # eligible when every group is satisfied.
-        "eligible": all(any(n["done"] for n in g) for g in groups) if groups else True,
+        "eligible": graph.satisfied(i, done),
         # Every group either satisfied or being satisfied this term — the honest
         # answer to a question about a FUTURE term.
-        "on_track": all(any(n["done"] or n["in_progress"] for n in g)
-                        for g in groups) if groups else True,
-        "has_record": bool(done or doing),
+        "on_track": graph.satisfied(i, done | doing),
+        "has_record": bool(completed or in_progress),
         "unlocks": unlocks[:max_unlocks],
         "unlocks_more": max(0, len(unlocks) - max_unlocks),
     }
+
+
+# Last, so the catalog build can use every helper above.
+_load_data()
@@ -0,0 +1,120 @@
+"""Token budget for the system prompt.
+
+The chat system prompt is the fixed contract plus up to twenty grounding
+sections — handbook records, the student's document, program requirements,
+policies, places, events — and nothing used to bound the total. Input tokens
+are most of what ACE spends.
+
+Each section is counted with the chat model's own tokenizer (tiktoken, run
+locally), held to its own cap, and — when the sections together still exceed
+what the budget leaves after the fixed text — trimmed lowest priority first
+until they fit. The per-section result is logged and stored on the call's
+api_usage row.
+
+Without tiktoken, or when its encoding cannot be fetched, counts fall back to
+~4 characters per token: approximate, and logged once, but never a reason for
+a question to go unanswered.
+"""
+
+import logging
+import math
+
+from backend.config import OPENAI_CHAT_MODEL
+
+logger = logging.getLogger(__name__)
+
+TRIM_MARKER = "\n[…trimmed to fit the prompt budget]"
+_CHARS_PER_TOKEN = 4
+
+_encoder = None
+_encoder_failed = False
+
+
+def _get_encoder():
+    """The chat model's tiktoken encoding, or None to estimate from length."""
+    global _encoder, _encoder_failed
+    if _encoder is None and not _encoder_failed:
+        try:
+            import tiktoken
+            try:
+                _encoder = tiktoken.encoding_for_model(OPENAI_CHAT_MODEL)
+            except KeyError:
+                _encoder = tiktoken.get_encoding("o200k_base")
+        except Exception as exc:  # noqa: BLE001 — ImportError, or no network for the BPE file
+            _encoder_failed = True
+            logger.warning("prompt budget | no local tokenizer (%s); estimating %d chars/token",
+                           exc, _CHARS_PER_TOKEN)
+    return _encoder
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is None:
+        return math.ceil(len(text) / _CHARS_PER_TOKEN)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens):
+    """`text` cut to at most `max_tokens`, marker included, ending on a line
+    break where one is close by. "" when not even the marker fits."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    room = max_tokens - count_tokens(TRIM_MARKER)
+    if room <= 0:
+        return ""
+    encoder = _get_encoder()
+    if encoder is None:
+        head = text[:room * _CHARS_PER_TOKEN]
+    else:
+        head = encoder.decode(encoder.encode(text, disallowed_special=())[:room])
+    # A half line is worse than a missing one; back up to the last break unless
+    # that would throw away most of what was kept.
+    cut = head.rfind("\n")
+    if cut > len(head) // 2:
+        head = head[:cut]
+    return head.rstrip() + TRIM_MARKER
+
+
+def fit_sections(sections, budget):
+    """Hold `sections` to their caps, then to `budget` tokens in total.
+
+    sections: [(name, text, priority, cap)] — priority None is never trimmed,
+    otherwise lower priority is trimmed first; cap is a per-section token limit
+    or None.
+
+    Returns (texts, breakdown): texts maps name → the text to use; breakdown
+    maps name → {"tokens": final} plus "trimmed_from" for every section that
+    was cut. Empty sections are left out of the breakdown.
+    """
+    texts, tokens, original = {}, {}, {}
+    for name, text, _, cap in sections:
+        text = text or ""
+        original[name] = tokens[name] = count_tokens(text)
+        if cap is not None and original[name] > cap:
+            text = truncate_tokens(text, cap)
+            tokens[name] = count_tokens(text)
+        texts[name] = text
+
+    over = sum(tokens.values()) - max(budget, 0)
+    trimmable = sorted(
+        (s for s in sections if s[2] is not None and tokens[s[0]]),
+        key=lambda s: s[2],
+    )
+    for name, _, _, _ in trimmable:
+        if over <= 0:
+            break
+        keep = max(tokens[name] - over, 0)
+        texts[name] = truncate_tokens(texts[name], keep)
+        over -= tokens[name] - count_tokens(texts[name])
+        tokens[name] = count_tokens(texts[name])
+
+    breakdown = {}
+    for name, _, _, _ in sections:
+        if not original[name]:
+            continue
+        breakdown[name] = {"tokens": tokens[name]}
+        if tokens[name] != original[name]:
+            breakdown[name]["trimmed_from"] = original[name]
+    return texts, breakdown
@@ -5,8 +5,9 @@ import logging
 from datetime import datetime, timezone
 from pypdf import PdfReader
 from backend.services.audit_parser_service import (
-    parse_whatif_blocks, merge_satisfied_requirements,
+    AUDIT_PARSER_VERSION, parse_whatif_blocks, merge_satisfied_requirements,
 )
+from backend.services.profile_service import parse_profile
 from backend.config import UPLOAD_DIR, MAX_UPLOAD_FILES
 from backend.database import SessionLocal
 from backend.models import User, UserDocument
@@ -174,6 +175,8 @@ def load_student_document(file_path: str, filename: str, user_id: str, db=None)
             existing.text = text
             existing.analysis_json = json.dumps(analysis)
             existing.audit_parse_json = json.dumps(audit_parse)
+            existing.derived_audit_json = json.dumps(audit_parse)
+            existing.derived_audit_version = AUDIT_PARSER_VERSION
             existing.uploaded_at = datetime.now(timezone.utc)
         else:
             doc = UserDocument(
@@ -183,6 +186,9 @@ def load_student_document(file_path: str, filename: str, user_id: str, db=None)
                 text=text,
                 analysis_json=json.dumps(analysis),
                 audit_parse_json=json.dumps(audit_parse),
+                # parse_whatif_blocks has already applied the correction.
+                derived_audit_json=json.dumps(audit_parse),
+                derived_audit_version=AUDIT_PARSER_VERSION,
             )
             db.add(doc)
 
@@ -218,28 +224,34 @@ def load_student_document(file_path: str, filename: str, user_id: str, db=None)
 
 
 def _corrected_audit(row):
+    """The audit the current parser derives for a stored document.
+
+    Re-parsed from the document's text, so a change to parse_whatif_blocks
+    reaches stored rows as well as one to merge_satisfied_requirements (which
+    it applies). A row with no text keeps its stored parse, corrected.
+    """
     if not row.audit_parse_json:
         return None
-    parsed = json.loads(row.audit_parse_json)
     try:
-        return merge_satisfied_requirements(parsed, row.text or "")
-    except Exception:  # noqa: BLE001 — a correction must not break a read
-        return parsed
+        if row.text:
+            return parse_whatif_blocks(row.text)
+        return merge_satisfied_requirements(json.loads(row.audit_parse_json), "")
+    except Exception as exc:  # noqa: BLE001 — a correction must not break a read
+        _logger.warning("derived audit | document %s: %s", row.id, exc)
+    try:
+        return json.loads(row.audit_parse_json)
+    except ValueError:
+        return None
 
 
-def get_current_student_doc(user_id: str, db=None) -> dict:
-    db, should_close = _ensure_db(db)
-    try:
-        row = (
-            db.query(UserDocument)
-            .filter_by(user_id=user_id)
-            .order_by(UserDocument.uploaded_at.desc())
-            .first()
-        )
-    finally:
-        if should_close:
-            db.close()
+def _derived_audit(row):
+    """The stored derived audit when it is current, else derived from the text."""
+    if row.derived_audit_version == AUDIT_PARSER_VERSION and row.derived_audit_json:
+        return json.loads(row.derived_audit_json)
+    return _corrected_audit(row)
+
 
+def _doc_from_row(row) -> dict:
     if not row:
         return {
             "filename": None, "file_path": None, "doc_type": None,
@@ -252,12 +264,65 @@ def get_current_student_doc(user_id: str, db=None) -> dict:
         "doc_type": row.doc_type,
         "text": row.text,
         "analysis": json.loads(row.analysis_json) if row.analysis_json else None,
-        # Re-applied on read so documents parsed before the transfer-credit fix
-        # are corrected without asking the student to upload again.
-        "audit_parse": _corrected_audit(row),
+        # Documents parsed before the transfer-credit fix are corrected without
+        # asking the student to upload again: once, by the backfill, and stored.
+        "audit_parse": _derived_audit(row),
     }
 
 
+def get_current_student_doc(user_id: str, db=None) -> dict:
+    db, should_close = _ensure_db(db)
+    try:
+        row = (
+            db.query(UserDocument)
+            .filter_by(user_id=user_id)
+            .order_by(UserDocument.uploaded_at.desc())
+            .first()
+        )
+    finally:
+        if should_close:
+            db.close()
+    return _doc_from_row(row)
+
+
+def backfill_derived_audits(batch_size: int = 200, db=None) -> int:
+    """Store the current derived audit on every row that lacks one. Returns the
+    number of rows upgraded.
+
+    Run once per release by `python -m backend.scripts.backfill_audits` (see the
+    Procfile), and by hand after AUDIT_PARSER_VERSION is bumped. Commits per batch, so an interrupted
+    run keeps what it did and the next one picks up where it stopped.
+    """
+    db, should_close = _ensure_db(db)
+    upgraded = 0
+    try:
+        while True:
+            rows = (
+                db.query(UserDocument)
+                .filter(
+                    UserDocument.audit_parse_json.isnot(None),
+                    (UserDocument.derived_audit_version.is_(None))
+                    | (UserDocument.derived_audit_version != AUDIT_PARSER_VERSION),
+                )
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                row.derived_audit_json = json.dumps(_corrected_audit(row))
+                row.derived_audit_version = AUDIT_PARSER_VERSION
+            db.commit()
+            upgraded += len(rows)
+    finally:
+        if should_close:
+            db.close()
+    if upgraded:
+        _logger.info("backfill_derived_audits | upgraded %d rows to v%d",
+                     upgraded, AUDIT_PARSER_VERSION)
+    return upgraded
+
+
 def clear_student_document(user_id: str, db=None) -> None:
     db, should_close = _ensure_db(db)
     try:
@@ -324,7 +389,11 @@ def clear_user_major(user_id: str, db=None) -> None:
 
 
 def build_student_doc_context(user_id: str, max_chars: int = 5000) -> str:
-    doc = get_current_student_doc(user_id)
+    return format_student_doc_context(get_current_student_doc(user_id), max_chars)
+
+
+def format_student_doc_context(doc: dict, max_chars: int = 5000) -> str:
+    """The prompt block for an already-loaded document. "" when it has no text."""
     text = doc.get("text") or ""
     if not text:
         return ""
@@ -375,3 +444,59 @@ def build_student_doc_context(user_id: str, max_chars: int = 5000) -> str:
         f"Structured findings from the document:\n{analysis_block}\n\n"
         f"Document content excerpt:\n{text[:max_chars]}"
     )
+
+
+# ── Per-request student state ──────────────────────────────────────────────
+
+class StudentState:
+    """Everything a chat answer reads about the signed-in student, loaded once.
+
+    A message used to open a session each for the major, has_student_doc (twice),
+    the document, the document context (which read the document again) and the
+    profile (up to three times) — 7–9 round-trips, and the audit correction
+    re-run on every document read. load_student_state() does one query; the
+    JSON is parsed and the audit corrected here, once.
+    """
+
+    __slots__ = ("user_id", "major", "profile", "doc", "doc_context")
+
+    def __init__(self, user_id=None, major=None, profile=None, doc=None):
+        self.user_id = user_id
+        self.major = major
+        self.profile = profile or {}
+        self.doc = doc or _doc_from_row(None)
+        self.doc_context = format_student_doc_context(self.doc)
+
+    @property
+    def has_doc(self) -> bool:
+        """has_student_doc() for the loaded document: it has extracted text."""
+        return bool(self.doc.get("text"))
+
+
+def load_student_state(user_id: str, db=None) -> StudentState:
+    """The user row and their latest document in one query. An empty state for
+    a signed-out caller or an unknown user."""
+    if not user_id:
+        return StudentState()
+    db, should_close = _ensure_db(db)
+    try:
+        found = (
+            db.query(User, UserDocument)
+            .outerjoin(UserDocument, UserDocument.user_id == User.id)
+            .filter(User.id == user_id)
+            .order_by(UserDocument.uploaded_at.desc())
+            .first()
+        )
+    finally:
+        if should_close:
+            db.close()
+
+    if not found:
+        return StudentState(user_id)
+    user, row = found
+    return StudentState(
+        user_id,
+        major=user.selected_major,
+        profile=parse_profile(user.profile_json),
+        doc=_doc_from_row(row),
+    )
@@ -65,6 +65,69 @@ def save_exchange(user_id, conversation_id, question, answer, intent, sources):
         db.close()
 
 
+def reserve_exchange(user_id, conversation_id, question, intent):
+    """Insert the question and an empty assistant row; return the row's id.
+
+    The streaming path calls this while the model is still answering, so the
+    done frame can carry a message id without waiting on a write after the
+    last token. finish_exchange fills the row in. Never raises.
+    """
+    if not user_id or not conversation_id:
+        return None
+
+    db = SessionLocal()
+    try:
+        if not db.get(Conversation, conversation_id):
+            db.add(Conversation(
+                id=conversation_id,
+                user_id=user_id,
+                title=question[:200] or None,
+            ))
+        db.add(Message(conversation_id=conversation_id, role="user", content=question))
+        assistant = Message(
+            conversation_id=conversation_id, role="assistant", content="", intent=intent,
+        )
+        db.add(assistant)
+        db.commit()
+        return assistant.id
+    except Exception as e:
+        db.rollback()
+        logger.error("reserve_exchange | failed to persist: %s", e, exc_info=True)
+        return None
+    finally:
+        db.close()
+
+
+def finish_exchange(message_id, answer, sources):
+    """Write the answer into a reserved row. Never raises.
+
+    An empty answer — the stream failed, or said nothing — removes the reserved
+    question and row instead, as save_exchange would never have written them.
+    """
+    if not message_id:
+        return
+
+    db = SessionLocal()
+    try:
+        assistant = db.get(Message, message_id)
+        if assistant is None:
+            return
+        if answer:
+            assistant.content = answer
+            assistant.sources_json = json.dumps(sources or [])
+        else:
+            question = _preceding_question(db, assistant)
+            if question is not None:
+                db.delete(question)
+            db.delete(assistant)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error("finish_exchange | failed to persist: %s", e, exc_info=True)
+    finally:
+        db.close()
+
+
 def set_rating(db, message_id, rating, user_id):
     """Record a thumbs rating. Returns True if it landed.
 
@@ -91,14 +154,13 @@ def review_summary(db, days=7):
     playbook's "dead end" — an answer given without anything backing it.
     """
     since = datetime.now(timezone.utc) - timedelta(days=days)
-    answers = (
-        db.query(Message)
-        .filter(Message.role == "assistant", Message.created_at >= since)
-    )
+    # Rows reserved for an answer still streaming are empty; they are not answers yet.
+    answered = (Message.role == "assistant", Message.created_at >= since, Message.content != "")
+    answers = db.query(Message).filter(*answered)
 
     by_intent = dict(
         db.query(Message.intent, func.count(Message.id))
-        .filter(Message.role == "assistant", Message.created_at >= since)
+        .filter(*answered)
         .group_by(Message.intent)
         .all()
     )
@@ -125,9 +187,9 @@ def review_summary(db, days=7):
     }
 
 
-def _question_for(db, assistant_msg):
+def _preceding_question(db, assistant_msg):
     """The user question immediately preceding an assistant answer."""
-    q = (
+    return (
         db.query(Message)
         .filter(
             Message.conversation_id == assistant_msg.conversation_id,
@@ -137,6 +199,10 @@ def _question_for(db, assistant_msg):
         .order_by(Message.id.desc())
         .first()
     )
+
+
+def _question_for(db, assistant_msg):
+    q = _preceding_question(db, assistant_msg)
     return {
         "question": q.content if q else None,
         "intent": assistant_msg.intent,
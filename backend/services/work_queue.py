@@ -0,0 +1,139 @@
+"""In-process queue for work that happens after an answer is on screen.
+
+Saving the exchange and mining the question for profile signals (sometimes a
+model call of its own) used to run between the last token and the done frame,
+so the student waited on them before seeing sources or the rating buttons.
+They are queued here instead, and the done frame goes out at once.
+
+A fixed pool of daemon threads drains one bounded queue. submit() returns a
+concurrent.futures.Future, so a caller that does need the result — the async
+stream awaiting it via asyncio.wrap_future — can still have it. A full queue
+runs the task inline: slower for that one request, but nothing is dropped.
+shutdown() stops taking work and flushes what is queued, within a timeout; the
+app lifespan calls it, and an atexit hook covers scripts and the eval runner.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from backend.config import POST_ANSWER_WORKERS, POST_ANSWER_QUEUE_SIZE, POST_ANSWER_FLUSH_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue:
+    """Bounded FIFO of (fn, args) run by `workers` threads, started on first submit."""
+
+    def __init__(self, workers=POST_ANSWER_WORKERS, maxsize=POST_ANSWER_QUEUE_SIZE, name="post-answer"):
+        self.workers = max(1, workers)
+        self.name = name
+        self._queue = queue.Queue(maxsize)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+        self.ran_inline = 0
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._drain, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _drain(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._run(*item)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, fn, args, future):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            result = fn(*args)
+        except Exception as exc:  # noqa: BLE001 — nobody is left to raise to
+            self.failed += 1
+            logger.warning("%s | %s failed: %s", self.name, fn.__name__, exc, exc_info=True)
+            future.set_exception(exc)
+        else:
+            self.completed += 1
+            future.set_result(result)
+
+    def submit(self, fn, *args):
+        """Queue fn(*args); returns its Future. Never blocks on a full queue."""
+        future = Future()
+        if self._closed:
+            self.ran_inline += 1
+            self._run(fn, args, future)
+            return future
+        self._start()
+        try:
+            self._queue.put_nowait((fn, args, future))
+        except queue.Full:
+            self.ran_inline += 1
+            logger.warning("%s | queue full (%d), running %s inline",
+                           self.name, self._queue.maxsize, fn.__name__)
+            self._run(fn, args, future)
+        return future
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far has run. True if it all did in time."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=POST_ANSWER_FLUSH_TIMEOUT):
+        """Stop taking work, flush the queue, and stop the workers."""
+        self._closed = True
+        if not self._threads:
+            return True
+        flushed = self.flush(timeout)
+        if not flushed:
+            logger.warning("%s | shutdown left %d task(s) unrun after %ss",
+                           self.name, self._queue.unfinished_tasks, timeout)
+            return False
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        return True
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "pending": self._queue.unfinished_tasks,
+            "completed": self.completed,
+            "failed": self.failed,
+            "ran_inline": self.ran_inline,
+        }
+
+
+_work_queue = None
+
+
+def get_work_queue():
+    """The process-wide post-answer queue, built on first use."""
+    global _work_queue
+
+    if _work_queue is None:
+        _work_queue = WorkQueue()
+        atexit.register(_work_queue.shutdown)
+    return _work_queue
@@ -0,0 +1,78 @@
+"""Self-check for the answer cache: what counts as the same question, and when
+an answer stops being reusable. Both backends, no network.
+
+    python -m backend.test_answer_cache
+"""
+
+import os
+import tempfile
+import time
+
+from backend.services import answer_cache as ac
+
+PROMPT = "=== STUDENT'S PROGRAM ===\nComputer Science"
+
+
+def _caches():
+    path = os.path.join(tempfile.mkdtemp(), "answers.sqlite3")
+    return [ac.AnswerCache(ac.MemoryBackend()), ac.AnswerCache(ac.SqliteBackend(path=path))]
+
+
+def test_exact_and_reworded_questions_hit():
+    for cache in _caches():
+        scope = ac.answer_scope("course", "CS", PROMPT, "What is ETM?", embedding=[1.0, 0.0, 0.0])
+        assert cache.lookup(scope) is None
+        cache.store(scope, "Entrance to major.")
+
+        same = ac.answer_scope("course", "CS", PROMPT, "  what is  ETM? ")
+        assert cache.lookup(same) == "Entrance to major.", type(cache.backend).__name__
+        close = ac.answer_scope("course", "CS", PROMPT, "explain ETM", embedding=[0.99, 0.05, 0.0])
+        assert cache.lookup(close) == "Entrance to major."
+        far = ac.answer_scope("course", "CS", PROMPT, "what is GPA?", embedding=[0.6, 0.8, 0.0])
+        assert cache.lookup(far) is None
+        assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+
+
+def test_anything_the_model_saw_changes_the_bucket():
+    base = ac.answer_scope("course", "CS", PROMPT, "What is ETM?")
+    for other in (
+        ac.answer_scope("general", "CS", PROMPT, "What is ETM?"),
+        ac.answer_scope("course", "DS", PROMPT, "What is ETM?"),
+        ac.answer_scope("course", "CS", PROMPT + "\nCMPSC 465 ...", "What is ETM?"),
+    ):
+        assert other["bucket"] != base["bucket"]
+
+    model = ac.llm.CHAT_MODEL
+    ac.llm.CHAT_MODEL = "another-model"
+    try:
+        assert ac.answer_scope("course", "CS", PROMPT, "What is ETM?")["bucket"] != base["bucket"], \
+            "a model switch retires the previous model's answers"
+    finally:
+        ac.llm.CHAT_MODEL = model
+
+
+def test_expired_answers_are_not_served():
+    for cache in _caches():
+        scope = ac.answer_scope("deadline", None, PROMPT, "when is late drop?", dated=True)
+        assert scope["expires_at"] <= ac._next_midnight()
+        cache.store({**scope, "expires_at": time.time() - 1}, "Friday.")
+        assert cache.lookup(scope) is None
+        cache.store(scope, "Friday.")
+        assert cache.lookup(scope) == "Friday." and len(cache.backend) == 1
+
+
+def test_memory_backend_is_bounded():
+    cache = ac.AnswerCache(ac.MemoryBackend(maxsize=3))
+    for i in range(5):
+        cache.store(ac.answer_scope("general", None, f"prompt {i}", "hi"), f"answer {i}")
+    assert len(cache.backend) == 3
+    assert cache.lookup(ac.answer_scope("general", None, "prompt 0", "hi")) is None
+    assert cache.lookup(ac.answer_scope("general", None, "prompt 4", "hi")) == "answer 4"
+
+
+if __name__ == "__main__":
+    test_exact_and_reworded_questions_hit()
+    test_anything_the_model_saw_changes_the_bucket()
+    test_expired_answers_are_not_served()
+    test_memory_backend_is_bounded()
+    print("all answer cache checks passed")
@@ -0,0 +1,133 @@
+"""Self-check for the catalog snapshot: it loads exactly what the JSON does, and
+is ignored the moment it no longer matches. Runs on a throwaway data directory.
+
+    python -m backend.test_catalog_snapshot
+"""
+
+import json
+import pickle
+import tempfile
+from pathlib import Path
+
+from backend.services import program_service as ps
+
+PROGRAMS = [
+    {"program_name": "Computer Science, B.S. (Engineering)", "plan_codes": ["CMPSC_BS"],
+     "college": "engineering",
+     "requirements": {"prescribed": [{"code": "CMPSC 131"}],
+                      "additional": [{"options": [{"code": "MATH 140"}]}]}},
+] + [
+    {"program_name": f"Program {i}", "plan_codes": [f"P{i}_BS"],
+     "requirements": {"prescribed": [{"code": "MATH 140"}]}}
+    for i in range(5)
+]
+COURSES = [
+    {"code": "CMPSC  131", "title": "Programming and Computation I", "credits": 3,
+     "department": "CMPSC", "description": "Fundamentals — variables, loops, functions.",
+     "prerequisites": [{"code": "MATH\xa0110", "condition": "C\xa0or better"}],
+     "gen_ed": {"categories": ["GQ"]}, "offered": ["FA", "SP"]},
+    {"code": "MATH 140", "department": "MATH", "description": "Calculus I.",
+     "gen_ed": {"categories": ["GQ"]}},
+]
+
+
+def _use_data_dir(programs=PROGRAMS, courses=COURSES):
+    data = Path(tempfile.mkdtemp())
+    (data / "programs.json").write_text(json.dumps(programs))
+    (data / "courses.json").write_text(json.dumps(courses))
+    ps._DATA_DIR = data
+    ps._SNAPSHOT_PATH = data / "catalog.snapshot.pkl"
+    return data
+
+
+def _indexes():
+    return (ps._programs, dict(ps._programs_by_name), dict(ps._programs_by_plan_code),
+            dict(ps._courses_by_code), dict(ps._courses_by_dept),
+            dict(ps._courses_by_gen_ed), set(ps._popular_courses))
+
+
+def test_snapshot_loads_what_the_json_does():
+    _use_data_dir()
+    assert ps._read_snapshot(ps._source_digest()) is None, "no snapshot yet"
+    ps._load_data()
+    from_json = _indexes()
+
+    header = ps.write_catalog_snapshot()
+    assert (header["programs"], header["courses"]) == (6, 2)
+    assert ps._read_snapshot(ps._source_digest()) is not None
+    ps._load_data()
+    assert _indexes() == from_json
+
+    course = ps.get_course("cmpsc 131")
+    assert course["prerequisites"][0] == {"code": "MATH 110", "condition": "C or better"}
+    assert ps.get_gen_ed_courses("GQ")[0] is course, "indexes share one course object"
+    assert ps._popular_courses == {"MATH 140"}
+    assert ps.get_program_by_plan_code("cmpsc_bs")["college"] == "engineering"
+    math = [p["requirements"]["prescribed"][0]["code"] for p in ps._programs[1:]]
+    assert all(code is math[0] for code in math), "repeated strings are stored once"
+
+
+def test_stale_or_broken_snapshot_falls_back_to_json():
+    data = _use_data_dir()
+    ps.write_catalog_snapshot()
+    (data / "courses.json").write_text(json.dumps(COURSES[:1]))
+    assert ps._read_snapshot(ps._source_digest()) is None, "changed JSON retires the snapshot"
+    ps._load_data()
+    assert ps.get_course("MATH 140") is None
+
+    ps.write_catalog_snapshot()
+    ps.CATALOG_SNAPSHOT_VERSION += 1
+    try:
+        assert ps._read_snapshot(ps._source_digest()) is None, "a version bump retires it"
+    finally:
+        ps.CATALOG_SNAPSHOT_VERSION -= 1
+    fingerprint = ps._CODE_FINGERPRINT
+    ps._CODE_FINGERPRINT = "edited"
+    try:
+        assert ps._read_snapshot(ps._source_digest()) is None, "so does an edit to the code"
+    finally:
+        ps._CODE_FINGERPRINT = fingerprint
+    assert ps._read_snapshot(ps._source_digest()) is not None
+
+    ps._SNAPSHOT_PATH.write_bytes(b"not a pickle")
+    ps._load_data()
+    assert ps.get_course("CMPSC 131") is not None, "an unreadable snapshot is not fatal"
+
+
+def test_records_read_like_the_dicts_they_replace():
+    _use_data_dir()
+    raw = json.loads(json.dumps(COURSES[0]).replace("\\u00a0", " "))
+    for snapshot in (False, True):
+        if snapshot:
+            ps.write_catalog_snapshot()
+        ps._load_data()
+        course = ps.get_course("CMPSC 131")
+        assert isinstance(course, ps.Course) and dict(course) == raw
+        assert list(course) == list(raw), "keys keep the bulletin's order"
+        assert "cross_listed" not in course and course.get("cross_listed", []) == []
+        assert course["offered"] == ["FA", "SP"], "fields the record does not know survive"
+        assert course["description"] == "Fundamentals — variables, loops, functions."
+        assert (type(course.description) is int) is snapshot, "snapshot text stays in the file"
+        assert json.loads(json.dumps(course, default=dict)) == raw
+        prog = ps.get_program("computer science, b.s. (engineering)")
+        assert dict(prog) == PROGRAMS[0] and prog.get("degree_type") is None
+        try:
+            course["title"] = "x"
+        except TypeError:
+            pass
+        else:
+            raise AssertionError("records are read-only")
+
+    copy = pickle.loads(pickle.dumps(ps.get_program("Program 0"), protocol=5))
+    assert copy == ps.get_program("Program 0")
+
+
+if __name__ == "__main__":
+    real = (ps._DATA_DIR, ps._SNAPSHOT_PATH)
+    try:
+        test_snapshot_loads_what_the_json_does()
+        test_stale_or_broken_snapshot_falls_back_to_json()
+        test_records_read_like_the_dicts_they_replace()
+    finally:
+        ps._DATA_DIR, ps._SNAPSHOT_PATH = real
+    print("all catalog snapshot checks passed")
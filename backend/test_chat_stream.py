@@ -0,0 +1,394 @@
+"""Self-check that the async chat pipeline streams what the blocking one does.
+
+Runs against a throwaway SQLite file with the model and the embedding provider
+stubbed — free, deterministic, no network. Both pipelines answer the same
+questions; their SSE events must match one for one, and the async one must not
+make the caller wait on profile learning.
+
+    python -m backend.test_chat_stream
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+from sqlalchemy import event
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(), "test_chat_stream.db"
+)
+
+from backend.database import engine, Base, SessionLocal  # noqa: E402
+from backend.models import Message, User, UserDocument  # noqa: E402
+from backend.services import answer_cache as ac  # noqa: E402
+from backend.services import chat_service as cs  # noqa: E402
+from backend.services import embedding_cache as ec  # noqa: E402
+from backend.services import embedding_service as es  # noqa: E402
+from backend.services import llm  # noqa: E402
+from backend.services import student_doc_service as sds  # noqa: E402
+from backend.services.work_queue import get_work_queue  # noqa: E402
+
+Base.metadata.create_all(bind=engine)
+
+CS_USER = "user_stream_cs"
+MAJOR = "Computer Science, B.S. (Engineering)"
+ANSWER = ["You ", "petition ", "through the department."]
+
+
+def _seed():
+    db = SessionLocal()
+    try:
+        if not db.get(User, CS_USER):
+            db.add(User(id=CS_USER, selected_major=MAJOR))
+            db.commit()
+    finally:
+        db.close()
+
+
+def _fake_index():
+    records = []
+    for i, (name, kind) in enumerate([
+        ("CMPSC-handbook-2024-2025.pdf", "pdf_handbook"),
+        ("DTSCE-handbook-2024-2025.pdf", "pdf_handbook"),
+        ("CMPSC University Bulletin", "web_bulletin"),
+        ("DTSCE University Bulletin", "web_bulletin"),
+    ] * 3):
+        records.append({
+            "record_id": f"rec_{i}", "source_type": kind, "source_name": name,
+            "Title": f"{name} page {i}", "Content": "petition substitution entrance to major",
+            "Source_link": f"https://example.test/{i}",
+            "embedding": [float(i % 5), 1.0, float(i % 3)],
+        })
+    return es.build_retrieval_index(records)
+
+
+def _install_fakes():
+    calls = {"embed": 0, "aembed": 0, "remember": []}
+
+    def chat_stream(messages, user_id=None, **kwargs):
+        yield from ANSWER
+
+    async def achat_stream(messages, user_id=None, **kwargs):
+        for delta in ANSWER:
+            await asyncio.sleep(0)
+            yield delta
+
+    def embed(text, record=False):
+        calls["embed"] += 1
+        return [1.0, 0.5, 0.25]
+
+    async def aembed(text, record=False):
+        calls["aembed"] += 1
+        return [1.0, 0.5, 0.25]
+
+    llm.chat_stream, llm.achat_stream, llm.aembed = chat_stream, achat_stream, aembed
+    es.get_embedding = embed
+    es._retrieval_index = _fake_index()
+    cs.remember = lambda user_id, text: calls["remember"].append(text)
+    ac.get_answer_cache().clear()
+    return calls
+
+
+def _sync_events(question, **kwargs):
+    return list(cs.ask_advisor_stream(question, history=[], **kwargs))
+
+
+def _async_events(question, **kwargs):
+    async def collect():
+        return [e async for e in cs.aask_advisor_stream(question, history=[], **kwargs)]
+    events = asyncio.run(collect())
+    assert get_work_queue().flush(timeout=10)
+    return events
+
+
+def _parsed(events):
+    return [json.loads(e[len("data: "):]) for e in events]
+
+
+QUESTIONS = [
+    "how do I petition for a course substitution?",   # handbook path for a CS student
+    "where can I eat on campus tonight?",              # no handbook
+]
+
+
+def test_async_pipeline_streams_the_same_events():
+    _seed()
+    calls = _install_fakes()
+    for question in QUESTIONS:
+        for kwargs in ({"user_id": CS_USER}, {"major": MAJOR}, {}):
+            ec.get_query_cache().clear()
+            ac.get_answer_cache().clear()
+            want = _parsed(_sync_events(question, **kwargs))
+            ec.get_query_cache().clear()
+            ac.get_answer_cache().clear()
+            got = _parsed(_async_events(question, **kwargs))
+            assert got == want, f"{question!r} {kwargs}:\n{got}\n!=\n{want}"
+            assert [e.get("text") for e in got[:-1]] == ANSWER
+            assert got[-1]["done"]
+    assert calls["aembed"] == calls["embed"] > 0, "the async path awaits its embedding"
+
+
+def test_profile_learning_runs_in_the_background():
+    _seed()
+    calls = _install_fakes()
+    _async_events("I love hackathons — what should I join?", user_id=CS_USER)
+    assert calls["remember"] == ["I love hackathons — what should I join?"]
+    assert get_work_queue().stats()["pending"] == 0, "the queue drains"
+
+
+def test_done_frame_does_not_wait_for_post_answer_work():
+    _seed()
+    _install_fakes()
+    release = threading.Event()
+    cs.remember = lambda user_id, text: release.wait(10)
+
+    for run in (lambda: list(cs.ask_advisor_stream("what clubs should I join?", history=[],
+                                                   user_id=CS_USER, conversation_id="conv-s")),
+                lambda: asyncio.run(_collect_async("conv-a"))):
+        release.clear()
+        done = _parsed(run())[-1]
+        assert done["done"] and done["message_id"], "the id was reserved before the last token"
+        assert get_work_queue().stats()["pending"] > 0, "profile learning is still queued"
+        release.set()
+        assert get_work_queue().flush(timeout=10)
+        db = SessionLocal()
+        try:
+            row = db.get(Message, done["message_id"])
+            assert row.content == "".join(ANSWER) and json.loads(row.sources_json) == done["sources"]
+        finally:
+            db.close()
+
+
+async def _collect_async(conversation_id):
+    return [e async for e in cs.aask_advisor_stream(
+        "what clubs should I join?", history=[], user_id=CS_USER, conversation_id=conversation_id)]
+
+
+def test_async_model_failure_is_an_error_event():
+    _install_fakes()
+
+    async def broken(messages, user_id=None, **kwargs):
+        raise RuntimeError("provider down")
+        yield  # noqa — makes this an async generator
+
+    llm.achat_stream = broken
+    last = _parsed(_async_events("where is the library?"))[-1]
+    assert last["error"] == "provider down" and last["done"] is True
+
+    _seed()
+    _parsed(_async_events("where is the library?", user_id=CS_USER, conversation_id="conv-err"))
+    assert get_work_queue().flush(timeout=10)
+    db = SessionLocal()
+    try:
+        assert not db.query(Message).filter_by(conversation_id="conv-err").count(), \
+            "a failed answer leaves no reserved rows behind"
+    finally:
+        db.close()
+
+
+def test_disconnect_mid_answer_leaves_no_reserved_rows():
+    _seed()
+    _install_fakes()
+    inserted = threading.Event()
+    release = threading.Event()
+    reserve = cs.reserve_exchange
+
+    def slow_reserve(*args):
+        release.wait(10)
+        try:
+            return reserve(*args)
+        finally:
+            inserted.set()
+
+    async def hangs(messages, user_id=None, **kwargs):
+        yield "You "
+        await asyncio.sleep(10)
+        yield "never"
+
+    async def disconnect():
+        async def consume():
+            async for _ in cs.aask_advisor_stream("what clubs should I join?", history=[],
+                                                  user_id=CS_USER, conversation_id="conv-gone"):
+                pass
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        # The server cancels the request's scope, and cancels again at each await.
+        task.cancel()
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        release.set()
+        await asyncio.to_thread(inserted.wait, 10)
+        await asyncio.sleep(0.05)  # the done-callback runs on the loop
+
+    cs.reserve_exchange, llm.achat_stream = slow_reserve, hangs
+    try:
+        asyncio.run(disconnect())
+    finally:
+        cs.reserve_exchange = reserve
+    assert get_work_queue().flush(timeout=10)
+    db = SessionLocal()
+    try:
+        assert not db.query(Message).filter_by(conversation_id="conv-gone").count(), \
+            "an abandoned stream leaves no reserved rows behind"
+    finally:
+        db.close()
+
+
+def test_student_state_is_one_query_per_message():
+    _seed()
+    _install_fakes()
+    db = SessionLocal()
+    try:
+        if not db.query(UserDocument).filter_by(user_id=CS_USER).first():
+            db.add(UserDocument(user_id=CS_USER, filename="audit.pdf", doc_type="degree_audit",
+                                text="CMPSC 131 IN PROGRESS", audit_parse_json="{}"))
+        db.get(User, CS_USER).profile_json = '{"interests": ["hackathons"]}'
+        db.commit()
+    finally:
+        db.close()
+
+    state = sds.load_student_state(CS_USER)
+    assert state.major == MAJOR and state.profile["interests"] == ["hackathons"]
+    assert state.has_doc and state.doc == sds.get_current_student_doc(CS_USER)
+    assert state.doc_context == sds.build_student_doc_context(CS_USER)
+    assert not sds.load_student_state("nobody-at-all").has_doc
+
+    student_reads = []
+
+    def count(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and (
+                "FROM users" in statement or "FROM user_docs" in statement):
+            student_reads.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        for run in (_sync_events, _async_events):
+            student_reads.clear()
+            run("what clubs should I join?", user_id=CS_USER)
+            assert len(student_reads) == 1, (run.__name__, student_reads)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+def test_system_prompt_prefix_is_byte_identical():
+    _seed()
+    _install_fakes()
+    prompts = {}
+
+    def capture(messages, user_id=None, **kwargs):
+        prompts[key] = messages[0]["content"]
+        yield "ok"
+
+    llm.chat_stream = capture
+    other_major = "Psychology, B.S."
+    for question in QUESTIONS + ["when is the late drop deadline?", "can I take CMPSC 465?"]:
+        for who in ({"user_id": CS_USER}, {"major": MAJOR}, {"major": other_major}, {}):
+            key = (question, tuple(who.items()))
+            _sync_events(question, **who)
+
+    assert len(prompts) == 16
+    for key, prompt in prompts.items():
+        assert prompt.startswith(cs._SYSTEM_PROMPT_PREFIX), key
+    # What follows the prefix is ordered by how widely it is shared: every
+    # question from one major carries the same program block next.
+    for major in (MAJOR, other_major):
+        program_blocks = {
+            prompt.split("\n=== STUDENT DOCUMENT ===")[0]
+            for (question, who), prompt in prompts.items() if who == (("major", major),)
+        }
+        assert len(program_blocks) == 1, f"{major}: program block varies by question"
+
+
+def test_grounding_lookups_run_once_per_question():
+    _install_fakes()
+    counts = {}
+
+    def counting(name, fn):
+        def wrapped(*args, **kwargs):
+            key = (name, repr(args))
+            counts[key] = counts.get(key, 0) + 1
+            return fn(*args, **kwargs)
+        return wrapped
+
+    names = ("find_places", "find_procedures", "find_money", "find_events", "search_clubs")
+    originals = {name: getattr(cs, name) for name in names}
+    try:
+        for name, fn in originals.items():
+            setattr(cs, name, counting(name, fn))
+        for question in ("where can I eat on campus tonight?",
+                         "what clubs should I join for a software career?"):
+            counts.clear()
+            _sync_events(question, major=MAJOR)
+            assert counts and all(n == 1 for n in counts.values()), (question, counts)
+    finally:
+        for name, fn in originals.items():
+            setattr(cs, name, fn)
+
+
+def test_repeated_anonymous_question_is_answered_from_cache():
+    _seed()
+    _install_fakes()
+    model_calls = []
+
+    def counting(messages, user_id=None, **kwargs):
+        model_calls.append(messages[0]["content"])
+        yield from ANSWER
+
+    llm.chat_stream = counting
+    question = "where can I eat on campus tonight?"
+    first = _parsed(_sync_events(question, major=MAJOR))
+    again = _parsed(_sync_events("  Where can I eat on campus TONIGHT? ", major=MAJOR))
+    assert len(model_calls) == 1, "the repeat is not sent to the model"
+    assert "".join(e.get("text", "") for e in again) == "".join(ANSWER)
+    assert again[-1] == first[-1], "same sources and intent on the done event"
+    replayed = _parsed(_async_events(question, major=MAJOR))
+    assert [e.get("text") for e in replayed[:-1]] == ["".join(ANSWER)] and len(model_calls) == 1
+
+    # Another major sees another program block — another prompt, another answer.
+    _sync_events(question, major="Psychology, B.S.")
+    assert len(model_calls) == 2
+    stats = ac.get_answer_cache().stats()
+    assert (stats["hits"], stats["misses"], stats["skipped"]) == (2, 2, 0), stats
+
+
+def test_personal_questions_are_never_cached():
+    _seed()
+    _install_fakes()
+    model_calls = []
+
+    def counting(messages, user_id=None, **kwargs):
+        model_calls.append(1)
+        yield from ANSWER
+
+    llm.chat_stream = counting
+    db = SessionLocal()
+    try:
+        db.get(User, CS_USER).profile_json = '{"interests": ["robotics"]}'
+        db.commit()
+    finally:
+        db.close()
+    for _ in range(2):
+        _sync_events("what clubs should I join?", user_id=CS_USER)
+    list(cs.ask_advisor_stream("and on weekends?", major=MAJOR,
+                               history=[{"role": "user", "content": "what clubs are there?"}]))
+    assert len(model_calls) == 3
+    stats = ac.get_answer_cache().stats()
+    assert stats["skipped"] == 3 and stats["size"] == 0, stats
+
+
+if __name__ == "__main__":
+    test_async_pipeline_streams_the_same_events()
+    test_profile_learning_runs_in_the_background()
+    test_done_frame_does_not_wait_for_post_answer_work()
+    test_async_model_failure_is_an_error_event()
+    test_disconnect_mid_answer_leaves_no_reserved_rows()
+    test_student_state_is_one_query_per_message()
+    test_system_prompt_prefix_is_byte_identical()
+    test_grounding_lookups_run_once_per_question()
+    test_repeated_anonymous_question_is_answered_from_cache()
+    test_personal_questions_are_never_cached()
+    print("all chat stream checks passed")
@@ -0,0 +1,43 @@
+"""Self-check for the compiled intent classifier's triggers.
+
+test_routing covers which intent a question lands on; this covers the trigger
+classify_intent reports beside it — the text that decided the route, which is
+what the logs and the eval need to explain a misroute.
+
+    python -m backend.test_intent
+"""
+
+from backend.services.chat_service import classify_intent, detect_question_intent
+
+# (question, intent, trigger)
+TRIGGER_CASES = [
+    ("do I need an I-20 to travel?", "international", "i-20"),
+    ("when does the registration window open?", "logistics", "registration window"),
+    ("what's the last day to drop?", "deadline", "last day to"),
+    ("can you recommend a schedule for next semester?", "recommendation", "recommend"),
+    ("does this count as a GQ?", "gen_ed", "gq"),
+    ("I'm stressed about finding a job", "wellbeing", "stressed"),
+    ("do my AP scores transfer?", "transfer", "ap"),
+    ("how does ETM work?", "etm", "etm"),
+    ("do I need organic chemistry?", "courses", "need"),
+    ("how do things work here?", "general", None),
+]
+
+
+def test_trigger_is_reported():
+    for question, intent, trigger in TRIGGER_CASES:
+        got = classify_intent(question)
+        assert got == (intent, trigger), f"{question!r}: {got} != {(intent, trigger)}"
+        assert detect_question_intent(question) == intent
+
+
+def test_trigger_is_in_the_question():
+    for question, _, trigger in TRIGGER_CASES:
+        if trigger:
+            assert trigger in question.lower()
+
+
+if __name__ == "__main__":
+    test_trigger_is_reported()
+    test_trigger_is_in_the_question()
+    print("all intent checks passed")
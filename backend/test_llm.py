@@ -0,0 +1,120 @@
+"""Self-check for the async half of the provider layer.
+
+No network: the AsyncOpenAI client is replaced with a fake that answers the way
+the SDK does, so what is under test is the streaming, metering and pooling
+around it.
+
+    python -m backend.test_llm
+"""
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test-not-used")
+
+from backend.services import llm  # noqa: E402
+
+USAGE = SimpleNamespace(prompt_tokens=12, completion_tokens=3)
+
+
+def _chunk(text=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=text))] if text is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class _Stream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(0)  # yield to the loop, as a network read would
+            yield chunk
+
+
+class _FakeAsyncClient:
+    def __init__(self):
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._complete))
+        self.embeddings = SimpleNamespace(create=self._embed)
+
+    async def _complete(self, **kwargs):
+        self.requests.append(kwargs)
+        if kwargs.get("stream"):
+            return _Stream([_chunk("Hel"), _chunk(""), _chunk("lo"), _chunk(usage=USAGE)])
+        message = SimpleNamespace(content="whole answer")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=USAGE)
+
+    async def _embed(self, model, input):
+        self.requests.append({"model": model, "input": input})
+        return SimpleNamespace(data=[SimpleNamespace(embedding=[0.5, 0.5])], usage=USAGE)
+
+
+def _install_fakes():
+    fake = _FakeAsyncClient()
+    metered = []
+    llm._async_client = fake
+    llm.record_usage = lambda feature, model, usage, user_id=None, **kw: metered.append(
+        (feature, usage, user_id))
+    return fake, metered
+
+
+def test_achat_stream_yields_deltas_then_meters():
+    fake, metered = _install_fakes()
+
+    async def consume():
+        return [delta async for delta in llm.achat_stream(
+            [{"role": "user", "content": "hi"}], user_id="u1")]
+
+    assert asyncio.run(consume()) == ["Hel", "lo"], "empty deltas are dropped"
+    assert fake.requests[0]["stream"] and fake.requests[0]["stream_options"]["include_usage"]
+    assert metered == [("chat", USAGE, "u1")], "one usage row, after the last delta"
+
+
+def test_achat_and_aembed():
+    fake, metered = _install_fakes()
+    answer = asyncio.run(llm.achat([{"role": "user", "content": "hi"}], feature="judge"))
+    assert answer == "whole answer" and metered[-1][0] == "judge"
+
+    assert asyncio.run(llm.aembed("q")) == [0.5, 0.5]
+    assert len(metered) == 1, "index-build embeds are not metered"
+    asyncio.run(llm.aembed("q", record=True))
+    assert metered[-1][0] == "embedding"
+
+
+def test_streams_interleave_on_one_loop():
+    _install_fakes()
+    order = []
+
+    async def one(name):
+        async for delta in llm.achat_stream([{"role": "user", "content": name}]):
+            order.append(name)
+
+    async def both():
+        await asyncio.gather(one("a"), one("b"))
+
+    asyncio.run(both())
+    # Neither stream holds the loop while it waits — they take turns.
+    assert order[:2] == ["a", "b"], order
+
+
+def test_pooled_client_is_shared_and_closed():
+    llm._async_client = None
+    first = llm._get_async_client()
+    assert llm._get_async_client() is first, "one pool per worker"
+    pool = first._client._transport._pool
+    assert pool._max_connections == llm.LLM_MAX_CONNECTIONS
+    asyncio.run(llm.aclose())
+    assert llm._async_client is None
+
+
+if __name__ == "__main__":
+    test_achat_stream_yields_deltas_then_meters()
+    test_achat_and_aembed()
+    test_streams_interleave_on_one_loop()
+    test_pooled_client_is_shared_and_closed()
+    print("all llm checks passed")
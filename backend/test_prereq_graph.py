@@ -0,0 +1,116 @@
+"""Self-check for the compiled prerequisite graph: AND/OR groups, variants,
+depth and ancestors, reverse edges, and cycles in the bulletin data. Runs on a
+throwaway catalog.
+
+    python -m backend.test_prereq_graph
+"""
+
+import json
+import tempfile
+from pathlib import Path
+
+from backend.services import program_service as ps
+
+
+def _course(code, *prereqs, condition=""):
+    return {"code": code, "title": f"Title of {code}", "credits": 3,
+            "department": code.split()[0],
+            "prerequisites": [{"code": p, "condition": condition} for p in prereqs]}
+
+
+COURSES = [
+    _course("MATH 110"),
+    _course("MATH 140"),
+    _course("MATH 141", "MATH 140"),
+    _course("MATH 141H", "MATH 140"),
+    _course("CMPSC 121", "MATH 110", "MATH 140",
+            condition="Enforced Prerequisite at Enrollment: MATH 110 or MATH 140"),
+    _course("CMPSC 122", "CMPSC 121"),
+    _course("CMPSC 132", "CMPSC 121"),
+    _course("CMPSC 360", "CMPSC 122", "MATH 141H",
+            condition="Enforced Prerequisite at Enrollment: CMPSC 122 and MATH 141H"),
+    _course("CMPSC 465", "CMPSC 122", "CMPSC 132", "CMPSC 360",
+            condition="Enforced Prerequisite at Enrollment: ( CMPSC 122 or CMPSC 132 ) "
+                      "and CMPSC 360"),
+    _course("CMPSC 999", "GONE 101"),
+    # A cycle in the data must not hang the build or the map.
+    _course("LOOP 1", "LOOP 2"),
+    _course("LOOP 2", "LOOP 1"),
+]
+PROGRAMS = [
+    {"program_name": "Computing", "plan_codes": ["COMP_BS"],
+     "requirements": {"prescribed": [{"code": "CMPSC 465"}, {"code": "LOOP 1"}]}},
+]
+
+
+def _load(courses=COURSES):
+    data = Path(tempfile.mkdtemp())
+    (data / "programs.json").write_text(json.dumps(PROGRAMS))
+    (data / "courses.json").write_text(json.dumps(courses))
+    ps._DATA_DIR = data
+    ps._SNAPSHOT_PATH = data / "catalog.snapshot.pkl"
+    ps._load_data()
+    return ps._prereq_graph
+
+
+def test_groups_and_what_blocks_me():
+    _load()
+    assert ps._unmet_prereqs("CMPSC 121", {"MATH 140"}) == [], "an 'or' prereq must unlock"
+    assert ps._unmet_prereqs("CMPSC 121", set()) == ["MATH 110", "MATH 140"]
+    # MATH 141H collapses to MATH 141: either one satisfies it.
+    assert ps._unmet_prereqs("CMPSC 360", {"CMPSC 122"}) == ["MATH 141"]
+    assert ps._unmet_prereqs("CMPSC 360", {"CMPSC 122", "MATH 141"}) == []
+    assert ps._unmet_prereqs("CMPSC 999", set()) == ["GONE 101"], "codes missing from the catalog still block"
+    assert ps._unmet_prereqs("NOPE 1", set()) == []
+
+    g = ps.build_prereq_graph("CMPSC 465", ["CMPSC 132"], in_progress=["CMPSC 360"])
+    assert [[n["code"] for n in grp] for grp in g["groups"]] == [["CMPSC 122", "CMPSC 132"],
+                                                                 ["CMPSC 360"]]
+    assert not g["eligible"] and g["on_track"] and g["has_record"]
+    assert g["groups"][1][0]["in_progress"] and g["groups"][0][1]["done"]
+    assert ps.build_prereq_graph("CMPSC 465", ["CMPSC 132", "CMPSC 360"])["eligible"]
+    assert ps.build_prereq_graph("nope 1") is None
+
+
+def test_depth_ancestors_and_unlocks():
+    graph = _load()
+    node = graph.ids.__getitem__
+    assert graph.depth[node("CMPSC 465")] == 4, "140 → 121 → 122 → 360 → 465"
+    below = {graph.codes[i] for i in range(len(graph.codes))
+             if graph.ancestors[node("CMPSC 465")] >> i & 1}
+    assert below == {"MATH 110", "MATH 140", "MATH 141", "CMPSC 121", "CMPSC 122",
+                     "CMPSC 132", "CMPSC 360"}, below
+    for i, prereqs in enumerate(graph.prereqs):
+        assert all(j < i for j in prereqs), "ids are a topological order"
+
+    unlocks = ps.build_prereq_graph("CMPSC 121")
+    assert [u["code"] for u in unlocks["unlocks"]] == ["CMPSC 122", "CMPSC 132"]
+    assert [u["code"] for u in ps.build_prereq_graph("MATH 141H")["unlocks"]] == ["CMPSC 360"]
+
+
+def test_map_tiers_and_cycles():
+    _load()
+    tiers = {c["code"]: c["tier"] for c in ps.build_prereq_map("Computing")["courses"]}
+    assert tiers["MATH 140"] == 1 and tiers["CMPSC 121"] == 2 and tiers["CMPSC 465"] == 5
+    assert {tiers["LOOP 1"], tiers["LOOP 2"]} == {1, 2}, "a cycle is cut, not followed"
+
+
+def test_reload_recompiles():
+    _load()
+    assert [u["code"] for u in ps.build_prereq_graph("CMPSC 121")["unlocks"]] == ["CMPSC 122",
+                                                                                  "CMPSC 132"]
+    _load(COURSES + [_course("CMPSC 131", "CMPSC 121")])
+    assert [u["code"] for u in ps.build_prereq_graph("CMPSC 121")["unlocks"]] == [
+        "CMPSC 122", "CMPSC 131", "CMPSC 132"], "reverse edges follow the new catalog"
+    ps.write_catalog_snapshot()
+    ps._load_data()
+    assert ps._read_snapshot(ps._source_digest()) is not None
+    assert ps._unmet_prereqs("CMPSC 131", set()) == ["CMPSC 121"], "the graph survives the snapshot"
+
+
+if __name__ == "__main__":
+    test_groups_and_what_blocks_me()
+    test_depth_ancestors_and_unlocks()
+    test_map_tiers_and_cycles()
+    test_reload_recompiles()
+    print("all prerequisite graph checks passed")
@@ -0,0 +1,103 @@
+"""Self-check for the per-program artifact cache: built once per program, shared
+by every spelling of its name, and dropped when the catalog reloads. Runs on a
+throwaway data directory.
+
+    python -m backend.test_program_artifacts
+"""
+
+import json
+import tempfile
+from pathlib import Path
+
+from backend.services import program_service as ps
+
+CS = "Computer Science, B.S. (Engineering)"
+PROGRAMS = [
+    {"program_name": CS, "plan_codes": ["CMPSC_BS"], "total_credits": 127,
+     "gen_ed_overlap": {"GQ": 6},
+     "requirements": {"prescribed": [{"code": "CMPSC 131"}, {"code": "MATH 140"}],
+                      "additional": [{"options": [{"code": "STAT 200"}]}]},
+     "suggested_plan": {"plans": [{"semesters": {"1": [{"code": "CMPSC 131"}]}}]}},
+    {"program_name": "Psychology, B.S.", "plan_codes": ["PSYC_BS"],
+     "requirements": {"prescribed": [{"code": "PSYCH 100"}]}},
+]
+COURSES = [
+    {"code": "CMPSC 131", "title": "Programming and Computation I", "credits": 3,
+     "department": "CMPSC", "prerequisites": [{"code": "MATH 110"}]},
+    {"code": "MATH 140", "title": "Calculus I", "credits": 4, "department": "MATH",
+     "gen_ed": {"categories": ["GQ"]}},
+    {"code": "STAT 200", "title": "Elementary Statistics", "credits": 4, "department": "STAT",
+     "gen_ed": {"categories": ["GQ"]}},
+    {"code": "PSYCH 100", "title": "Introductory Psychology", "credits": 3, "department": "PSYCH",
+     "gen_ed": {"categories": ["GS"]}},
+]
+BUILDERS = (ps.build_program_context_snippet, ps.build_prereq_map, ps.build_suggested_plan,
+            ps.get_double_dips, ps.build_gen_ed_response)
+
+
+def _load(programs=PROGRAMS, courses=COURSES):
+    data = Path(tempfile.mkdtemp())
+    (data / "programs.json").write_text(json.dumps(programs))
+    (data / "courses.json").write_text(json.dumps(courses))
+    ps._DATA_DIR = data
+    ps._SNAPSHOT_PATH = data / "catalog.snapshot.pkl"
+    ps._load_data()
+
+
+def _counts(artifact):
+    entry = ps.program_artifact_stats()["artifacts"].get(artifact, {})
+    return entry.get("hits", 0), entry.get("misses", 0)
+
+
+def test_built_once_per_program():
+    _load()
+    for build in BUILDERS:
+        name = build.__name__
+        hits, misses = _counts(name)
+        first = build(CS)
+        assert build(CS) is first, f"{name}: the second call is the cached object"
+        assert build("  computer science, b.s. (ENGINEERING) ") is first, "any spelling of the name"
+        assert _counts(name) == (hits + 2, misses + 1), (name, _counts(name))
+    assert [d["code"] for d in ps.get_double_dips(CS)] == ["MATH 140", "STAT 200"]
+    assert "PROGRAM REQUIREMENTS: " + CS in ps.build_program_context_snippet(CS)
+
+    # Unknown names share one entry: ?major= is free text and must not grow the cache.
+    before = ps.program_artifact_stats()["entries"]
+    for name in ("no such major", "another one", "", None):
+        assert ps.build_prereq_map(name) is None and ps.get_double_dips(name) == []
+    assert ps.build_gen_ed_response("no such major") is ps.build_gen_ed_response(None)
+    assert ps.program_artifact_stats()["entries"] == before + 3
+
+
+def test_reload_invalidates():
+    _load()
+    old_version = ps.program_artifact_stats()["catalog_version"]
+    assert ps.build_program_context_snippet(CS)
+    assert ps.program_artifact_stats()["entries"] == 1
+
+    renamed = [dict(PROGRAMS[0], college="Engineering (renamed)")] + PROGRAMS[1:]
+    _load(programs=renamed)
+    stats = ps.program_artifact_stats()
+    assert stats["catalog_version"] != old_version and stats["entries"] == 0
+    assert "Engineering (renamed)" in ps.build_program_context_snippet(CS), "rebuilt from the new catalog"
+
+
+def test_warmup_builds_every_program():
+    _load()
+    entries = ps.warm_program_artifacts()
+    # Five artifacts, for each program and for "no program".
+    assert entries == len(BUILDERS) * (len(PROGRAMS) + 1), entries
+    misses = {name: _counts(name)[1] for name in (b.__name__ for b in BUILDERS)}
+    for build in BUILDERS:
+        build(CS)
+        build("Psychology, B.S.")
+        assert _counts(build.__name__)[1] == misses[build.__name__], "warm: every call hits"
+    stats = ps.program_artifact_stats()
+    assert all(a["hit_rate"] > 0 for a in stats["artifacts"].values()), stats
+
+
+if __name__ == "__main__":
+    test_built_once_per_program()
+    test_reload_invalidates()
+    test_warmup_builds_every_program()
+    print("all program artifact checks passed")
@@ -0,0 +1,88 @@
+"""Self-check for /programs?q= type-ahead: prefixes, initials, plan codes,
+aliases, typos — and that it stays fast. Runs on a throwaway catalog.
+
+    python -m backend.test_program_search
+"""
+
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from backend.services import program_service as ps
+
+NAMES = [
+    ("Computer Science, B.S. (Engineering)", "CMPSC_BS"),
+    ("Computer Engineering, B.S.", "CMPEN_BS"),
+    ("Data Sciences, B.S. (Engineering)", "DTSCE_BS"),
+    ("Psychology, B.S.", "PSYC_BS"),
+    ("Psychology, B.A.", "PSYC_BA"),
+    ("Political Science, B.A.", "PLSC_BA"),
+    ("Statistics, B.S.", "STAT_BS"),
+    ("Economics, B.S.", "ECON_BS"),
+    ("Physics, B.S.", "PHYS_BS"),
+    ("Information Sciences and Technology, B.S.", "IST_BS"),
+]
+
+
+def _install_catalog(extra=0):
+    programs = [{"program_name": n, "plan_codes": [c]} for n, c in NAMES]
+    programs += [{"program_name": f"Filler Program {i}, B.S.", "plan_codes": [f"FILL{i}_BS"]}
+                 for i in range(extra)]
+    data = Path(tempfile.mkdtemp())
+    (data / "programs.json").write_text(json.dumps(programs))
+    (data / "courses.json").write_text("[]")
+    ps._DATA_DIR = data
+    ps._SNAPSHOT_PATH = data / "catalog.snapshot.pkl"
+    ps._load_data()
+
+
+def _top(query, n=1):
+    return [p["program_name"] for p in ps.search_programs(query)[:n]]
+
+
+def test_prefixes_initials_codes_and_aliases():
+    _install_catalog()
+    assert _top("psych", 2) == ["Psychology, B.S.", "Psychology, B.A."], "prefix, catalog order"
+    assert _top("comp sci") == ["Computer Science, B.S. (Engineering)"], "word prefixes"
+    assert _top("cs") == ["Computer Science, B.S. (Engineering)"], "initials"
+    assert _top("DS") == ["Data Sciences, B.S. (Engineering)"]
+    assert _top("cmpen") == ["Computer Engineering, B.S."], "plan code"
+    assert _top("stats") == ["Statistics, B.S."], "alias"
+    assert _top("poli sci") == ["Political Science, B.A."]
+    assert _top("ist") == ["Information Sciences and Technology, B.S."]
+    assert _top("pyschology") == ["Psychology, B.S."], "a typo still lands"
+    assert set(_top("p", 10)) == {"Psychology, B.S.", "Psychology, B.A.",
+                                  "Political Science, B.A.", "Physics, B.S."}, "one letter"
+    assert _top("xyzzy") == []
+    assert len(ps.search_programs("")) == len(NAMES), "empty query lists the catalog"
+    assert len(ps.search_programs("s", limit=3)) == 3
+
+
+def test_substring_hits_are_kept():
+    _install_catalog()
+    got = _top("science", 10)
+    assert {"Computer Science, B.S. (Engineering)", "Political Science, B.A."} <= set(got)
+    assert "Information Sciences and Technology, B.S." in _top("sciences", 10)
+
+
+def test_type_ahead_is_sub_millisecond():
+    _install_catalog(extra=740)
+    queries = ["c", "co", "com", "comp", "compu", "comput", "compute", "computer s", "psych", "ds"]
+    started = time.perf_counter()
+    for _ in range(20):
+        for q in queries:
+            ps.search_programs(q)
+    per_query = (time.perf_counter() - started) / (20 * len(queries))
+    assert per_query < 0.001, f"{per_query * 1000:.2f} ms per keystroke"
+
+
+if __name__ == "__main__":
+    real = (ps._DATA_DIR, ps._SNAPSHOT_PATH)
+    try:
+        test_prefixes_initials_codes_and_aliases()
+        test_substring_hits_are_kept()
+        test_type_ahead_is_sub_millisecond()
+    finally:
+        ps._DATA_DIR, ps._SNAPSHOT_PATH = real
+    print("all program search checks passed")
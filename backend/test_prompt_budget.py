@@ -0,0 +1,97 @@
+"""Self-check for the system-prompt token budget.
+
+Tokenizer-agnostic: expectations are computed with count_tokens, so this holds
+whether tiktoken's encoding is available or the length estimate is in use.
+
+    python -m backend.test_prompt_budget
+"""
+
+import json
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(), "test_prompt_budget.db"
+)
+
+from backend.database import engine, Base, SessionLocal  # noqa: E402
+from backend.models import ApiUsage  # noqa: E402
+from backend.services.cost_service import record_usage, summarize  # noqa: E402
+from backend.services.prompt_budget import (  # noqa: E402
+    TRIM_MARKER, count_tokens, fit_sections, truncate_tokens,
+)
+
+Base.metadata.create_all(bind=engine)
+
+LONG = "\n".join(f"line {i}: the student must complete this requirement" for i in range(200))
+
+
+def test_truncate_respects_the_limit():
+    for limit in (20, 100, 500):
+        cut = truncate_tokens(LONG, limit)
+        assert count_tokens(cut) <= limit and cut.endswith(TRIM_MARKER)
+    assert truncate_tokens("short", 100) == "short"
+    assert truncate_tokens(LONG, 1) == "", "no room even for the marker"
+
+
+def test_caps_apply_before_the_budget():
+    texts, breakdown = fit_sections([("doc", LONG, 50, 100), ("rules", "keep", None, None)], 10_000)
+    assert count_tokens(texts["doc"]) <= 100
+    assert breakdown["doc"]["trimmed_from"] == count_tokens(LONG)
+    assert texts["rules"] == "keep" and "trimmed_from" not in breakdown["rules"]
+
+
+def test_lowest_priority_is_trimmed_first():
+    sections = [
+        ("policy", LONG, 90, None),
+        ("events", LONG, 40, None),
+        ("places", LONG, 50, None),
+        ("crisis", LONG, None, None),
+        ("empty", "", 10, None),
+    ]
+    each = count_tokens(LONG)
+    budget = 2 * each + each // 2
+    texts, breakdown = fit_sections(sections, budget)
+    assert texts["policy"] == LONG and texts["crisis"] == LONG, "higher priority untouched"
+    assert texts["events"] == "", "lowest priority goes first, entirely"
+    assert 0 < count_tokens(texts["places"]) < each, "next lowest trimmed to fit"
+    assert sum(v["tokens"] for v in breakdown.values()) <= budget
+    assert "empty" not in breakdown
+
+    texts, _ = fit_sections(sections, 0)
+    assert texts["crisis"] == LONG, "priority None is never trimmed, whatever the budget"
+
+
+def test_breakdown_is_recorded_on_the_usage_row():
+    _, breakdown = fit_sections([("doc", LONG, 50, 100)], 10_000)
+    record_usage("chat", "gpt-4o-mini", {"prompt_tokens": 10, "completion_tokens": 2},
+                 user_id="u1", prompt_breakdown={"budget": 8000, "sections": breakdown})
+    db = SessionLocal()
+    try:
+        row = db.query(ApiUsage).order_by(ApiUsage.id.desc()).first()
+        stored = json.loads(row.prompt_breakdown_json)
+        assert stored["sections"]["doc"]["tokens"] == breakdown["doc"]["tokens"]
+    finally:
+        db.close()
+
+
+def test_costs_report_the_cached_input_ratio():
+    record_usage("chat", "gpt-4o-mini", {"prompt_tokens": 2000, "completion_tokens": 10,
+                                         "prompt_tokens_details": {"cached_tokens": 1024}})
+    db = SessionLocal()
+    try:
+        totals = summarize(db)["all_time"]
+    finally:
+        db.close()
+    assert totals["cached_input_tokens"] >= 1024
+    assert totals["cached_input_ratio"] == round(
+        totals["cached_input_tokens"] / totals["input_tokens"], 4)
+
+
+if __name__ == "__main__":
+    test_truncate_respects_the_limit()
+    test_caps_apply_before_the_budget()
+    test_lowest_priority_is_trimmed_first()
+    test_breakdown_is_recorded_on_the_usage_row()
+    test_costs_report_the_cached_input_ratio()
+    print("all prompt budget checks passed")
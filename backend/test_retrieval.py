@@ -0,0 +1,554 @@
+"""Self-check for the handbook retrieval engine.
+
+No network: every query embedding is a fixed fake vector, so what is under test
+is the scoring and ranking, not the provider.
+
+    python -m backend.test_retrieval
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+
+import numpy as np
+
+from backend.services import embedding_cache as ec
+from backend.services import embedding_service as es
+from backend.services import index_service as ix
+from backend.services import llm
+
+
+def _fake_records(n=40, dims=16, seed=7):
+    rng = np.random.default_rng(seed)
+    words = ["petition", "entrance", "major", "transfer", "credit", "substitution",
+             "advisor", "graduation", "requirements", "internship"]
+    records = []
+    for i in range(n):
+        picked = rng.choice(words, size=3, replace=False)
+        records.append({
+            "record_id": f"rec_{i:03d}",
+            "source_type": "pdf_handbook" if i % 3 else "web_bulletin",
+            "source_name": "CMPSC-handbook-2024-2025.pdf" if i % 2 else "DTSCE University Bulletin",
+            "Title": f"Handbook page {i}",
+            "Category": "Handbook",
+            "Content": " ".join(picked) + (" CMPSC 465 and MATH 141" if i % 5 == 0 else ""),
+            "embedding": rng.normal(size=dims).tolist(),
+        })
+    # One record with no embedding: the old loop skipped it, so must the matrix.
+    records.append({"record_id": "no_vec", "Title": "orphan", "Content": "petition"})
+    return records
+
+
+def _legacy_ranking(question, query_vec, records, top_k):
+    """The per-record loop semantic_search used to run, kept as the oracle."""
+    scored = []
+    for record in records:
+        if record.get("embedding") is None:
+            continue
+        score = (es.cosine_similarity(query_vec, record["embedding"])
+                 + es.keyword_score(question, record)
+                 + es.course_code_score(question, record))
+        scored.append((score, record))
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [r["record_id"] for _, r in scored[:top_k]]
+
+
+def _with_index(records, query_vec):
+    """Point embedding_service at a fake index and a fake query embedding."""
+    es._retrieval_index = es.build_retrieval_index(records)
+    es.get_embedding = lambda text, record=False: query_vec
+    ec.get_query_cache().clear()
+
+
+QUESTIONS = [
+    "how do I petition for a substitution?",
+    "can I transfer credit for CMPSC 465?",
+    "what are the entrance to major requirements",
+    "MATH 141",
+    "hello",
+]
+
+
+def test_matrix_ranking_matches_legacy_loop():
+    records = _fake_records()
+    rng = np.random.default_rng(11)
+    for question in QUESTIONS:
+        query_vec = rng.normal(size=16).tolist()
+        _with_index(records, query_vec)
+        got = [r["record_id"] for r in es.semantic_search(question, top_k=8)]
+        want = _legacy_ranking(question, query_vec, records, 8)
+        assert got == want, f"{question!r}: {got} != {want}"
+
+
+def test_matrix_is_normalised_float32_and_skips_missing():
+    index = es.build_retrieval_index(_fake_records())
+    assert index["matrix"].dtype == np.float32
+    assert len(index["records"]) == index["matrix"].shape[0] == 40
+    assert np.allclose(np.linalg.norm(index["matrix"], axis=1), 1.0, atol=1e-5)
+    assert all(r["record_id"] != "no_vec" for r in index["records"])
+
+
+def test_top_k_edges():
+    records = _fake_records(n=5)
+    _with_index(records, [1.0] * 16)
+    assert len(es.semantic_search("petition", top_k=50)) == 5, "top_k past the end"
+    assert es.semantic_search("petition", top_k=0) == []
+    # Ties break by index order, as the stable sort did.
+    scores = np.array([0.5, 0.9, 0.5, 0.5, 0.1])
+    assert list(es._top_k_indices(scores, 3)) == [1, 0, 2]
+
+
+def test_lexical_index_scores_identical_to_per_record_scan():
+    records = _fake_records()
+    records += [
+        {"Title": "XCMPSC 4651 and cmpsc465", "Content": "Stat 200; MATH\t141"},
+        {"Title": "Straße", "Subcategory": "ABCDEFGH 123", "Used_for": "petitions?"},
+    ]
+    # The shipped handbook records, when present, are the realistic case.
+    if os.path.exists(ix.INDEX_META_FILE):
+        records += ix._read_columns()[0]
+    questions = QUESTIONS + [
+        "petition petition entrance", "CMPSC465 vs cmpsc 465 and STAT 200?",
+        "MATH 141 math 141", "strasse STRASSE 123", "substitutions? PETITIONS?", "",
+        "bcdefgh 123 and CMPSC 46", "tion ance ment",
+    ]
+    lexical = es.build_lexical_index(records)
+    for question in questions:
+        got = es.lexical_boosts(question, lexical)
+        want = [es.keyword_score(question, r) + es.course_code_score(question, r) for r in records]
+        assert got.tolist() == want, question  # exact, not allclose
+    assert len(lexical["words"]) > 0, "query words are memoised"
+
+
+def test_bm25_matches_textbook_formula():
+    records = [
+        {"Title": "Petition", "Content": "petition for a course substitution"},
+        {"Title": "ETM", "Content": "entrance to major requires CMPSC 131"},
+        {"Title": "Credits", "Content": "transfer credit petition petition"},
+    ]
+    bm25 = es.build_bm25_index(records)
+    got = es.bm25_scores("petition CMPSC131", bm25)
+
+    docs = [es.bm25_tokens(es._keyword_text(r)) for r in records]
+    avg = sum(map(len, docs)) / len(docs)
+    want = []
+    for doc in docs:
+        score = 0.0
+        for term in ("petition", "cmpsc131"):
+            df = sum(term in d for d in docs)
+            tf = doc.count(term)
+            if tf:
+                idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+                score += idf * tf * 2.5 / (tf + 1.5 * (0.25 + 0.75 * len(doc) / avg))
+        want.append(score)
+    assert np.allclose(got, want), (got, want)
+    assert got[1] > 0, "a spaced course code in the text matches the compact query term"
+    assert "cmpsc131" in es.bm25_tokens("CMPSC 131") and "cmpsc131" in es.bm25_tokens("cmpsc131")
+
+
+def test_hybrid_mode_fuses_dense_and_bm25():
+    dense = np.array([0.9, 0.1, 0.5, 0.2])
+    lexical = np.array([0.0, 3.0, 1.0, 0.0])
+    rrf = es.fuse_scores(dense, lexical, fusion="rrf", rrf_k=60)
+    assert np.allclose(rrf, [1 / 61, 1 / 64 + 1 / 61, 1 / 62 + 1 / 62, 1 / 63])
+    assert list(es._top_k_indices(rrf, 4)) == [2, 1, 0, 3], "second in both beats first in one"
+    weighted = es.fuse_scores(dense, lexical, fusion="weighted", dense_weight=2, lexical_weight=1)
+    assert np.allclose(weighted, [2.0, 1.0, 2 * 0.5 + 1 / 3, 2 * 0.125])
+
+    # Through semantic_search: with no dense signal, the record whose text is
+    # mostly the query term wins — the flat +0.05 boost can't tell it apart.
+    records = _fake_records(n=6)
+    records[4]["Content"] = "petition petition petition"
+    _with_index(records, [0.0] * 16)
+    assert es.semantic_search("petition", top_k=1, mode="hybrid")[0] is records[4]
+    try:
+        es.semantic_search("petition", mode="sparse")
+        raise AssertionError("unknown mode must raise")
+    except ValueError:
+        pass
+
+
+def test_scope_partition_scores_only_that_program():
+    records = _fake_records()
+    rng = np.random.default_rng(3)
+    query_vec = rng.normal(size=16).tolist()
+    _with_index(records, query_vec)
+    assert es.record_scope(records[1]) == "cmpsc" and es.record_scope(records[2]) == "dtsce"
+    assert es.record_scope({"source_name": "x", "scope": "PSYCH"}) == "psych"
+
+    for question in QUESTIONS:
+        everything = es.semantic_search(question, top_k=len(records))
+        for scope in ("cmpsc", "dtsce"):
+            got = es.semantic_search(question, top_k=6, scope=scope)
+            assert all(es.record_scope(r) == scope for r in got)
+            # Same order as ranking everything and filtering afterwards.
+            want = [r for r in everything if es.record_scope(r) == scope][:6]
+            assert [r["record_id"] for r in got] == [r["record_id"] for r in want]
+    assert len(es.semantic_search("petition", top_k=5, scope="psych")) == 5, "unknown scope: no filter"
+
+
+def test_scoped_quotas_fill_what_selection_keeps():
+    from backend.services.chat_service import record_quotas, select_top_records
+
+    records = _fake_records()
+    records.append({"record_id": "shared", "source_type": "pdf_handbook",
+                    "source_name": "Engineering advising guide", "Content": "petition",
+                    "embedding": [1.0] * 16})
+    _with_index(records, [1.0] * 16)
+    got = es.semantic_search("petition", scope="cmpsc", top_k=50)
+    assert {es.record_scope(r) for r in got} == {"cmpsc", None}, "shared records join every scope"
+
+    rng = np.random.default_rng(21)
+    for intent in ("courses", "etm", "deadline", "general"):
+        quotas = record_quotas(intent)
+        _with_index(records, rng.normal(size=16).tolist())
+        got = es.semantic_search("petition substitution", scope="dtsce", quotas=quotas)
+        ranked = es.semantic_search("petition substitution", scope="dtsce", top_k=len(records))
+        assert len(got) == sum(quotas.values()), "scoped retrieval is never starved"
+        # The same picks selection would have made from the full scoped ranking.
+        assert select_top_records(got, intent) == select_top_records(ranked, intent)
+
+
+def _clustered(n, dims, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dims))
+    return centres[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dims))
+
+
+def test_ivf_tier_recall_and_scope():
+    vectors = _clustered(3000, 32, 40, seed=5)
+    records = [{
+        "record_id": f"r{i}", "Title": f"page {i}", "Content": "",
+        "source_name": "CMPSC handbook" if i % 2 else "DTSCE handbook",
+        "embedding": v.tolist(),
+    } for i, v in enumerate(vectors)]
+    exact = es.build_retrieval_index(records)
+    ivf = es.build_retrieval_index(records, ann="ivf", ann_min_records=1000)
+    assert set(ivf["ann"]) == {"*", "cmpsc", "dtsce"}
+    assert exact["ann"] == {}
+
+    queries = _clustered(50, 32, 40, seed=9)
+    found = 0
+    for q in queries:
+        es.get_embedding = lambda text, record=False, q=q: q.tolist()
+        ec.get_query_cache().clear()
+        es._retrieval_index = exact
+        want = [r["record_id"] for r in es.semantic_search("x", top_k=10, scope="dtsce")]
+        es._retrieval_index = ivf
+        got = es.semantic_search("x", top_k=10, scope="dtsce")
+        assert all(es.record_scope(r) == "dtsce" for r in got)
+        found += len(set(want) & {r["record_id"] for r in got})
+    assert found / (10 * len(queries)) >= 0.9, f"recall@10 {found / 500:.2f}"
+
+    # A row the probed clusters miss is still scored if the question names it.
+    far = -ivf["matrix"][2]
+    assert 2 not in ivf["ann"]["dtsce"].search(far, es.ANN_N_PROBE, min_candidates=10)
+    ivf["records"][2]["Content"] = "CMPSC 999"
+    lexical = es.lexical_boosts("CMPSC 999", es.build_lexical_index(ivf["records"]))
+    rows = es._rows_to_score(ivf, "dtsce", far, "CMPSC 999", lexical, 10)
+    assert 2 in rows and 3 not in rows, "lexical hits join the candidates, within scope"
+
+    # An everyday question shares a word with nearly every row; that must not
+    # turn the probe back into a scan of the whole partition.
+    for record in ivf["records"]:
+        record["Content"] = "what courses meet the requirements"
+    question = "what courses should I take next semester"
+    lexical = es.lexical_boosts(question, es.build_lexical_index(ivf["records"]))
+    assert np.count_nonzero(lexical) == len(records)
+    probed = ivf["ann"]["dtsce"].search(far, es.ANN_N_PROBE, min_candidates=10)
+    rows = es._rows_to_score(ivf, "dtsce", far, question, lexical, 10)
+    assert len(rows) <= len(probed) + es.ANN_LEXICAL_TOP, (len(rows), len(probed))
+    assert len(rows) < len(records) / 4
+
+
+def _point_index_at(tmp):
+    ix.INDEX_FILE = os.path.join(tmp, "ace_index.pkl")
+    ix.INDEX_EMBEDDINGS_FILE = os.path.join(tmp, "ace_index.npy")
+    ix.INDEX_META_FILE = os.path.join(tmp, "ace_index.meta.json")
+
+
+def test_columnar_index_roundtrip():
+    _point_index_at(tempfile.mkdtemp())
+    records = [r for r in _fake_records(n=6) if r.get("embedding") is not None]
+    meta = ix.write_index(records)
+    assert meta["count"] == 6 and meta["dims"] == 16
+
+    loaded, matrix = ix.load_index_columns()
+    assert isinstance(matrix, np.memmap), "workers must share pages, not copy"
+    assert matrix.dtype == np.float32 and matrix.shape == (6, 16)
+    assert [r["record_id"] for r in loaded] == [r["record_id"] for r in records]
+    assert "embedding" not in loaded[0], "vectors live in the .npy only"
+    want = np.asarray(records[2]["embedding"], dtype=np.float32)
+    assert np.allclose(matrix[2], want / np.linalg.norm(want), atol=1e-6)
+
+    # The matrix goes straight into retrieval without a normalising copy.
+    index = es.build_retrieval_index(loaded, matrix)
+    assert index["matrix"] is matrix
+
+
+def test_legacy_pickle_fallback_and_conversion():
+    tmp = tempfile.mkdtemp()
+    _point_index_at(tmp)
+    records = [r for r in _fake_records(n=4) if r.get("embedding") is not None]
+    with open(ix.INDEX_FILE, "wb") as f:
+        pickle.dump(records, f)
+
+    loaded, matrix = ix.load_index_columns()
+    assert len(loaded) == 4 and matrix.shape == (4, 16), "pickle must still load"
+
+    assert ix.convert_legacy_index() == 4
+    os.remove(ix.INDEX_FILE)
+    converted, mm = ix.load_index_columns()
+    assert isinstance(mm, np.memmap)
+    assert np.allclose(mm, matrix, atol=1e-6)
+
+    # An index written by a format this code does not know is not guessed at.
+    ix.INDEX_FORMAT_VERSION += 1
+    try:
+        assert ix._read_columns() is None
+    finally:
+        ix.INDEX_FORMAT_VERSION -= 1
+
+
+class _FakeEmbeddings:
+    """Stands in for client.embeddings: vector = [len(text), position]."""
+
+    def __init__(self, fail_first=0):
+        self.calls = []
+        self.fail_first = fail_first
+
+    def create(self, model, input):
+        import httpx
+        from types import SimpleNamespace
+        from openai import APIConnectionError
+
+        self.calls.append(list(input))
+        if self.fail_first:
+            self.fail_first -= 1
+            raise APIConnectionError(request=httpx.Request("POST", "https://example.test"))
+        data = [SimpleNamespace(index=i, embedding=[float(len(t)), float(i)])
+                for i, t in enumerate(input)]
+        data.reverse()  # the API's list order is not promised; .index is
+        return SimpleNamespace(data=data, usage=None)
+
+
+@contextlib.contextmanager
+def _fake_client(fake):
+    """llm's sync client replaced by `fake`, with retry backoff not slept."""
+    from types import SimpleNamespace
+    saved = llm._client, llm.time.sleep
+    llm._client = SimpleNamespace(embeddings=fake)
+    llm.time.sleep = lambda seconds: None
+    try:
+        yield fake
+    finally:
+        llm._client, llm.time.sleep = saved
+
+
+def test_embed_batch_batches_in_order_and_retries():
+    fake = _FakeEmbeddings(fail_first=2)
+    with _fake_client(fake):
+        texts = ["x" * n for n in range(1, 12)]
+        vectors = llm.embed_batch(texts, batch_size=4, max_concurrency=3, max_retries=3)
+        assert [v[0] for v in vectors] == [float(len(t)) for t in texts], "order must survive"
+        assert len(fake.calls) == 3 + 2, "3 batches of ≤4, plus 2 retried failures"
+        assert all(len(c) <= 4 for c in fake.calls)
+
+    with _fake_client(_FakeEmbeddings(fail_first=10)):
+        try:
+            llm.embed_batch(["a"], max_retries=1)
+            raise AssertionError("should give up after max_retries")
+        except Exception as exc:  # noqa: BLE001
+            assert type(exc).__name__ == "APIConnectionError"
+
+
+def test_build_index_uses_batch_api():
+    _point_index_at(tempfile.mkdtemp())
+    fake = _FakeEmbeddings()
+    with _fake_client(fake):
+        vault = [{"record_id": f"r{i}", "Title": f"T{i}", "Content": "c" * i} for i in range(1, 6)]
+        _rebuild(vault)
+        assert len(fake.calls) == 1, "five records fit one request"
+        records, matrix = ix.load_index_columns()
+        assert [r["record_id"] for r in records] == [r["record_id"] for r in vault]
+        assert matrix.shape == (5, 2)
+        assert records[0]["content_hash"] == ix.content_hash(vault[0])
+
+
+def _rebuild(vault, **kwargs):
+    original = ix.load_psu_cmpsc_vault
+    ix.load_psu_cmpsc_vault = lambda: [dict(r) for r in vault]
+    try:
+        return ix.build_index(**kwargs)
+    finally:
+        ix.load_psu_cmpsc_vault = original
+
+
+def test_incremental_rebuild_reuses_unchanged_chunks():
+    _point_index_at(tempfile.mkdtemp())
+    fake = _FakeEmbeddings()
+    with _fake_client(fake):
+        vault = [{"record_id": f"r{i}", "Title": f"T{i}", "Content": "c" * i} for i in range(1, 6)]
+        assert _rebuild(vault)["embedded"] == 5
+        _, before = ix.load_index_columns()
+        before = np.array(before)
+
+        # Unchanged data: nothing goes to the provider.
+        fake.calls.clear()
+        report = _rebuild(vault)
+        assert fake.calls == [] and report["reused"] == 5 and report["embedded"] == 0
+
+        # One page edited, one dropped, one new: only two texts are embedded.
+        vault[1] = {**vault[1], "Content": "rewritten"}
+        vault = vault[:4] + [{"record_id": "r9", "Title": "T9", "Content": "new page"}]
+        report = _rebuild(vault)
+        assert fake.calls == [["T2 | rewritten", "T9 | new page"]], fake.calls
+        assert report == {"count": 5, "added": 2, "removed": 2, "reused": 3, "embedded": 2}
+        records, after = ix.load_index_columns()
+        assert [r["record_id"] for r in records] == ["r1", "r2", "r3", "r4", "r9"]
+        assert np.allclose(after[[0, 2, 3]], before[[0, 2, 3]], atol=1e-6)
+
+        fake.calls.clear()
+        assert _rebuild(vault, full=True)["embedded"] == 5
+
+
+def _check_cache_backend(backend):
+    calls = []
+
+    def embed(text):
+        calls.append(text)
+        return [float(len(calls)), 1.0]
+
+    cache = ec.EmbeddingCache(backend)
+    first = cache.get_or_embed("What is ETM?", "m1", embed)
+    again = cache.get_or_embed("  what   is etm? ", "m1", embed)
+    assert list(again) == list(first) and calls == ["What is ETM?"], "normalised hit"
+    cache.get_or_embed("What is ETM?", "m2", embed)
+    assert len(calls) == 2, "a different model is a different key"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    # LRU: maxsize is 2, so touching the m1 entry makes m2's the one evicted.
+    cache.get_or_embed("what is etm?", "m1", embed)
+    cache.get_or_embed("third", "m1", embed)
+    assert len(backend) == 2
+    cache.get_or_embed("What is ETM?", "m2", embed)
+    assert len(calls) == 4, "evicted entry is re-embedded"
+
+    backend.ttl = 1
+    key = ec.cache_key("third", "m1")
+    assert backend.get(key) is not None
+    real_time = ec.time.time
+    ec.time.time = lambda: real_time() + 5
+    try:
+        assert backend.get(key) is None, "expired entries are misses"
+    finally:
+        ec.time.time = real_time
+
+
+def test_query_embedding_cache():
+    _check_cache_backend(ec.MemoryBackend(maxsize=2, ttl=0))
+    path = os.path.join(tempfile.mkdtemp(), "cache.sqlite3")
+    _check_cache_backend(ec.SqliteBackend(path=path, maxsize=2, ttl=0))
+    # A second connection (another worker) sees what the first one stored.
+    shared = ec.SqliteBackend(path=path, maxsize=2, ttl=0)
+    assert shared.get(ec.cache_key("WHAT IS ETM?", "m2")) is not None
+
+
+def test_async_sqlite_cache_stays_off_the_loop():
+    threads = []
+
+    class Watched(ec.SqliteBackend):
+        def get(self, key):
+            threads.append(threading.get_ident())
+            return super().get(key)
+
+        def set(self, key, vector):
+            threads.append(threading.get_ident())
+            super().set(key, vector)
+
+    async def aembed(text):
+        return [1.0, 0.0]
+
+    async def twice():
+        loop_thread = threading.get_ident()
+        cache = ec.EmbeddingCache(Watched(path=os.path.join(tempfile.mkdtemp(), "c.sqlite3")))
+        await cache.aget_or_embed("What is ETM?", "m1", aembed)
+        await cache.aget_or_embed("what is etm?", "m1", aembed)
+        return loop_thread, cache.stats()
+
+    loop_thread, stats = asyncio.run(twice())
+    assert len(threads) == 3 and loop_thread not in threads, "miss, store and hit run on threads"
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_semantic_search_embeds_a_repeated_question_once():
+    records = _fake_records(n=10)
+    calls = []
+    _with_index(records, None)
+    es.get_embedding = lambda text, record=False: calls.append(record) or [1.0] * 16
+    es.semantic_search("how do I petition?")
+    es.semantic_search("How do I  petition?")
+    assert calls == [True], "one metered embed, then a cache hit"
+
+
+class _FakeLocalModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=32):
+        self.calls.append(list(texts))
+        return np.array([[float(len(t)), 1.0, 0.0] for t in texts], dtype=np.float32)
+
+
+def test_local_embedding_backend_builds_and_guards_the_index():
+    _point_index_at(tempfile.mkdtemp())
+    with _fake_client(_FakeEmbeddings()):
+        vault = [{"record_id": f"r{i}", "Title": f"T{i}", "Content": "c" * i} for i in range(1, 4)]
+        _rebuild(vault)  # an OpenAI-model index
+
+    local = _FakeLocalModel()
+    saved = llm.EMBEDDING_BACKEND, llm._local_model, ix.EMBEDDING_MODEL
+    llm.EMBEDDING_BACKEND, llm._local_model = "local", local
+    ix.EMBEDDING_MODEL = "local-test-model"
+    try:
+        assert llm.embed("hello") == [5.0, 1.0, 0.0]
+        assert llm.embed_batch(["a", "bb", "ccc"], batch_size=2) == [
+            [1.0, 1.0, 0.0], [2.0, 1.0, 0.0], [3.0, 1.0, 0.0]]
+
+        # The OpenAI-built index is not queried with local vectors…
+        assert ix._read_columns() is None
+        # …and a rebuild re-embeds everything with the local model.
+        report = _rebuild(vault)
+        assert report["embedded"] == 3 and report["reused"] == 0
+        records, matrix = ix.load_index_columns()
+        assert matrix.shape == (3, 3)
+        with open(ix.INDEX_META_FILE, encoding="utf-8") as f:
+            assert json.load(f)["model"] == "local-test-model"
+    finally:
+        llm.EMBEDDING_BACKEND, llm._local_model, ix.EMBEDDING_MODEL = saved
+
+
+if __name__ == "__main__":
+    test_matrix_ranking_matches_legacy_loop()
+    test_matrix_is_normalised_float32_and_skips_missing()
+    test_top_k_edges()
+    test_lexical_index_scores_identical_to_per_record_scan()
+    test_bm25_matches_textbook_formula()
+    test_hybrid_mode_fuses_dense_and_bm25()
+    test_scope_partition_scores_only_that_program()
+    test_scoped_quotas_fill_what_selection_keeps()
+    test_ivf_tier_recall_and_scope()
+    test_columnar_index_roundtrip()
+    test_legacy_pickle_fallback_and_conversion()
+    test_embed_batch_batches_in_order_and_retries()
+    test_build_index_uses_batch_api()
+    test_incremental_rebuild_reuses_unchanged_chunks()
+    test_query_embedding_cache()
+    test_async_sqlite_cache_stays_off_the_loop()
+    test_semantic_search_embeds_a_repeated_question_once()
+    test_local_embedding_backend_builds_and_guards_the_index()
+    print("all retrieval checks passed")
@@ -0,0 +1,125 @@
+"""Self-check for the stored derived audit on uploaded documents.
+
+Runs against a throwaway SQLite file. A read used to re-scan the whole audit
+text for satisfied requirements on every dashboard load and chat message; now
+the corrected audit is stored with the parser version that produced it, and
+only a stale or missing one is derived again.
+
+    python -m backend.test_student_doc
+"""
+
+import json
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(), "test_student_doc.db"
+)
+
+from backend.database import engine, Base, SessionLocal  # noqa: E402
+from backend.models import User, UserDocument  # noqa: E402
+from backend.services import student_doc_service as sds  # noqa: E402
+from backend.services.audit_parser_service import AUDIT_PARSER_VERSION  # noqa: E402
+from backend.test_audit import AUDIT  # noqa: E402
+
+Base.metadata.create_all(bind=engine)
+
+
+def _seed_legacy(user_id, version=None):
+    """A row as stored before the transfer-credit fix: rows-only audit, no derived copy."""
+    db = SessionLocal()
+    try:
+        db.add(User(id=user_id))
+        db.add(UserDocument(
+            user_id=user_id, filename="whatif.pdf", doc_type="what_if_report", text=AUDIT,
+            audit_parse_json=json.dumps({"completed_courses": [], "earned_credits": 0}),
+            derived_audit_json=json.dumps({"stale": True}) if version is not None else None,
+            derived_audit_version=version,
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _count_derivations():
+    calls = []
+    original = sds.parse_whatif_blocks
+
+    def counting(text):
+        calls.append(text)
+        return original(text)
+
+    sds.parse_whatif_blocks = counting
+    return calls, original
+
+
+def _completed(user_id):
+    audit = sds.get_current_student_doc(user_id)["audit_parse"]
+    return {c["code"] for c in audit["completed_courses"]}
+
+
+def test_legacy_rows_are_corrected_then_stored():
+    _seed_legacy("legacy_1")
+    _seed_legacy("legacy_2", version=AUDIT_PARSER_VERSION - 1)
+    calls, original = _count_derivations()
+    try:
+        assert "CMPSC 122" in _completed("legacy_1"), "derived on read before the backfill"
+        assert len(calls) == 1
+
+        assert sds.backfill_derived_audits(batch_size=1) >= 2
+        assert sds.backfill_derived_audits() == 0, "nothing left to upgrade"
+
+        calls.clear()
+        for user_id in ("legacy_1", "legacy_2"):
+            assert "CMPSC 122" in _completed(user_id)
+        assert calls == [], "a current derived audit is read, not re-derived"
+    finally:
+        sds.parse_whatif_blocks = original
+
+
+def test_parser_changes_reach_stored_rows():
+    _seed_legacy("legacy_4", version=AUDIT_PARSER_VERSION - 1)
+    original = sds.parse_whatif_blocks
+    sds.parse_whatif_blocks = lambda text: dict(original(text), reparsed=True)
+    try:
+        sds.backfill_derived_audits()
+    finally:
+        sds.parse_whatif_blocks = original
+    assert sds.get_current_student_doc("legacy_4")["audit_parse"].get("reparsed"), \
+        "derived from the text, not only merged into the stored parse"
+
+
+def test_a_corrupt_row_does_not_stop_the_backfill():
+    db = SessionLocal()
+    try:
+        db.add(User(id="corrupt_1"))
+        db.add(UserDocument(user_id="corrupt_1", filename="bad.pdf", doc_type="what_if_report",
+                            text="", audit_parse_json="{not json"))
+        db.commit()
+    finally:
+        db.close()
+    _seed_legacy("legacy_5")
+    assert sds.backfill_derived_audits(batch_size=1) >= 2
+    assert sds.backfill_derived_audits() == 0, "the corrupt row is stamped, not retried forever"
+    assert "CMPSC 122" in _completed("legacy_5")
+    assert sds.get_current_student_doc("corrupt_1")["audit_parse"] is None
+
+
+def test_student_state_reads_the_stored_audit():
+    _seed_legacy("legacy_3")
+    sds.backfill_derived_audits()
+    calls, original = _count_derivations()
+    try:
+        state = sds.load_student_state("legacy_3")
+        assert "CMPSC 122" in {c["code"] for c in state.doc["audit_parse"]["completed_courses"]}
+        assert calls == []
+    finally:
+        sds.parse_whatif_blocks = original
+
+
+if __name__ == "__main__":
+    test_legacy_rows_are_corrected_then_stored()
+    test_parser_changes_reach_stored_rows()
+    test_a_corrupt_row_does_not_stop_the_backfill()
+    test_student_state_reads_the_stored_audit()
+    print("all student document checks passed")
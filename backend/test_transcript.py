@@ -64,6 +64,36 @@ def test_skips_when_inputs_missing():
     assert ts.save_exchange(USER, "c", "q", "", "i", []) is None, "empty answer → skip"
 
 
+def test_reserved_exchange_is_filled_in_or_removed():
+    mid = ts.reserve_exchange(USER, "conv-r", "how do I declare a minor?", "general")
+    assert mid is not None, "the id exists before the answer does"
+    db = SessionLocal()
+    try:
+        assert db.get(Message, mid).content == ""
+        assert ts.review_summary(db, days=7)["answers"] == 2, "a reserved row is not an answer yet"
+    finally:
+        db.close()
+    ts.finish_exchange(mid, "Through your advisor.", [{"title": "Minors"}])
+
+    failed = ts.reserve_exchange(USER, "conv-r", "and a second one?", "general")
+    ts.finish_exchange(failed, "", None)
+    db = SessionLocal()
+    try:
+        rows = db.query(Message).filter(Message.conversation_id == "conv-r").order_by(Message.id).all()
+        assert [(r.role, r.content) for r in rows] == [
+            ("user", "how do I declare a minor?"), ("assistant", "Through your advisor."),
+        ], "the failed exchange leaves nothing behind"
+        assert json.loads(rows[1].sources_json) == [{"title": "Minors"}]
+        # Counted from here on, so later assertions see it: remove it again.
+        for r in rows:
+            db.delete(r)
+        db.delete(db.get(Conversation, "conv-r"))
+        db.commit()
+    finally:
+        db.close()
+    assert ts.reserve_exchange(None, "c", "q", "i") is None, "no user → skip"
+
+
 def test_rating_roundtrip_and_ownership():
     mid = ts.save_exchange(USER, "conv-2", "prereqs for CMPSC 221?", "CMPSC 132.", "courses", [{"a": 1}])
     db = SessionLocal()
@@ -131,10 +161,13 @@ def test_harvest_picks_up_bad_answers_only():
     try:
         db.add(User(id=USER, selected_major="Psychology, B.A. (Liberal Arts)"))
         db.commit()
+        # Still streaming (or abandoned): no answer yet, so not an ungrounded one.
+        ts.reserve_exchange(USER, "conv-1", "is the gym open late?", "general")
 
         rows = ft.harvest(db, days=7, limit=25)
         questions = [r["question"] for r in rows]
         assert "where do I print?" in questions, "down-rated answer must be harvested"
+        assert "is the gym open late?" not in questions, "a reserved row is not an answer"
         assert "prereqs for CMPSC 221?" not in questions, (
             "a grounded, up-rated answer is not a regression candidate"
         )
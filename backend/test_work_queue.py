@@ -0,0 +1,66 @@
+"""Self-check for the post-answer work queue: order, failures, a full queue,
+and the shutdown flush. No database, no network.
+
+    python -m backend.test_work_queue
+"""
+
+import threading
+import time
+
+from backend.services.work_queue import WorkQueue
+
+
+def test_tasks_run_off_the_caller_and_return_results():
+    work = WorkQueue(workers=1, maxsize=10)
+    seen = []
+    futures = [work.submit(lambda i: seen.append((i, threading.current_thread().name)) or i, i)
+               for i in range(5)]
+    assert [f.result(timeout=5) for f in futures] == [0, 1, 2, 3, 4]
+    assert [i for i, _ in seen] == [0, 1, 2, 3, 4], "one worker runs them in order"
+    assert all(name != threading.current_thread().name for _, name in seen)
+    assert work.flush(timeout=5) and work.stats()["completed"] == 5
+
+
+def test_a_failure_is_counted_and_the_worker_survives():
+    work = WorkQueue(workers=1, maxsize=10)
+
+    def broken():
+        raise RuntimeError("db down")
+
+    assert isinstance(work.submit(broken).exception(timeout=5), RuntimeError)
+    assert work.submit(lambda: "still here").result(timeout=5) == "still here"
+    assert work.stats()["failed"] == 1
+
+
+def test_a_full_queue_runs_inline_instead_of_dropping():
+    work = WorkQueue(workers=1, maxsize=1)
+    gate = threading.Event()
+    work.submit(gate.wait, 5)                # occupies the worker
+    deadline = time.monotonic() + 5
+    while work._queue.qsize() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    work.submit(time.sleep, 0)               # fills the queue
+    ran = work.submit(lambda: threading.current_thread().name)
+    assert ran.result(timeout=0) == threading.current_thread().name
+    assert work.stats()["ran_inline"] == 1
+    gate.set()
+    assert work.flush(timeout=5)
+
+
+def test_shutdown_flushes_what_is_queued():
+    work = WorkQueue(workers=2, maxsize=100)
+    done = []
+    for i in range(20):
+        work.submit(lambda i: (time.sleep(0.005), done.append(i)), i)
+    assert work.shutdown(timeout=10)
+    assert sorted(done) == list(range(20)), "nothing queued before shutdown is lost"
+    work.submit(done.append, "late")
+    assert done[-1] == "late", "after shutdown, work runs inline"
+
+
+if __name__ == "__main__":
+    test_tasks_run_off_the_caller_and_return_results()
+    test_a_failure_is_counted_and_the_worker_survives()
+    test_a_full_queue_runs_inline_instead_of_dropping()
+    test_shutdown_flushes_what_is_queued()
+    print("all work queue checks passed")